@@ -0,0 +1,44 @@
+// Cuts the cards out of a game's atlas, see server/atlas.py
+
+function loadImage(src: string): Promise<HTMLImageElement> {
+  return new Promise((resolve, reject) => {
+    const image = new Image()
+    image.crossOrigin = 'anonymous'
+    image.onload = () => resolve(image)
+    image.onerror = reject
+    image.src = src
+  })
+}
+
+function toBlob(canvas: HTMLCanvasElement): Promise<Blob> {
+  return new Promise((resolve, reject) => {
+    canvas.toBlob(blob => blob ? resolve(blob) : reject(new Error('Failed to cut atlas')))
+  })
+}
+
+// Object URLs of each cell of the atlas, in order. The caller revokes them
+// once unused.
+export async function sliceAtlas(sources: string[], cells: number[][]): Promise<string[]> {
+  let image = null
+  for (const src of sources) {
+    try {
+      image = await loadImage(src)
+      break
+    } catch (e) {
+      // Try the next format
+    }
+  }
+  if (image == null)
+    throw new Error('Failed to load atlas')
+
+  const canvas = document.createElement('canvas')
+  const context = canvas.getContext('2d')
+  const urls = []
+  for (const [x, y, w, h] of cells) {
+    canvas.width = w
+    canvas.height = h
+    context.drawImage(image, x, y, w, h, 0, 0, w, h)
+    urls.push(URL.createObjectURL(await toBlob(canvas)))
+  }
+  return urls
+}
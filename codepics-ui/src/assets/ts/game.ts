@@ -2,7 +2,9 @@ import { io } from 'socket.io-client'
 import type { Ref } from 'vue'
 
 export interface PlayerInfo {
+  id: number
   name: string
+  // Filled in locally from the player id sent with the full view
   is_self: boolean
 }
 
@@ -17,10 +19,48 @@ export interface Teams {
   red: TeamInfo
 }
 
+// File names of a resized copy of a card image, per format
+export interface RenditionFiles {
+  webp: string
+  jpg: string
+}
+
+// What a card image looks like before it loads
+export interface ImageInfo {
+  width: number
+  height: number
+  color: string
+  // BlurHash, see placeholder.ts
+  placeholder: string
+}
+
 export interface CardInfo {
   team: string
   asset: string
   hidden: boolean
+  // Missing until the server has rendered the image
+  renditions?: { tile: RenditionFiles, preview: RenditionFiles }
+  // Missing without Pillow on the server
+  image?: ImageInfo
+}
+
+// One image holding every card of the game, cells are [x, y, width, height]
+// in card order
+export interface AtlasInfo {
+  ready: boolean
+  files?: RenditionFiles
+  width?: number
+  height?: number
+  cells?: number[][]
+}
+
+export interface HistoryEntry {
+  seq: number
+  player_name: string
+  player_team: string
+  description: string
+  action: string
+  action_team: string
 }
 
 export interface GameState {
@@ -30,11 +70,64 @@ export interface GameState {
   cards: [CardInfo]
   collection: string
   votes: object
+  // Null when there is no atlas, cards then load their own images
+  atlas: AtlasInfo | null
+  // Sequence number of the first entry of the current game
+  history_start: number
+  // Filled in locally from the history stream
+  history: HistoryEntry[]
+  history_complete: boolean
 }
 
-interface GameUpdate {
+interface GameView {
   game: GameState
-  spymaster_vision: [CardInfo]
+  spymaster_vision: { cards: [CardInfo] } | null
+}
+
+// [path] deletes, [path, value] sets
+type PatchOp = [Array<string | number>] | [Array<string | number>, any]
+
+interface GameUpdate {
+  game_id: number
+  version: number
+  // Full view
+  self?: number
+  game?: GameState
+  spymaster_vision?: { cards: [CardInfo] } | null
+  // Patch against the view at version `base`
+  base?: number
+  ops?: [PatchOp]
+  // Latest page with a full view, new entries with a patch
+  history?: HistoryEntry[]
+}
+
+interface HistoryPage {
+  game_id: number
+  history_start: number
+  history: HistoryEntry[]
+}
+
+export function applyPatch(doc: any, ops: [PatchOp]): any {
+  for (const op of ops) {
+    const path = op[0]
+    if (path.length == 0) {
+      doc = op[1]
+      continue
+    }
+
+    let parent = doc
+    for (const key of path.slice(0, -1))
+      parent = parent[key]
+
+    const key = path[path.length - 1]
+    if (op.length == 1) {
+      if (Array.isArray(parent)) parent.splice(key as number, 1)
+      else delete parent[key]
+    } else {
+      parent[key] = op[1]
+    }
+  }
+  return doc
 }
 
 export class GameEvents {
@@ -42,6 +135,16 @@ export class GameEvents {
   game: Ref<GameState>
   is_host: Ref<boolean>
   debug_mode: boolean
+  view: GameView | null = null
+  version: number = -1
+  selfId: number = -1
+  history: HistoryEntry[] = []
+
+  // Game and name last joined with, to rejoin after a redirect
+  gameId: number | null = null
+  name: string | null = null
+  // Resumes the seat after reconnecting, see Cafe.on_resume
+  token: string | null = null
 
   constructor(url: string, game: Ref<GameState>, is_host: Ref<boolean>) {
     this.socket = io(url)
@@ -108,9 +211,68 @@ export class GameEvents {
     this.socket.on('new_turn',  (data) => this.newTurn(data))
     this.socket.on('update_vote',  (data) => this.updateVote(data))
     this.socket.on('update_card',  (data) => this.updateCard(data))
+    this.socket.on('update_atlas',  (data) => this.updateAtlas(data))
+    this.socket.on('history_page',  (data) => this.addHistoryPage(data))
+    this.socket.on('redirect',  (data) => this.redirect(data))
+    this.socket.on('game_closed',  (data) => this.closed(data))
+    this.socket.on('session',  (data) => this.setSession(data))
+    this.socket.on('session_expired',  (data) => this.sessionExpired(data))
+    this.socket.on('connect', () => this.resume())
+  }
+
+  setSession(data) {
+    if (data.game_id == this.gameId) this.token = data.token
+  }
+
+  // Reconnected, take the seat back and catch up from the version we had
+  resume() {
+    if (this.token == null || this.gameId == null) return
+    this.socket.emit('resume', {
+      'game_id': this.gameId,
+      'token': this.token,
+      'version': this.version
+    })
+  }
+
+  // Away too long, join again as a new player
+  sessionExpired(data) {
+    if (data.game_id != this.gameId) return
+
+    this.token = null
+    this.view = null
+    this.version = -1
+    this.history = []
+    this.join(this.gameId, this.name)
+  }
+
+  // The server evicted the game, nothing more will come for it
+  closed(data) {
+    if (data.game_id != this.gameId) return
+
+    this.token = null
+    this.view = null
+    this.version = -1
+    this.history = []
+  }
+
+  // The game moved to another server, follow it there
+  redirect(data) {
+    if (data.game_id != this.gameId) return
+
+    this.socket.disconnect()
+    this.socket = io(data.url)
+    this.token = null
+    this.view = null
+    this.version = -1
+    this.history = []
+    this.registerDebugEvents()
+    this.registerEvents()
+    this.join(this.gameId, this.name)
   }
 
   join(gameId: number, name: string) {
+    this.gameId = gameId
+    this.name = name
     this.socket.emit('join', {
       'game_id': gameId,
       'name': name
@@ -119,6 +281,18 @@ export class GameEvents {
 
   leave(gameId: number) {
     this.socket.emit('leave', {'game_id': gameId})
+    this.token = null
+    this.view = null
+    this.version = -1
+    this.history = []
+  }
+
+  fetchHistory(gameId: number) {
+    if (this.history.length == 0) return
+    this.socket.emit('fetch_history', {
+      'game_id': gameId,
+      'before': this.history[0].seq
+    })
   }
 
   joinTeam(gameId: number, team: string, as_spymaster: boolean) {
@@ -169,10 +343,62 @@ export class GameEvents {
     })
   }
 
+  sync(gameId: number) {
+    this.socket.emit('sync', {'game_id': gameId})
+  }
+
   updateGame(data: GameUpdate) {
-    this.game.value = data.game
-    if (data['spymaster_vision'])
-      this.game.value['cards'] = data['spymaster_vision']['cards']
+    if (data.ops) {
+      // Still waiting on the first full view
+      if (this.view == null) return
+      if (data.base != this.version) {
+        this.sync(data.game_id)
+        return
+      }
+      this.view = applyPatch(this.view, data.ops)
+      const start = this.view.game.history_start
+      this.history = this.history.filter(entry => entry.seq >= start)
+      const last = this.history.length > 0 ? this.history[this.history.length - 1].seq : -1
+      for (const entry of data.history ?? []) {
+        if (entry.seq > last) this.history.push(entry)
+      }
+    } else {
+      this.selfId = data.self
+      this.view = {
+        game: data.game,
+        spymaster_vision: data.spymaster_vision
+      }
+      this.history = data.history
+    }
+    this.version = data.version
+    this.render()
+  }
+
+  addHistoryPage(data: HistoryPage) {
+    if (this.view == null) return
+    const first = this.history.length > 0 ? this.history[0].seq : Infinity
+    const older = data.history.filter(entry => entry.seq >= data.history_start && entry.seq < first)
+    this.history = older.concat(this.history)
+    this.render()
+  }
+
+  render() {
+    const game = structuredClone(this.view.game)
+    game.history = this.history.slice()
+    game.history_complete = this.history.length == 0 || this.history[0].seq <= game.history_start
+    if (this.view.spymaster_vision) {
+      // The vision only adds the teams of hidden cards
+      this.view.spymaster_vision.cards.forEach((card, i) => {
+        if (i < game.cards.length) game.cards[i].team = card.team
+      })
+    }
+    for (const team of [game.teams.blue, game.teams.red]) {
+      for (const player of team.agents)
+        player.is_self = player.id == this.selfId
+      if (team.spymaster)
+        team.spymaster.is_self = team.spymaster.id == this.selfId
+    }
+    this.game.value = game
   }
 
   updateTeams(data: GameUpdate)  {
@@ -194,4 +420,8 @@ export class GameEvents {
   updateCard(data) {
     this.updateGame(data)
   }
+
+  updateAtlas(data) {
+    this.updateGame(data)
+  }
 }
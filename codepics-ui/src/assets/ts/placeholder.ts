@@ -0,0 +1,93 @@
+// Draws the BlurHash placeholders computed by server/placeholder.py, see
+// https://blurha.sh for the format
+
+const BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+// Placeholders are tiny, the browser scales them up with smoothing
+const SIZE = 32
+
+const cache = new Map<string, string>()
+
+function decode83(str: string): number {
+  let value = 0
+  for (const c of str)
+    value = value * 83 + BASE83.indexOf(c)
+  return value
+}
+
+function sRGBToLinear(value: number): number {
+  const v = value / 255
+  return v <= 0.04045 ? v / 12.92 : Math.pow((v + 0.055) / 1.055, 2.4)
+}
+
+function linearToSRGB(value: number): number {
+  const v = Math.max(0, Math.min(1, value))
+  if (v <= 0.0031308)
+    return Math.round(v * 12.92 * 255)
+  return Math.round((1.055 * Math.pow(v, 1 / 2.4) - 0.055) * 255)
+}
+
+function signPow(value: number, exp: number): number {
+  return Math.sign(value) * Math.pow(Math.abs(value), exp)
+}
+
+export function decode(hash: string, width: number, height: number): Uint8ClampedArray {
+  const sizeFlag = decode83(hash[0])
+  const xComponents = (sizeFlag % 9) + 1
+  const yComponents = Math.floor(sizeFlag / 9) + 1
+  const maximum = (decode83(hash[1]) + 1) / 166
+
+  const colors = []
+  const dc = decode83(hash.substring(2, 6))
+  colors.push([sRGBToLinear(dc >> 16), sRGBToLinear((dc >> 8) & 255), sRGBToLinear(dc & 255)])
+  for (let i = 1; i < xComponents * yComponents; i++) {
+    const value = decode83(hash.substring(4 + i * 2, 6 + i * 2))
+    colors.push([
+      signPow((Math.floor(value / (19 * 19)) - 9) / 9, 2) * maximum,
+      signPow((Math.floor(value / 19) % 19 - 9) / 9, 2) * maximum,
+      signPow((value % 19 - 9) / 9, 2) * maximum
+    ])
+  }
+
+  const pixels = new Uint8ClampedArray(width * height * 4)
+  for (let y = 0; y < height; y++) {
+    for (let x = 0; x < width; x++) {
+      let r = 0, g = 0, b = 0
+      for (let j = 0; j < yComponents; j++) {
+        for (let i = 0; i < xComponents; i++) {
+          const basis = Math.cos(Math.PI * x * i / width) * Math.cos(Math.PI * y * j / height)
+          const color = colors[i + j * xComponents]
+          r += color[0] * basis
+          g += color[1] * basis
+          b += color[2] * basis
+        }
+      }
+      const p = 4 * (x + y * width)
+      pixels[p] = linearToSRGB(r)
+      pixels[p + 1] = linearToSRGB(g)
+      pixels[p + 2] = linearToSRGB(b)
+      pixels[p + 3] = 255
+    }
+  }
+  return pixels
+}
+
+// A data URL of the placeholder, for use as a CSS background
+export function placeholderUrl(hash: string, width: number, height: number): string {
+  let url = cache.get(hash)
+  if (url !== undefined)
+    return url
+
+  // Keep the aspect ratio, the longest side SIZE pixels
+  const scale = SIZE / Math.max(width, height)
+  const w = Math.max(1, Math.round(width * scale))
+  const h = Math.max(1, Math.round(height * scale))
+  const canvas = document.createElement('canvas')
+  canvas.width = w
+  canvas.height = h
+  const context = canvas.getContext('2d')
+  context.putImageData(new ImageData(decode(hash, w, h), w, h), 0, 0)
+  url = canvas.toDataURL()
+  cache.set(hash, url)
+  return url
+}
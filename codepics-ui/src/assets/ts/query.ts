@@ -4,9 +4,14 @@ let url = import.meta.env.VITE_BACKEND_URL
 
 export function getUrl() { return url }
 
-export function getGames() {
+// Card images come from a separate asset server when one is configured,
+// see server/assets.py
+export function getAssetUrl() { return import.meta.env.VITE_ASSET_URL || url + 'static/' }
+
+// A page of games, those with ids above after if given, see server/lobby.py
+export function getGames(after?: number) {
   const path = url + 'games'
-  return axios.get(path)
+  return axios.get(path, { params: after === undefined ? {} : { after: after } })
 }
 
 export function getCardCollections() {
@@ -11,6 +11,8 @@ echo "source venv/bin/activate"
 echo "cd server"
 echo "pip install -r requirements.txt"
 echo "flask run --host=0.0.0.0 --port=$BACKEND_PORT"
+echo "# or, under asyncio:"
+echo "CODEPICS_HOST=0.0.0.0 CODEPICS_PORT=$BACKEND_PORT python asgi.py"
 echo
 echo "cd codepics-ui && npm run build-only "
 echo "npm run preview -- --host=0.0.0.0 --port=$FRONTEND_PORT"
@@ -1,10 +1,15 @@
-import os
-
-from flask import Flask, jsonify, request
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 from flask_socketio import SocketIO
 
+import config
+from assets import AssetServer, etag_matches
+from backplane import make_client_manager
 from cafe import Cafe
+from lobby import content_etag, encode, merge_pages, parse_query
+from migrate import MigrationListener
+from transport import ServerTransport
 
 app = Flask('codepics')
 app.config.from_object(__name__)
@@ -13,10 +18,23 @@ app.config['CORS_HEADERS'] = 'Content-Type'
 # Enable CORS
 CORS(app)
 
+socketio_options = {}
+client_manager = make_client_manager(config.message_queue)
+if client_manager is not None:
+    socketio_options['client_manager'] = client_manager
+
 # WebSockets for communication in games
-socketio = SocketIO(app, cors_allowed_origins='*', logger=True)
+socketio = SocketIO(app, cors_allowed_origins='*', logger=True, **socketio_options)
+
+cafe = Cafe(app.debug, ServerTransport(socketio.server), config.journal_dir,
+            config.worker, config.workers, config.worker_urls, config.history_dir, config.history_window,
+            config.reservation_ttl, config.idle_ttl, config.grace, config.send_tick)
+
+if config.migration_socket:
+    MigrationListener(config.migration_socket, cafe.import_game).start()
 
-cafe = Cafe(app.debug)
+if config.asset_port:
+    AssetServer(cafe.index).start(config.host, config.asset_port)
 
 ###########
 # Routing #
@@ -29,7 +47,27 @@ def ping_pong():
 
 @app.route('/games', methods=['GET'])
 def games():
-    return jsonify(cafe.list_games())
+    """A page of games, optionally in one state, with ids above after"""
+    try:
+        state, after, limit = parse_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if request.args.get('local') or len(config.worker_urls) < 2:
+        etag, body = cafe.lobby.listing(state, after, limit)
+    else:
+        # Gather games hosted by the other workers
+        query = {k: v for k, v in [('state', state), ('after', after), ('limit', limit)] if v is not None}
+        pages = [cafe.lobby.page(state, after, limit)]
+        peers = config.peer_urls()
+        with ThreadPoolExecutor(len(peers)) as pool:
+            pages.extend(pool.map(lambda url: config.fetch_games(url, query), peers))
+        body = encode(merge_pages(pages, limit))
+        etag = content_etag(body)
+
+    if etag_matches(request.headers.get('If-None-Match', ''), etag):
+        return Response(status=304, headers={'ETag': etag})
+    return Response(body, mimetype='application/json', headers={'ETag': etag})
 
 
 @app.route('/card_collections', methods=['GET'])
@@ -39,8 +77,31 @@ def card_collections():
 
 @app.route('/create_game', methods=['POST'])
 def create_game():
-    game_id = cafe.reserve_lobby()
-    return jsonify({'game_id': game_id})
+    """Reserve a game id, on each worker in turn unless local is given"""
+    if request.args.get('local'):
+        return jsonify({'game_id': cafe.reserve_lobby(), 'url': None})
+    game_id, url = cafe.create_lobby(config.reserve_game)
+    return jsonify({'game_id': game_id, 'url': url})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify(cafe.metrics())
+
+
+@app.route('/migrate', methods=['POST'])
+def migrate():
+    """Move games to another process, all of them unless game_id is given"""
+    if request.remote_addr not in config.LOCALHOST:
+        return jsonify({'error': 'Forbidden'}), 403
+
+    data = request.get_json()
+    if 'game_id' in data:
+        game_ids = [data['game_id']]
+    else:
+        game_ids = list(cafe.games)
+    moved = [i for i in game_ids if cafe.migrate_game(i, data['target'], data['url'])]
+    return jsonify({'moved': moved})
 
 
 ###################
@@ -59,7 +120,22 @@ def on_join(data):
 
 @socketio.on('leave')
 def on_leave(data):
-    cafe.on_user_disconnect(request.sid)
+    cafe.on_user_leave(request.sid)
+
+
+@socketio.on('resume')
+def on_resume(data):
+    cafe.on_resume(request.sid, data)
+
+
+@socketio.on('sync')
+def on_sync(data):
+    cafe.on_sync(request.sid, data)
+
+
+@socketio.on('fetch_history')
+def on_fetch_history(data):
+    cafe.on_fetch_history(request.sid, data)
 
 
 @socketio.on('switch_team')
@@ -144,7 +220,7 @@ def on_debug_end_guessing(data):
 
 
 def main():
-    socketio.run()
+    socketio.run(app, host=config.host, port=config.port, allow_unsafe_werkzeug=True)
 
 
 if __name__ == '__main__':
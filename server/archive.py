@@ -0,0 +1,134 @@
+from pathlib import Path
+
+import json
+import os
+import threading
+
+# Bytes read at a time when reading an archive backwards
+BLOCK = 64 * 1024
+
+
+class GameArchive:
+    """Archived history of one game, see HistoryArchive
+
+    Rows are [seq, player_name, player_team, description, action, action_team].
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        # Sequence number after the last archived row, read from the file
+        # when first needed
+        self.end: int = None
+
+    def spill(self, rows: list[list]):
+        """Append rows, skipping those already archived
+
+        Replaying a journal spills the same entries again.
+        """
+        with self.lock:
+            if self.end is None:
+                last = self.last_row()
+                self.end = -1 if last is None else last[0] + 1
+            rows = [row for row in rows if row[0] >= self.end]
+            if len(rows) == 0:
+                return
+            with open(self.path, 'a') as f:
+                f.write(''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows))
+            self.end = rows[-1][0] + 1
+
+    def read(self, start: int, end: int) -> list[list]:
+        """Rows with sequence numbers from start to end, exclusive
+
+        Reads backwards from the end of the file, as clients page back from
+        the newest entries.
+        """
+        rows = []
+        with self.lock:
+            for row in self.rows_backwards():
+                if row[0] < start:
+                    break
+                if row[0] < end:
+                    rows.append(row)
+        rows.reverse()
+        return rows
+
+    def truncate(self, end: int):
+        """Drop the rows from sequence number end on
+
+        Rows are spilled as games change, while the journal only keeps what
+        it synced. After a crash the archive can be ahead of the game
+        restored from the journal, whose next entries would reuse those
+        numbers.
+        """
+        with self.lock:
+            last = self.last_row()
+            if last is None or last[0] < end:
+                self.end = -1 if last is None else last[0] + 1
+                return
+            with open(self.path, 'r+b') as f:
+                position = 0
+                for line in f:
+                    try:
+                        seq = json.loads(line)[0]
+                    except ValueError:
+                        # Torn at the end of the file
+                        break
+                    if seq >= end:
+                        break
+                    position += len(line)
+                f.truncate(position)
+            self.end = None
+
+    def clear(self):
+        with self.lock:
+            self.path.unlink(missing_ok=True)
+            self.end = -1
+
+    def last_row(self) -> list | None:
+        for row in self.rows_backwards():
+            return row
+        return None
+
+    def rows_backwards(self):
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            position = f.seek(0, os.SEEK_END)
+            rest = b''
+            while position > 0:
+                size = min(BLOCK, position)
+                position -= size
+                f.seek(position)
+                lines = (f.read(size) + rest).split(b'\n')
+                # The first line may continue in the previous block
+                rest = lines[0] if position > 0 else b''
+                for line in reversed(lines if position == 0 else lines[1:]):
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # Empty, or torn at the end of the file
+                        continue
+
+
+class HistoryArchive:
+    """Append-only files of the history entries games no longer keep in memory
+
+    Games keep the newest entries of their round in memory, see HistoryLog,
+    and spill older ones here, one file per game. Files are only read when
+    clients page back past what games keep. Processes games migrate between
+    should share root.
+    """
+    def __init__(self, root: str, window: int = 200):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Entries each game keeps in memory, at least this many and fewer
+        # than twice as many
+        self.window = window
+
+    def for_game(self, game_id: int) -> GameArchive:
+        return GameArchive(self.root / f'{game_id}.log')
+
+    def delete(self, game_id: int):
+        (self.root / f'{game_id}.log').unlink(missing_ok=True)
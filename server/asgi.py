@@ -0,0 +1,177 @@
+"""Serve the backend from asyncio under an ASGI server
+
+Runs the same Cafe as app.py, with python-socketio's AsyncServer in place of
+Flask-SocketIO's threads. Handlers wait on game locks held by the flusher,
+timer and migration threads and write to the journal, so they run in worker
+threads rather than on the event loop, and emits are queued by an
+AsyncTransport. HTTP routes needing I/O hand it to threads too.
+
+python asgi.py, or with any ASGI server: uvicorn asgi:app --port 5001
+Set CODEPICS_DEBUG=1 for the debug events.
+"""
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import asyncio
+import contextlib
+import os
+import socketio
+import uvicorn
+
+import config
+from assets import AssetServer, etag_matches
+from backplane import make_async_client_manager
+from cafe import Cafe
+from lobby import content_etag, encode, merge_pages, parse_query
+from migrate import MigrationListener
+from transport import AsyncTransport
+
+debug = os.environ.get('CODEPICS_DEBUG') == '1'
+
+# WebSockets for communication in games
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*', logger=True,
+                           client_manager=make_async_client_manager(config.message_queue))
+transport = AsyncTransport(sio)
+
+cafe = Cafe(debug, transport, config.journal_dir, config.worker, config.workers, config.worker_urls,
+            config.history_dir, config.history_window, config.reservation_ttl, config.idle_ttl, config.grace, config.send_tick)
+
+if config.migration_socket:
+    MigrationListener(config.migration_socket, cafe.import_game).start()
+
+if config.asset_port:
+    AssetServer(cafe.index).start(config.host, config.asset_port)
+
+###########
+# Routing #
+###########
+
+async def ping_pong(request):
+    return JSONResponse('pong!')
+
+
+async def games(request):
+    """A page of games, optionally in one state, with ids above after"""
+    try:
+        state, after, limit = parse_query(request.query_params)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    if request.query_params.get('local') or len(config.worker_urls) < 2:
+        etag, body = cafe.lobby.listing(state, after, limit)
+    else:
+        # Gather games hosted by the other workers
+        query = {k: v for k, v in [('state', state), ('after', after), ('limit', limit)] if v is not None}
+        fetches = [asyncio.to_thread(config.fetch_games, url, query) for url in config.peer_urls()]
+        pages = [cafe.lobby.page(state, after, limit), *await asyncio.gather(*fetches)]
+        body = encode(merge_pages(pages, limit))
+        etag = content_etag(body)
+
+    if etag_matches(request.headers.get('if-none-match', ''), etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    return Response(body, media_type='application/json', headers={'ETag': etag})
+
+
+async def card_collections(request):
+    return JSONResponse(cafe.list_card_collections())
+
+
+async def create_game(request):
+    """Reserve a game id, on each worker in turn unless local is given"""
+    if request.query_params.get('local'):
+        return JSONResponse({'game_id': await asyncio.to_thread(cafe.reserve_lobby), 'url': None})
+    game_id, url = await asyncio.to_thread(cafe.create_lobby, config.reserve_game)
+    return JSONResponse({'game_id': game_id, 'url': url})
+
+
+async def metrics(request):
+    return JSONResponse(cafe.metrics())
+
+
+async def migrate(request):
+    """Move games to another process, all of them unless game_id is given"""
+    if request.client.host not in config.LOCALHOST:
+        return JSONResponse({'error': 'Forbidden'}, status_code=403)
+
+    data = await request.json()
+    if 'game_id' in data:
+        game_ids = [data['game_id']]
+    else:
+        game_ids = list(cafe.games)
+
+    # Blocks until the target has each game, and redirects players from there
+    moved = []
+    for game_id in game_ids:
+        if await asyncio.to_thread(cafe.migrate_game, game_id, data['target'], data['url']):
+            moved.append(game_id)
+    return JSONResponse({'moved': moved})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Timers, flushes and migrations send from other threads, possibly before
+    # any client connects
+    transport.start()
+    yield
+
+
+http = Starlette(
+    lifespan=lifespan,
+    routes=[
+        Route('/ping', ping_pong, methods=['GET']),
+        Route('/games', games, methods=['GET']),
+        Route('/card_collections', card_collections, methods=['GET']),
+        Route('/create_game', create_game, methods=['POST']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/migrate', migrate, methods=['POST']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['Content-Type'])]
+)
+
+app = socketio.ASGIApp(sio, other_asgi_app=http)
+
+###################
+# Socket handling #
+###################
+
+def in_thread(handler):
+    """Run a Cafe handler in a worker thread, keeping the loop free"""
+    async def run(*args):
+        return await asyncio.to_thread(handler, *args)
+    return run
+
+
+sio.on('disconnect', in_thread(lambda sid, *_: cafe.on_user_disconnect(sid)))
+sio.on('join', in_thread(cafe.create_or_join_game))
+sio.on('leave', in_thread(lambda sid, data: cafe.on_user_leave(sid)))
+sio.on('resume', in_thread(cafe.on_resume))
+sio.on('sync', in_thread(cafe.on_sync))
+sio.on('fetch_history', in_thread(cafe.on_fetch_history))
+sio.on('switch_team', in_thread(cafe.on_switch_team))
+sio.on('switch_collection', in_thread(cafe.on_switch_collection))
+sio.on('start_game', in_thread(cafe.on_start_game))
+sio.on('reset_game', in_thread(cafe.on_reset_game))
+sio.on('randomize_teams', in_thread(cafe.on_randomize_teams))
+sio.on('give_hint', in_thread(cafe.on_give_hint))
+sio.on('vote', in_thread(cafe.on_vote))
+sio.on('reveal_card', in_thread(cafe.on_reveal_card))
+sio.on('end_guessing', in_thread(cafe.on_end_guessing))
+
+if debug:
+    sio.on('debug_fill_game', in_thread(cafe.debug_fill_game))
+    sio.on('debug_leave_all', in_thread(lambda sid, data: cafe.debug_leave_all()))
+    sio.on('debug_give_hint', in_thread(cafe.debug_give_hint))
+    sio.on('debug_vote', in_thread(cafe.debug_vote))
+    sio.on('debug_reveal_card', in_thread(cafe.debug_reveal_card))
+    sio.on('debug_end_guessing', in_thread(cafe.debug_end_guessing))
+
+
+def main():
+    uvicorn.run(app, host=config.host, port=config.port)
+
+
+if __name__ == '__main__':
+    main()
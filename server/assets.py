@@ -0,0 +1,272 @@
+"""Serve card images, renditions and atlases apart from the game server
+
+A small HTTP/1.1 server on its own event loop, so image requests never
+take a thread or the GIL for long away from socket events. Files are sent
+with sendfile, without copying them through Python. Every response has a
+strong ETag, conditional requests are answered with 304 and single byte
+ranges with 206.
+
+Paths are the same as under Flask's /static, so clients only change the
+base URL. Renditions and atlases have content hashed names and are cached
+forever. Card images keep their names as their content changes, so
+clients revalidate them, against the ETag of their hash in the image index.
+
+app.py and asgi.py start one when CODEPICS_ASSET_PORT is set. Workers of a
+cluster share the port. It also runs on its own:
+python assets.py --port 5002
+"""
+from pathlib import Path
+
+import argparse
+import asyncio
+import email.utils
+import mimetypes
+import os
+import re
+import threading
+import urllib.parse
+
+# Longest request head accepted
+MAX_HEAD = 16 * 1024
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE = 30
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+RANGE = re.compile(r'bytes=(\d*)-(\d*)')
+REASONS = {
+    200: 'OK',
+    206: 'Partial Content',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    416: 'Range Not Satisfiable',
+}
+
+
+class Asset:
+    """A file to send and the headers describing it"""
+    def __init__(self, path: Path, stat: os.stat_result, etag: str, cache_control: str):
+        self.path = path
+        self.size = stat.st_size
+        self.etag = etag
+        self.cache_control = cache_control
+        self.last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        self.content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+
+
+def parse_range(header: str, size: int) -> (int, int):
+    """Start and end, exclusive, of a single byte range
+
+    None when the header should be ignored and the whole file sent. Raises
+    ValueError when no byte of the range is in the file.
+    """
+    match = RANGE.fullmatch(header.strip())
+    if match is None:
+        # Several ranges or another unit, send it all
+        return None
+    first, last = match.groups()
+    if first == '' and last == '':
+        return None
+    elif first == '':
+        # The last bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(0, size - length), size
+    start = int(first)
+    end = size if last == '' else min(size, int(last) + 1)
+    if start >= size or start >= end:
+        raise ValueError(header)
+    return start, end
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    tags = [t.strip() for t in header.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+class AssetServer:
+    """Serves the files under static_dir that clients load images from
+
+    With an ImageIndex, card images get ETags from their content hashes.
+    """
+    def __init__(self, index=None, static_dir: str = './static'):
+        self.index = index
+        self.static = Path(static_dir).resolve()
+        self.port = None
+        self.listening = threading.Event()
+
+    def start(self, host: str, port: int) -> 'AssetServer':
+        """Serve from a thread of its own, returning once listening"""
+        threading.Thread(target=asyncio.run, args=(self.serve(host, port),), daemon=True).start()
+        self.listening.wait()
+        return self
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle, host, port, reuse_port=True)
+        self.port = server.sockets[0].getsockname()[1]
+        print(f'Serving assets on {host}:{self.port}')
+        self.listening.set()
+        async with server:
+            await server.serve_forever()
+
+    def resolve(self, url_path: str) -> Asset | None:
+        parts = url_path.split('/')
+        if len(parts) < 3 or parts[0] != '' or parts[1] != 'static':
+            return None
+        parts = parts[2:]
+        if any(p in ['', '.', '..'] or '\\' in p or '\0' in p for p in parts):
+            return None
+
+        match parts:
+            case ['cards', collection, name]:
+                path = self.static / 'cards' / collection / name
+                cache_control = REVALIDATE
+            case ['renditions', collection, name]:
+                path = self.static / 'renditions' / collection / name
+                cache_control = IMMUTABLE
+            case ['atlases', name]:
+                path = self.static / 'atlases' / name
+                cache_control = IMMUTABLE
+            case _:
+                return None
+        if path.name.startswith('.') or path.suffix in ['.json', '.tmp']:
+            return None
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        etag = None
+        if cache_control == IMMUTABLE:
+            # Named after their content
+            etag = f'"{path.stem}"'
+        elif self.index is not None:
+            entry = self.index.entries(collection).get(name)
+            if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                etag = f'"{entry["hash"]}"'
+        if etag is None:
+            # Not indexed yet
+            etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        return Asset(path, stat, etag, cache_control)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while await self.respond(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """Answer one request, returning whether to keep the connection open"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEP_ALIVE)
+        except asyncio.IncompleteReadError as e:
+            if len(e.partial) == 0:
+                # Closed between requests
+                return False
+            raise
+        if len(head) > MAX_HEAD:
+            await self.send(writer, 400, {}, False)
+            return False
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            await self.send(writer, 400, {}, False)
+            return False
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+        if method not in ['GET', 'HEAD']:
+            # Any body is left unread, so the connection can't be reused
+            await self.send(writer, 405, {'Allow': 'GET, HEAD'}, False)
+            return False
+        asset = self.resolve(urllib.parse.unquote(target.partition('?')[0]))
+        if asset is None:
+            await self.send(writer, 404, {}, keep_alive)
+            return keep_alive
+
+        common = {
+            'ETag': asset.etag,
+            'Cache-Control': asset.cache_control,
+            'Last-Modified': asset.last_modified,
+            'Accept-Ranges': 'bytes',
+            # Atlases are cut up on a canvas, which needs CORS
+            'Access-Control-Allow-Origin': '*',
+        }
+        if etag_matches(headers.get('if-none-match', ''), asset.etag):
+            await self.send(writer, 304, common, keep_alive)
+            return keep_alive
+
+        status = 200
+        start, end = 0, asset.size
+        range_header = headers.get('range')
+        if_range = headers.get('if-range')
+        if range_header is not None and (if_range is None or if_range == asset.etag):
+            try:
+                byte_range = parse_range(range_header, asset.size)
+            except ValueError:
+                await self.send(writer, 416, common | {'Content-Range': f'bytes */{asset.size}'}, keep_alive)
+                return keep_alive
+            if byte_range is not None:
+                status = 206
+                start, end = byte_range
+                common['Content-Range'] = f'bytes {start}-{end - 1}/{asset.size}'
+
+        common['Content-Type'] = asset.content_type
+        common['Content-Length'] = str(end - start)
+        self.write_head(writer, status, common, keep_alive)
+        if method == 'GET' and end > start:
+            with open(asset.path, 'rb') as f:
+                await writer.drain()
+                await asyncio.get_running_loop().sendfile(writer.transport, f, start, end - start)
+        await writer.drain()
+        return keep_alive
+
+    def write_head(self, writer: asyncio.StreamWriter, status: int, headers: dict[str: str], keep_alive: bool):
+        lines = [f'HTTP/1.1 {status} {REASONS[status]}']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+    async def send(self, writer: asyncio.StreamWriter, status: int, headers: dict[str: str], keep_alive: bool):
+        """A response without a body"""
+        if status != 304:
+            headers = headers | {'Content-Length': '0'}
+        self.write_head(writer, status, headers, keep_alive)
+        await writer.drain()
+
+
+def main():
+    from images import ImageIndex
+    from watch import make_watcher
+
+    parser = argparse.ArgumentParser(description='Serve card images')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5002)
+    args = parser.parse_args()
+
+    index = ImageIndex('./static/cards', './cache/images')
+    index.load()
+    make_watcher('./static/cards', index.rescan).start()
+    server = AssetServer(index)
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+
+import hashlib
+import json
+import os
+import threading
+
+from renditions import FORMATS, SIZES, pool_context
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Longest side in pixels of each card in an atlas, as for the tile renditions
+CELL = SIZES['tile']
+# Cards per row of an atlas, like the board
+COLUMNS = 5
+
+
+def atlas_key(hashes: list[str]) -> str:
+    """Name of the atlas of a set of images, given their content hashes
+
+    The order images are dealt in doesn't matter, cards are looked up by
+    hash. The cell size is part of the key so changing it makes new atlases.
+    """
+    h = hashlib.sha256(f'{CELL}:{COLUMNS}:'.encode())
+    for digest in sorted(set(hashes)):
+        h.update(digest.encode())
+    return h.hexdigest()[:16]
+
+
+def compose(sources: list[(str, str)], out_dir: str, key: str) -> dict:
+    """Pack images into one atlas, returning where each went by content hash
+
+    Runs in a worker process. sources are (hash, path) pairs. Images are
+    shrunk to fit a cell and packed in rows of COLUMNS, each row as tall as
+    its tallest image.
+    """
+    tiles = []
+    for digest, path in sources:
+        with Image.open(path) as image:
+            image.draft('RGB', (CELL, CELL))
+            tile = ImageOps.exif_transpose(image).convert('RGB')
+        tile.thumbnail((CELL, CELL), Image.LANCZOS)
+        tiles.append((digest, tile))
+
+    cells = {}
+    width = height = 0
+    for row in range(0, len(tiles), COLUMNS):
+        x = 0
+        row_height = 0
+        for digest, tile in tiles[row:row + COLUMNS]:
+            cells[digest] = [x, height, *tile.size]
+            x += tile.width
+            row_height = max(row_height, tile.height)
+        width = max(width, x)
+        height += row_height
+
+    atlas = Image.new('RGB', (width, height))
+    for digest, tile in tiles:
+        atlas.paste(tile, tuple(cells[digest][:2]))
+
+    out = Path(out_dir)
+    files = {}
+    for fmt, ext, options in FORMATS:
+        path = out / f'{key}.{ext}'
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        atlas.save(tmp, fmt, **options)
+        os.replace(tmp, path)
+        files[ext] = path.name
+
+    info = {'files': files, 'width': width, 'height': height, 'cells': cells}
+    path = out / f'{key}.json'
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(info, f, separators=(',', ':'))
+    # Written last, an atlas with a description is complete
+    os.replace(tmp, path)
+    return info
+
+
+class Atlases:
+    """Sprite atlases of the cards dealt in games, so clients fetch one image
+
+    Atlases are composed in a process pool and kept in out as a description
+    and one image per format. The most recently used capacity atlases are
+    kept, older ones are deleted. Without Pillow there are no atlases.
+    """
+    def __init__(self, out: str, capacity: int = 256, workers: int = 2, pool: ProcessPoolExecutor = None):
+        self.out = Path(out)
+        self.capacity = capacity
+        self.workers = workers
+        self.lock = threading.Lock()
+        # Started with the first atlas unless given
+        self.pool = pool
+        # Atlases on disk, least recently used first
+        self.lru: OrderedDict[str: None] = OrderedDict()
+        self.pending: dict[str: Future] = {}
+
+        if Image is not None:
+            self.out.mkdir(parents=True, exist_ok=True)
+            described = sorted(self.out.glob('*.json'), key=lambda p: p.stat().st_mtime_ns)
+            for path in described:
+                self.lru[path.stem] = None
+
+    def request(self, sources: list[(str, str)]) -> (str, Future):
+        """The key and future description of the atlas of the given images
+
+        sources are (hash, path) pairs. The future is already done if the
+        atlas exists. Returns None for both without Pillow or once the
+        interpreter is exiting.
+        """
+        if Image is None:
+            return None, None
+
+        key = atlas_key([digest for digest, _ in sources])
+        with self.lock:
+            if key in self.pending:
+                return key, self.pending[key]
+            if key in self.lru:
+                info = self.load(key)
+                if info is not None:
+                    self.lru.move_to_end(key)
+                    future = Future()
+                    future.set_result(info)
+                    return key, future
+                del self.lru[key]
+
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=pool_context())
+            try:
+                future = self.pool.submit(compose, sources, str(self.out), key)
+            except RuntimeError:
+                # The interpreter is exiting
+                return None, None
+            self.pending[key] = future
+        future.add_done_callback(lambda f: self.finished(key, f))
+        return key, future
+
+    def load(self, key: str) -> dict | None:
+        path = self.out / f'{key}.json'
+        try:
+            with open(path) as f:
+                info = json.load(f)
+            # Marks it as recently used for other processes sharing out
+            os.utime(path)
+            return info
+        except (OSError, ValueError):
+            return None
+
+    def finished(self, key: str, future: Future):
+        with self.lock:
+            del self.pending[key]
+            if future.exception() is not None:
+                print(f'Failed to compose atlas {key}: {future.exception()!r}')
+                return
+            self.lru[key] = None
+            self.lru.move_to_end(key)
+            while len(self.lru) > self.capacity:
+                old, _ = self.lru.popitem(last=False)
+                self.delete(old)
+
+    def delete(self, key: str):
+        for path in [self.out / f'{key}.json', *[self.out / f'{key}.{ext}' for _, ext, _ in FORMATS]]:
+            path.unlink(missing_ok=True)
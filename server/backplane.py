@@ -0,0 +1,87 @@
+from broker import HEADER, BrokerClient
+
+import asyncio
+import pickle
+import socketio
+
+
+class BrokerManager(socketio.PubSubManager):
+    """Socket.IO client manager passing emits between workers through a Broker
+
+    url is the broker's Unix socket, as unix:///path/to/socket.
+    """
+    name = 'broker'
+
+    def __init__(self, url: str, channel: str = 'socketio', write_only: bool = False, logger=None):
+        self.client = BrokerClient(url.removeprefix('unix://'))
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _publish(self, data):
+        self.client.publish(pickle.dumps(data))
+
+    def _listen(self):
+        yield from self.client.listen()
+
+
+class AsyncBrokerManager(socketio.AsyncPubSubManager):
+    """BrokerManager for a socketio.AsyncServer"""
+    name = 'broker'
+
+    def __init__(self, url: str, channel: str = 'socketio', write_only: bool = False, logger=None):
+        self.path = url.removeprefix('unix://')
+        self.reader = None
+        self.writer = None
+        self.connect_lock = asyncio.Lock()
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    async def _connect(self):
+        async with self.connect_lock:
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+
+    async def _publish(self, data):
+        await self._connect()
+        message = pickle.dumps(data)
+        self.writer.write(HEADER.pack(len(message)) + message)
+        await self.writer.drain()
+
+    async def _listen(self):
+        await self._connect()
+        while True:
+            try:
+                size, = HEADER.unpack(await self.reader.readexactly(HEADER.size))
+                yield await self.reader.readexactly(size)
+            except asyncio.IncompleteReadError:
+                return
+
+
+def make_client_manager(url: str):
+    """Pick the message queue workers share emits through
+
+    unix:// is the local Broker, redis:// and rediss:// use Redis and anything
+    else is handed to Kombu. Without a url there is a single worker and no
+    message queue.
+    """
+    if not url:
+        return None
+    elif url.startswith('unix://'):
+        return BrokerManager(url)
+    elif url.startswith('redis://') or url.startswith('rediss://'):
+        return socketio.RedisManager(url)
+    else:
+        return socketio.KombuManager(url)
+
+
+def make_async_client_manager(url: str):
+    """make_client_manager for a socketio.AsyncServer
+
+    Kombu has no asyncio manager, so other URLs go to AMQP through aio-pika.
+    """
+    if not url:
+        return None
+    elif url.startswith('unix://'):
+        return AsyncBrokerManager(url)
+    elif url.startswith('redis://') or url.startswith('rediss://'):
+        return socketio.AsyncRedisManager(url)
+    else:
+        return socketio.AsyncAioPikaManager(url)
@@ -0,0 +1,152 @@
+"""Compare serving card images through Flask and through assets.py
+
+Starts app.py with an asset server on --asset-port and requests the card
+images of a collection from both over --connections keep-alive connections,
+for --duration seconds per case. Cases are plain GETs, revalidations
+answered with 304 and range requests. Reports requests and MiB per second
+and latency percentiles.
+
+Needs the packages in requirements.txt and a card collection.
+
+Example:
+python bench_assets.py --connections 64 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+
+from bench_serving import percentile, wait_until_up
+
+CASES = ['get', 'revalidate', 'range']
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection"""
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str):
+        self.reader = reader
+        self.writer = writer
+        self.host = host
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> 'Client':
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, f'{host}:{port}')
+
+    async def get(self, path: str, headers: dict[str: str]) -> (int, dict[str: str], int):
+        """Status, headers and body length of a GET"""
+        lines = [f'GET {path} HTTP/1.1', f'Host: {self.host}']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        head = (await self.reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        status = int(head[0].split(' ')[1])
+        response = {}
+        for line in head[1:]:
+            name, sep, value = line.partition(':')
+            if sep:
+                response[name.strip().lower()] = value.strip()
+        length = int(response.get('content-length', 0))
+        await self.reader.readexactly(length)
+        return status, response, length
+
+    def close(self):
+        self.writer.close()
+
+
+async def run_case(host: str, port: int, paths: list[str], case: str, args) -> dict:
+    etags = {}
+    if case == 'revalidate':
+        client = await Client.connect(host, port)
+        for path in paths:
+            _, headers, _ = await client.get(path, {})
+            etags[path] = headers.get('etag', '')
+        client.close()
+
+    latencies = []
+    received = 0
+    statuses = {}
+    deadline = time.perf_counter() + args.duration
+
+    async def worker():
+        nonlocal received
+        client = await Client.connect(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                path = random.choice(paths)
+                headers = {}
+                if case == 'revalidate':
+                    headers['If-None-Match'] = etags[path]
+                elif case == 'range':
+                    headers['Range'] = f'bytes=0-{args.range_bytes - 1}'
+                start = time.perf_counter()
+                status, _, length = await client.get(path, headers)
+                latencies.append((time.perf_counter() - start) * 1000)
+                received += length
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.connections)])
+    elapsed = time.perf_counter() - start
+    return {
+        'rps': len(latencies) / elapsed,
+        'mib_s': received / elapsed / 1024 / 1024,
+        'p50_ms': percentile(latencies, 0.5),
+        'p99_ms': percentile(latencies, 0.99),
+        'statuses': statuses,
+    }
+
+
+def card_paths(url: str, collection: str | None) -> list[str]:
+    with urllib.request.urlopen(url + 'card_collections', timeout=5) as response:
+        collections = json.load(response)['collections']
+    if len(collections) == 0:
+        raise SystemExit('The server has no card collections')
+    collection = collection or collections[0]
+    names = sorted(os.listdir(os.path.join('static', 'cards', collection)))
+    return [f'/static/cards/{collection}/{name}' for name in names if not name.startswith('.')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the Flask and asset server paths for card images')
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5, help='Seconds per case')
+    parser.add_argument('--port', type=int, default=5201)
+    parser.add_argument('--asset-port', type=int, default=5202)
+    parser.add_argument('--range-bytes', type=int, default=16 * 1024)
+    parser.add_argument('--collection')
+    args = parser.parse_args()
+
+    env = os.environ | {
+        'CODEPICS_PORT': str(args.port),
+        'CODEPICS_ASSET_PORT': str(args.asset_port),
+        'CODEPICS_JOURNAL_DIR': '',
+    }
+    proc = subprocess.Popen([sys.executable, 'app.py'], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    host = '127.0.0.1'
+    url = f'http://{host}:{args.port}/'
+    try:
+        wait_until_up(url, proc)
+        paths = card_paths(url, args.collection)
+        results = {}
+        for name, port in [('flask', args.port), ('assets', args.asset_port)]:
+            for case in CASES:
+                results[(name, case)] = asyncio.run(run_case(host, port, paths, case, args))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    print(f'{"":<10}{"case":<12}{"req/s":>10}{"MiB/s":>10}{"p50 ms":>10}{"p99 ms":>10}  statuses')
+    for (name, case), r in results.items():
+        print(f'{name:<10}{case:<12}{r["rps"]:>10.0f}{r["mib_s"]:>10.1f}{r["p50_ms"]:>10.2f}{r["p99_ms"]:>10.2f}  {r["statuses"]}')
+
+
+if __name__ == '__main__':
+    main()
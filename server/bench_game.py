@@ -0,0 +1,339 @@
+"""Micro-benchmarks for the hot paths of game.py, views.py and cafe.py
+
+Each benchmark runs for several player counts or history lengths and
+reports the best time per call over --repeat runs. Results can be saved as
+a baseline and later runs compared against it, failing when any benchmark
+got slower by more than --threshold. Baselines only mean something on the
+machine they were saved on.
+
+Examples:
+python bench_game.py --save        # record a baseline
+python bench_game.py               # compare against it, exit 1 on regressions
+python bench_game.py -k vote       # only benchmarks with vote in their name
+"""
+from cafe import Cafe
+from game import (
+    Game,
+    Team,
+
+    draw_cards,
+    dump_game,
+    generate_cards,
+    load_game,
+    random_first_team,
+)
+from views import all_team_info, game_info, history_info
+
+import argparse
+import contextlib
+import functools
+import gc
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+PLAYERS = [4, 8, 16, 32]
+HISTORY = [0, 100, 1000, 10000]
+# A tuple, as collections are published by ImageIndex
+IMAGES = tuple(f'card_{i}.png' for i in range(200))
+
+
+class NullTransport:
+    """Drops every message, so only Cafe's own work is timed"""
+    def emit(self, event: str, data, to: str, skip_sid: list[str] = None):
+        pass
+
+    def enter_room(self, sid: str, room: str):
+        pass
+
+    def leave_room(self, sid: str, room: str):
+        pass
+
+    def close_room(self, room: str):
+        pass
+
+
+def make_game(players: int, history: int = 0, game_id: int = 0, hint_count: int = 3) -> Game:
+    """A game in its first agent turn, with the given players and history"""
+    random.seed(game_id)
+    game = Game(game_id)
+    for i in range(players):
+        game.join_game(f'client_{i}', f'Player {i}')
+    game.randomize_teams()
+    for i in range(history):
+        game.record(f'Player {i % players}', Team.BLUE, 'picked card', f'{i % 20}', Team.INNOCENT)
+    game.start_game(Team.BLUE, generate_cards(Team.BLUE, IMAGES))
+    game.give_hint(game.teams[Team.BLUE].spymaster, 'bench', hint_count)
+    return game
+
+
+def agents(game: Game, team: Team) -> list[str]:
+    data = game.teams[team]
+    return sorted(c for c in data.members if c != data.spymaster)
+
+
+def own_cards(game: Game, team: Team) -> list[int]:
+    return [i for i, c in enumerate(game.cards) if c.team == team and c.hidden]
+
+
+# Each benchmark takes a parameter and returns a function to time and the
+# number of calls it makes. Preparing is not timed. The function may be
+# called repeatedly, unless the benchmark is marked single_use.
+
+def single_use(bench):
+    bench.single_use = True
+    return bench
+
+
+def bench_vote(players: int):
+    game = make_game(players)
+    voters = agents(game, Team.BLUE)
+    cards = own_cards(game, Team.BLUE)
+
+    def run():
+        # Every card is voted for and then unvoted, leaving the game as it was
+        for card in cards:
+            for voter in voters:
+                game.vote(voter, card)
+        for card in cards:
+            for voter in voters:
+                game.vote(voter, card)
+    return run, 2 * len(cards) * len(voters)
+
+
+@single_use
+def bench_reveal_card(players: int):
+    # Enough guesses for every card but the last, which would win
+    template = make_game(players, hint_count=8)
+    agent = agents(template, Team.BLUE)[0]
+    cards = own_cards(template, Team.BLUE)[:-1]
+    data = dump_game(template)
+    games = [load_game(data, False) for _ in range(200)]
+
+    def run():
+        for game in games:
+            for card in cards:
+                game.reveal_card(agent, card)
+    return run, len(games) * len(cards)
+
+
+def bench_randomize_teams(players: int):
+    game = make_game(players)
+
+    def run():
+        for _ in range(100):
+            game.randomize_teams()
+    return run, 100
+
+
+def bench_draw_cards(deck_size: int):
+    deck = list(range(deck_size))
+
+    def run():
+        for _ in range(1000):
+            draw_cards(deck, Team.BLUE)
+    return run, 1000
+
+
+def bench_generate_cards(deck_size: int):
+    images = IMAGES[:deck_size]
+
+    def run():
+        for _ in range(1000):
+            generate_cards(random_first_team(), images)
+    return run, 1000
+
+
+def bench_game_info(players: int):
+    game = make_game(players)
+    voters = agents(game, Team.BLUE)
+    for i, voter in enumerate(voters):
+        game.vote(voter, own_cards(game, Team.BLUE)[i % 3])
+
+    def run():
+        for _ in range(100):
+            game_info(game)
+    return run, 100
+
+
+def bench_all_team_info(players: int):
+    game = make_game(players)
+
+    def run():
+        for _ in range(1000):
+            all_team_info(game)
+    return run, 1000
+
+
+def bench_history_info(history: int):
+    game = make_game(8, history)
+
+    def run():
+        for _ in range(10):
+            history_info(game.history)
+    return run, 10
+
+
+def bench_history_since(history: int):
+    game = make_game(8, history)
+    end = game.history_end()
+
+    def run():
+        for _ in range(1000):
+            game.history_since(end - 5)
+            game.history_before(end, 50)
+    return run, 1000
+
+
+@functools.cache
+def bench_cafe() -> (Cafe, str):
+    """The Cafe shared by every run in this process, and the directory it is kept in
+
+    It is built in an empty directory, so there are no card images to index,
+    render or watch in the background while the benchmarks are timed.
+    """
+    root = tempfile.mkdtemp(prefix='bench_cafe')
+    os.makedirs(os.path.join(root, 'static', 'cards'))
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            # Sending each update as it comes
+            cafe = Cafe(False, NullTransport(), send_tick=0)
+    finally:
+        os.chdir(cwd)
+    return cafe, root
+
+
+def close_cafe():
+    if bench_cafe.cache_info().currsize > 0:
+        cafe, root = bench_cafe()
+        cafe.close()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def bench_cafe_vote(players: int):
+    """A vote through Cafe, including building, diffing and sending views"""
+    cafe, _ = bench_cafe()
+    game = make_game(players)
+    # Replaces the game of the previous run, views and all
+    cafe.views.discard(0)
+    cafe.subscribers.pop(0, None)
+    cafe.spymaster_rooms.pop(0, None)
+    cafe.games[0] = game
+    cafe.ids.skip(0)
+    cafe.send_update(game, 'update_game', {})
+    voter = agents(game, Team.BLUE)[0]
+    card = own_cards(game, Team.BLUE)[0]
+
+    def run():
+        for _ in range(100):
+            cafe.on_vote(voter, {'game_id': 0, 'card': card})
+    return run, 100
+
+
+BENCHMARKS = {
+    'vote': (bench_vote, PLAYERS),
+    'reveal_card': (bench_reveal_card, PLAYERS),
+    'randomize_teams': (bench_randomize_teams, PLAYERS),
+    'draw_cards': (bench_draw_cards, [20, 200]),
+    'generate_cards': (bench_generate_cards, [20, 200]),
+    'game_info': (bench_game_info, PLAYERS),
+    'all_team_info': (bench_all_team_info, PLAYERS),
+    'history_info': (bench_history_info, HISTORY),
+    'history_since': (bench_history_since, HISTORY),
+    'cafe_vote': (bench_cafe_vote, PLAYERS),
+}
+
+
+def measure(bench, param, repeat: int, min_time: float) -> float:
+    """Best time per call in microseconds over repeat runs
+
+    Each run prepares the benchmark and times it until min_time seconds
+    were timed. The garbage collector is off while timing, like timeit.
+    """
+    best = None
+    for _ in range(repeat):
+        elapsed = 0
+        total_calls = 0
+        run, calls = bench(param)
+        while elapsed < min_time:
+            if total_calls > 0 and getattr(bench, 'single_use', False):
+                run, calls = bench(param)
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                run()
+                elapsed += time.perf_counter() - start
+            finally:
+                gc.enable()
+            total_calls += calls
+        per_call = elapsed / total_calls * 1e6
+        best = per_call if best is None else min(best, per_call)
+    return best
+
+
+def compare(results: dict[str: float], baseline: dict[str: float], threshold: float) -> list[str]:
+    """Names of the benchmarks slower than the baseline by more than threshold"""
+    print(f'{"benchmark":<28}{"baseline us":>14}{"now us":>12}{"change":>10}')
+    regressions = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f'{name:<28}{"-":>14}{now:>12.2f}{"new":>10}')
+            continue
+        change = now / before - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSED'
+        print(f'{name:<28}{before:>14.2f}{now:>12.2f}{change:>+10.1%}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the game hot paths')
+    parser.add_argument('--baseline', default='bench_baseline.json')
+    parser.add_argument('--save', action='store_true', help='Save the results as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Slowdown that counts as a regression')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.1, help='Seconds timed per run')
+    parser.add_argument('-k', dest='filter', default='', help='Only run benchmarks whose name contains this')
+    args = parser.parse_args()
+
+    results = {}
+    try:
+        for name, (bench, params) in BENCHMARKS.items():
+            for param in params:
+                full_name = f'{name}/{param}'
+                if args.filter in full_name:
+                    results[full_name] = measure(bench, param, args.repeat, args.min_time)
+    finally:
+        close_cafe()
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        for name, us in results.items():
+            print(f'{name:<28}{us:>12.2f} us')
+        print(f'Saved baseline to {args.baseline}')
+        return
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+    regressions = compare(results, baseline, args.threshold)
+    if len(regressions) > 0:
+        print(f'{len(regressions)} benchmarks regressed by more than {args.threshold:.0%}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
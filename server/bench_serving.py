@@ -0,0 +1,176 @@
+"""Compare the threading (app.py) and asyncio (asgi.py) servers
+
+Starts each server in turn, opens as many Socket.IO connections as it
+accepts up to --clients, and reports the connections held, the server's
+memory per connection and the round trip latency of events. Latency is
+timed from sending 'sync' to receiving the resulting 'update_game', by
+one player in each of --games games, while the other connections idle.
+
+Needs the packages in requirements-dev.txt. Memory is read from /proc, so
+only Linux reports it.
+
+Example:
+python bench_serving.py --clients 1000 --events 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import socketio
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+SERVERS = {
+    'threading': 'app.py',
+    'asyncio': 'asgi.py',
+}
+
+
+def rss_kib(pid: int) -> int | None:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def request(url: str, method: str = 'GET'):
+    req = urllib.request.Request(url, method=method)
+    with urllib.request.urlopen(req, timeout=5) as response:
+        return json.load(response)
+
+
+def wait_until_up(url: str, proc: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'Server exited with {proc.returncode}')
+        try:
+            request(url + 'ping')
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('Server did not start')
+
+
+def percentile(samples: list[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+async def connect(url: str, clients: int, batch: int) -> list[socketio.AsyncClient]:
+    """Open up to clients connections, batch at a time, until the server refuses"""
+    connected = []
+
+    async def one():
+        client = socketio.AsyncClient(reconnection=False)
+        try:
+            await client.connect(url, transports=['websocket'], wait_timeout=10)
+            return client
+        except socketio.exceptions.ConnectionError:
+            return None
+
+    while len(connected) < clients:
+        n = min(batch, clients - len(connected))
+        opened = [c for c in await asyncio.gather(*[one() for _ in range(n)]) if c is not None]
+        connected.extend(opened)
+        if len(opened) < n:
+            break
+    return connected
+
+
+async def time_events(url: str, client: socketio.AsyncClient, events: int) -> list[float]:
+    game_id = (await asyncio.to_thread(request, url + 'create_game', 'POST'))['game_id']
+    updates = asyncio.Queue()
+    client.on('update_game', lambda data: updates.put_nowait(data))
+
+    await client.emit('join', {'game_id': game_id, 'name': 'bench'})
+    await asyncio.wait_for(updates.get(), 10)
+
+    latencies = []
+    for _ in range(events):
+        start = time.perf_counter()
+        await client.emit('sync', {'game_id': game_id})
+        await asyncio.wait_for(updates.get(), 10)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def bench(url: str, pid: int, args) -> dict:
+    idle_rss = rss_kib(pid)
+    clients = await connect(url, args.clients, args.batch)
+    # Let the server settle after the burst of connections
+    await asyncio.sleep(1)
+    loaded_rss = rss_kib(pid)
+
+    players = clients[:args.games]
+    runs = await asyncio.gather(*[time_events(url, c, args.events) for c in players])
+    latencies = [ms for run in runs for ms in run]
+
+    for client in clients:
+        await client.disconnect()
+
+    result = {
+        'connections': len(clients),
+        'p50_ms': statistics.median(latencies),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': max(latencies),
+    }
+    if idle_rss is not None and loaded_rss is not None and len(clients) > 0:
+        result['rss_mib'] = loaded_rss / 1024
+        result['kib_per_conn'] = (loaded_rss - idle_rss) / len(clients)
+    return result
+
+
+def run_server(mode: str, args) -> dict:
+    env = os.environ | {
+        'CODEPICS_PORT': str(args.port),
+        'CODEPICS_JOURNAL_DIR': '',
+    }
+    proc = subprocess.Popen([sys.executable, SERVERS[mode]], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{args.port}/'
+    try:
+        wait_until_up(url, proc)
+        return asyncio.run(bench(url, proc.pid, args))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def format_cell(value) -> str:
+    if value is None:
+        return f'{"-":>14}'
+    elif isinstance(value, int):
+        return f'{value:>14}'
+    return f'{value:>14.1f}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the threading and asyncio servers')
+    parser.add_argument('--mode', choices=[*SERVERS, 'both'], default='both')
+    parser.add_argument('--clients', type=int, default=500, help='Connections to open')
+    parser.add_argument('--batch', type=int, default=50, help='Connections opened at once')
+    parser.add_argument('--games', type=int, default=10, help='Connections timing events')
+    parser.add_argument('--events', type=int, default=200, help='Events timed per connection')
+    parser.add_argument('--port', type=int, default=5101)
+    args = parser.parse_args()
+
+    modes = list(SERVERS) if args.mode == 'both' else [args.mode]
+    results = {mode: run_server(mode, args) for mode in modes}
+
+    columns = ['connections', 'rss_mib', 'kib_per_conn', 'p50_ms', 'p99_ms', 'max_ms']
+    print(f'{"":<10}' + ''.join(f'{c:>14}' for c in columns))
+    for mode, result in results.items():
+        cells = [result.get(c) for c in columns]
+        print(f'{mode:<10}' + ''.join(format_cell(v) for v in cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import os
+import socket
+import struct
+import threading
+
+# Messages are a 4 byte big-endian length followed by that many bytes
+HEADER = struct.Struct('>I')
+
+
+def send_message(sock: socket.socket, message: bytes):
+    sock.sendall(HEADER.pack(len(message)) + message)
+
+
+def recv_message(sock: socket.socket) -> bytes | None:
+    """Read one message, None once the other end hangs up"""
+    def recv_exactly(n: int) -> bytes | None:
+        buf = b''
+        while len(buf) < n:
+            chunk = sock.recv(n - len(buf))
+            if not chunk:
+                return None
+            buf += chunk
+        return buf
+
+    header = recv_exactly(HEADER.size)
+    if header is None:
+        return None
+    size, = HEADER.unpack(header)
+    return recv_exactly(size)
+
+
+class Broker:
+    """Relays every message published by a worker to all workers
+
+    A minimal local message queue, listening on a Unix socket so a cluster
+    of workers on one machine needs no outside services. Messages go back to
+    their sender too, which is what a Socket.IO pub/sub manager expects.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.clients: dict[socket.socket: threading.Lock] = {}
+        self.lock = threading.Lock()
+
+        if os.path.exists(path):
+            os.unlink(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen()
+
+    def start(self):
+        threading.Thread(target=self.serve, daemon=True).start()
+        return self
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                # Closed
+                return
+            with self.lock:
+                self.clients[conn] = threading.Lock()
+            threading.Thread(target=self.relay, args=(conn,), daemon=True).start()
+
+    def relay(self, conn: socket.socket):
+        while True:
+            try:
+                message = recv_message(conn)
+            except OSError:
+                message = None
+            if message is None:
+                break
+
+            with self.lock:
+                clients = list(self.clients.items())
+            for client, send_lock in clients:
+                try:
+                    with send_lock:
+                        send_message(client, message)
+                except OSError:
+                    # Cleaned up by its own relay thread
+                    pass
+
+        with self.lock:
+            self.clients.pop(conn, None)
+        conn.close()
+
+    def close(self):
+        self.sock.close()
+        with self.lock:
+            for client in self.clients:
+                client.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class BrokerClient:
+    """Connection from a worker to a Broker"""
+    def __init__(self, path: str):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.lock = threading.Lock()
+
+    def publish(self, message: bytes):
+        with self.lock:
+            send_message(self.sock, message)
+
+    def listen(self):
+        """Yield every message relayed by the broker until it goes away"""
+        while True:
+            message = recv_message(self.sock)
+            if message is None:
+                return
+            yield message
+
+    def close(self):
+        self.sock.close()
@@ -1,148 +1,52 @@
 from game import (
     AgentTurn,
-    Card,
     Game,
-    Matchmaking,
     SpymasterTurn,
     Team,
-    TeamData,
-    Win,
 
     ActionError,
     GameSetupError,
     TurnError,
 
-    random_first_team,
-    generate_cards,
+    load_game,
 )
-from images import find_images
-
-from flask_socketio import (emit, join_room, leave_room, close_room)
+from archive import HistoryArchive
+from atlas import Atlases
+from images import ImageIndex
+from journal import Journal
+from lobby import LobbyIndex
+from registry import GameRegistry, IdAllocator
+from renditions import Image, Renditions, start_pool
+from timers import TimerWheel
+from migrate import MigrationError, pack_game, send_game
+from delta import diff
+from views import GameViews, ViewCache, history_info
+from watch import make_watcher
 
 from typing import TypeAlias
 
 import builtins
+import secrets
+import threading
+import time
 
-def lobby_info(game: Game):
-    return {
-        'game_id': game.game_id,
-        'players': game.num_players(),
-        'state': 'waiting' if game.play_state == Matchmaking() else 'playing'
-    }
-
-
-def player_info(player: str, game: Game, client: str):
-    return {
-        'name': game.client_to_name[player],
-        'is_self': player == client
-    }
-
-
-def team_info(team: Team, game: Game, client: str):
-    data = game.teams[team]
-    agents = [player_info(a, game, client) for a in data.members if a != data.spymaster]
-    spymaster = player_info(data.spymaster, game, client) if data.spymaster else None
-    cards_left = '-'
-    if len(game.cards) > 0:
-        cards_left = game.cards_left(team)
-
-    return {
-        'agents': agents,
-        'spymaster': spymaster,
-        'cards_left': cards_left
-    }
-
-
-def all_team_info(game: Game, client: str):
-    return {
-        'blue': team_info(Team.BLUE, game, client),
-        'red': team_info(Team.RED, game, client)
-    }
-
-
-def card_info(card: Card, hide: bool):
-    return {
-        'team': None if hide and card.hidden else card.team,
-        'asset': card.asset,
-        'hidden': card.hidden
-    }
-
-
-def spymaster_card_info(game: Game):
-    return {
-        'cards': [card_info(c, False) for c in game.cards]
-    }
-
-
-def vote_info(game: Game):
-    match game.play_state:
-        case AgentTurn(team, action):
-            votes = {}
-            for i in action.votes.keys():
-                players = [game.client_to_name[c] for c in action.votes[i]]
-                players.sort()
-                votes[i] = players
-            return votes
-        case _:
-            return {}
-
-
-def hint_info(game: Game):
-    match game.play_state:
-        case AgentTurn(team, action):
-            hints = {
-                'hint': action.hint,
-                'count': action.count
-            }
-            return hints
-        case _:
-            return {}
-
-
-def win_info(game: Game):
-    match game.play_state:
-        case Win(team):
-            return team
-        case _:
-            return None
-
-
-def history_info(game: Game):
-    history = []
-    for entry in game.history:
-        history.append({
-            'player_name': entry.player_name,
-            'player_team': entry.player_team,
-            'description': entry.description,
-            'action': entry.action,
-            'action_team': entry.action_team
-        })
-    return history
-
-
-def game_info(game: Game, client: str):
-    return {
-        'id': game.game_id,
-        'play_state': str(game.play_state),
-        'teams': all_team_info(game, client),
-        'cards': [card_info(c, True) for c in game.cards],
-        'collection': game.card_collection,
-        'votes': vote_info(game),
-        'hint': hint_info(game),
-        'winner': win_info(game),
-        'history': history_info(game)
-    }
+# History entries sent with a full view or per fetch of older entries
+HISTORY_PAGE = 50
 
 
 Schema: TypeAlias = dict[str: int | str | bool]
 
 
 def check_schema(schema: Schema):
+    """Validate event data, and hold the game's lock if it names a game"""
     def decorator(func):
         def wrapper(self, client: str, data):
-            parsed = validate(schema, data)
+            parsed = validate(schema, data, self.transport, client)
             if parsed is None:
                 return lambda *args: None
+            elif 'game_id' in parsed:
+                with self.games.lock(parsed['game_id']):
+                    return func(self, client, parsed)
             else:
                 return func(self, client, parsed)
         return wrapper
@@ -150,17 +54,76 @@ def check_schema(schema: Schema):
 
 
 class Cafe:
-    def __init__(self, debug: bool):
-        self.games: dict[int: Game] = {}
-        self.client_to_games: dict[str: list[int]] = {}
-        self.id_counter = 0
-        self.images = find_images('./static/cards')
+    """All games hosted by one worker
+
+    Game ids are sharded between workers, worker i owning the ids equal to i
+    modulo workers, so ids stay unique across workers without coordination.
+    peers are the URLs clients reach each worker at, for sending players to
+    the worker owning their game.
+
+    Messages go out through transport, see transport.py.
+
+    Handlers may run concurrently. Everything done to a game happens while
+    holding its lock in games, so events for one game are serialized while
+    events for different games run in parallel. State kept per game outside
+    of Game is only touched under that lock too.
+
+    Reserved ids no game takes within reservation_ttl seconds are released,
+    and games nothing happens in for idle_ttl seconds are evicted, players
+    and all. Both run off a TimerWheel turned by a background thread.
+
+    Clients joining a game are given a session token. Disconnected clients
+    keep their seat for grace seconds without anyone being told, and
+    resuming the session with the token within that time, and nothing else,
+    hands the seat to the new connection, which is only sent what it missed.
+
+    Handlers queue updates rather than sending them, and a flusher thread
+    sends the updates queued for each game every send_tick seconds, all
+    changes in between making one message per audience. Revealing a card,
+    and anything else sending an update right away, sends along what was
+    queued for the game.
+    """
+    def __init__(self, debug: bool, transport, journal_dir: str = None, worker: int = 0, workers: int = 1, peers: list[str] = None,
+                 history_dir: str = None, history_window: int = 200, reservation_ttl: float = 900, idle_ttl: float = 3600,
+                 grace: float = 30, send_tick: float = 0.05):
+        # Images are rendered and composed in a process pool, started before
+        # any thread is, see start_pool
+        self.pool = start_pool() if Image is not None else None
+        self.transport = transport
+        self.games = GameRegistry()
+        self.client_to_games: dict[str: set[int]] = {}
+        self.clients_lock = threading.Lock()
+        self.worker = worker
+        self.workers = workers
+        self.peers = peers or []
+        self.ids = IdAllocator(worker, workers)
+        # Counts games created through this worker, to hand them to each worker in turn
+        self.creations = IdAllocator(worker, 1)
+        self.index = ImageIndex('./static/cards', './cache/images')
+        self.index.load()
+        self.renditions = Renditions('./static/renditions', pool=self.pool)
+        self.atlases = Atlases('./static/atlases', pool=self.pool)
+        # The atlas of the cards dealt in each game: its key, the content
+        # hash of each card and its description once composed
+        self.game_atlases: dict[int: dict] = {}
+        self.views = ViewCache(self.renditions, self.index, self.game_atlases)
+        self.lobby = LobbyIndex()
+        # Clients holding a view of each game, everyone else needs a full view
+        self.subscribers: dict[int: set[str]] = {}
+        # Clients in each game's spymaster room, who receive the spymaster vision
+        self.spymaster_rooms: dict[int: set[str]] = {}
+        self.rendering = threading.Thread(target=self.renditions.update_all, args=('./static/cards', self.images), daemon=True)
+        self.rendering.start()
+        self.watcher = make_watcher('./static/cards', self.on_collection_changed)
+        self.watcher.start()
         self.debug = debug
         self.debug_clients = {}
         self.debug_game_info = {}
+        # Game id debug clients fill, never released
+        self.debug_lobby = None
 
         if debug:
-            self.id_counter += 1
+            self.debug_lobby = self.ids.allocate()
             self.debug_clients = {
                 'test0': 'Kafka De La Rosen, First of Her Name and Whatever Else Comes to Mind',
                 'test1': 'A really really really really really really really really really long name',
@@ -169,8 +132,95 @@ class Cafe:
                 'test4': 'Smithers has a really long history that is worth investigating over and it just goes on and on and on and on and on and on'
             }
 
-    def list_games(self):
-        return {'games': [lobby_info(g) for g in self.games.values()]}
+        # Seats whose clients are gone, by game and player name, waiting for
+        # the player to join again within the grace period
+        self.detached: dict[int: dict[str: str]] = {}
+        # Where games migrated to other processes went, kept for idle_ttl
+        self.moved: dict[int: str] = {}
+        # Games spill older history here, without it they keep all of it
+        self.archive = HistoryArchive(history_dir, history_window) if history_dir else None
+
+        self.reservation_ttl = reservation_ttl
+        self.idle_ttl = idle_ttl
+        # Reserved ids no game has taken yet, with when they expire
+        self.reservations: dict[int: float] = {}
+        # When each game last changed
+        self.last_active: dict[int: float] = {}
+        # Keys are ('reservation', game_id), ('idle', game_id),
+        # ('grace', game_id, client) and ('moved', game_id)
+        self.timers = TimerWheel(now=time.time())
+        self.timers_lock = threading.Lock()
+        self.counters = {'reservations_expired': 0, 'games_evicted': 0}
+
+        self.grace = grace
+        # Session tokens of each game and the clients they belong to
+        self.tokens: dict[int: dict[str: str]] = {}
+        # Disconnected clients keeping their seat in each game, with the
+        # views they were last sent and whether those had the spymaster vision
+        self.dropped: dict[int: dict[str: (GameViews | None, bool)]] = {}
+
+        self.send_tick = send_tick
+        # Event and payload of the update queued for each game
+        self.queued: dict[int: (str, dict)] = {}
+        self.updates_ready = threading.Condition()
+        self.flush_stats = {'flushes': 0, 'updates_flushed': 0, 'flush_ms': 0.0, 'flush_ms_max': 0.0}
+        if send_tick > 0:
+            threading.Thread(target=self.run_flusher, daemon=True).start()
+
+        self.journal = None
+        if journal_dir:
+            self.journal = Journal(journal_dir)
+            games, id_counter = self.journal.restore(debug)
+            self.ids.skip(id_counter - 1)
+            for game_id, game in games.items():
+                self.games[game_id] = game
+                self.archive_history(game)
+                self._detach_seats(game)
+                self.lobby.update(game)
+                self.watch_idle(game_id)
+            for game_id, expires in list(self.journal.reservations.items()):
+                if game_id not in games:
+                    # Those logged before reservations expired start over
+                    self.reserve(game_id, expires)
+            self.journal.start(lambda: (self.games.locked_values(), self.ids.next_id))
+
+        threading.Thread(target=self.run_timers, daemon=True).start()
+
+    def close(self):
+        """Stop watching and rendering the cards and shut the image workers down"""
+        self.watcher.stop()
+        self.rendering.join()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def archive_history(self, game: Game, new: bool = False):
+        """Have game spill older history to the archive
+
+        A new game clears whatever an earlier game with its id left behind,
+        others drop what was archived past their history, see
+        GameArchive.truncate.
+        """
+        if self.archive is None:
+            return
+        archive = self.archive.for_game(game.game_id)
+        if new:
+            archive.clear()
+        else:
+            archive.truncate(game.history.end)
+        game.history.attach(archive, self.archive.window)
+
+    @property
+    def images(self) -> dict[str: list[str]]:
+        """Image names of every card collection that can be played with"""
+        return self.index.images
+
+    def on_collection_changed(self, collection: str):
+        """Called by the watcher as images of a collection change"""
+        hashed = self.index.rescan(collection)
+        assets = self.images.get(collection, [])
+        print(f'Collection {collection} changed, {len(assets)} images, {hashed} new or changed')
+        # Removed collections lose their renditions too
+        self.renditions.update_all(self.index.root, {collection: assets})
 
     def list_card_collections(self):
         names = [c for c in self.images.keys()]
@@ -178,54 +228,459 @@ class Cafe:
         return {'collections': names }
 
     def reserve_lobby(self):
-        game_id = self.id_counter
-        self.id_counter += 1
+        game_id = self.ids.allocate()
+        with self.games.lock(game_id):
+            self.reserve(game_id)
         return game_id
 
+    def create_lobby(self, reserve_on) -> (int, str | None):
+        """Reserve a game id on each worker in turn, spreading new games over all of them
+
+        reserve_on(url) reserves an id on the worker at url, or returns None
+        if it cannot be reached, in which case this worker takes the game.
+        Returns the id and the URL of the worker owning it, None for this one.
+        Players joining it here are redirected there.
+        """
+        owner = self.creations.allocate() % self.workers
+        if owner != self.worker and owner < len(self.peers):
+            game_id = reserve_on(self.peers[owner])
+            if game_id is not None:
+                return game_id, self.peers[owner]
+        return self.reserve_lobby(), None
+
+    def reserve(self, game_id: int, expires: float = None):
+        """Let a game be created with game_id until expires, reservation_ttl from now by default"""
+        if expires is None:
+            expires = time.time() + self.reservation_ttl
+        self.reservations[game_id] = expires
+        self.schedule(('reservation', game_id), expires)
+        self.log(game_id, 'reserve', expires)
+
+    def is_reserved(self, game_id: int) -> bool:
+        return game_id in self.reservations or game_id == self.debug_lobby
+
+    def watch_idle(self, game_id: int):
+        """Evict a game once idle_ttl passes without it changing"""
+        now = time.time()
+        self.last_active[game_id] = now
+        if self.idle_ttl > 0:
+            self.schedule(('idle', game_id), now + self.idle_ttl)
+
+    def schedule(self, key: tuple, when: float):
+        with self.timers_lock:
+            self.timers.schedule(key, when)
+
+    def cancel(self, key: tuple):
+        with self.timers_lock:
+            self.timers.cancel(key)
+
+    def run_timers(self):
+        while True:
+            time.sleep(self.timers.tick)
+            try:
+                self.expire(time.time())
+            except Exception as e:
+                print(f'Failed to expire timers: {e!r}')
+
+    def expire(self, now: float):
+        """Release reservations, seats and redirects and evict games whose time came by now"""
+        with self.timers_lock:
+            keys = self.timers.advance(now)
+        for kind, game_id, *args in keys:
+            # One failing timer must not keep the others from expiring
+            try:
+                with self.games.lock(game_id):
+                    match kind:
+                        case 'reservation':
+                            self._expire_reservation(game_id)
+                        case 'idle':
+                            self._evict_idle(game_id, now)
+                        case 'grace':
+                            self._release_seat(game_id, *args)
+                        case 'moved':
+                            self.moved.pop(game_id, None)
+            except Exception as e:
+                print(f'Failed to expire {kind} timer of game {game_id}: {e!r}')
+
+    def _expire_reservation(self, game_id: int):
+        if self.reservations.pop(game_id, None) is None:
+            return
+        self.log(game_id, 'release')
+        self.counters['reservations_expired'] += 1
+
+    def _evict_idle(self, game_id: int, now: float):
+        game = self.games.get(game_id)
+        if game is None:
+            return
+        # Rather than moving the timer on every change, check when it fires
+        active = self.last_active.get(game_id, now)
+        if active + self.idle_ttl > now:
+            self.schedule(('idle', game_id), active + self.idle_ttl)
+            return
+
+        print(f'Evicting game {game_id}, idle for {now - active:.0f} s')
+        self.transport.emit('game_closed', {'game_id': game_id, 'reason': 'idle'}, to=room(game_id))
+        self._delete_game(game_id)
+        self.counters['games_evicted'] += 1
+
+    def metrics(self) -> dict[str: int | float]:
+        """Counters since starting and the current size of what they bound
+
+        flush_ms and flush_ms_max are how long the last and the longest
+        flush of queued updates took.
+        """
+        with self.timers_lock:
+            timers = len(self.timers)
+        with self.clients_lock:
+            clients = len(self.client_to_games)
+        with self.updates_ready:
+            queued = len(self.queued)
+        return self.counters | self.flush_stats | {
+            'queued_updates': queued,
+            'games': len(self.games),
+            'reservations': len(self.reservations),
+            'timers': timers,
+            'clients': clients,
+        }
+
+    def owner(self, game_id: int) -> int:
+        return game_id % self.workers
+
+    def log(self, game_id: int, op: str, *args):
+        """Record a call to a game in the journal, if journaling"""
+        if self.journal is not None:
+            self.journal.record(game_id, op, *args)
+
     @check_schema({'game_id': int, 'name': str})
     def create_or_join_game(self, client: str, data):
         game_id = data['game_id']
         name = data['name']
 
-        # Respect lobby reservation
-        if game_id >= self.id_counter:
-            return
+        if game_id not in self.games:
+            if game_id in self.moved:
+                self.transport.emit('redirect', {'game_id': game_id, 'url': self.moved[game_id]}, to=client)
+                return
+
+            owner = self.owner(game_id)
+            if owner != self.worker:
+                if owner < len(self.peers):
+                    self.transport.emit('redirect', {'game_id': game_id, 'url': self.peers[owner]}, to=client)
+                return
 
         if game_id not in self.games:
-            game = Game(game_id)
+            # Respect lobby reservation
+            if not self.is_reserved(game_id):
+                return
+            game = Game(game_id, debug=self.debug)
+            self.archive_history(game, new=True)
             self.games[game_id] = game
+            self.reservations.pop(game_id, None)
+            self.cancel(('reservation', game_id))
+            self.log(game_id, 'create', game.seed)
+            self.watch_idle(game_id)
 
         game = self.games[game_id]
-        game.join_game(client, name)
-
-        if client not in self.client_to_games:
-            self.client_to_games[client] = set({game_id})
+        old = None
+        # Seats of dropped clients are only handed over with their token, see
+        # on_resume. Detached seats have no token, their players had
+        # connected elsewhere
+        if not game.has_player(client):
+            old = self._pop_detached(game, name)
+        if old is not None:
+            game.rebind(old, client)
+            self.log(game_id, 'rebind', old, client)
         else:
-            self.client_to_games[client].add(game_id)
+            game.join_game(client, name)
+            self.log(game_id, 'join_game', client, name)
+        self._issue_token(game_id, client, old)
+
+        with self.clients_lock:
+            if client not in self.client_to_games:
+                self.client_to_games[client] = set({game_id})
+            else:
+                self.client_to_games[client].add(game_id)
 
         if client not in self.debug_clients:
-            join_room(room(game_id))
+            self.transport.enter_room(client, room(game_id))
+
+        self.queue_update(game, 'update_game', {})
+        broadcast_host(self.transport, game)
+
+    def _issue_token(self, game_id: int, client: str, old: str = None):
+        """Send client a new session token for its seat, replacing any it or old had"""
+        tokens = self.tokens.setdefault(game_id, {})
+        for token in [t for t, c in tokens.items() if c == client or c == old]:
+            del tokens[token]
+        token = secrets.token_urlsafe(16)
+        tokens[token] = client
+        self.transport.emit('session', {'game_id': game_id, 'token': token}, to=client)
+
+    def _detach_seats(self, game: Game):
+        """Keep the seats of a game taken over without its clients for the grace period"""
+        game_id = game.game_id
+        self.detached[game_id] = {n: c for c, n in game.client_to_name.items()}
+        expires = time.time() + self.grace
+        for client in game.client_to_name:
+            self.schedule(('grace', game_id, client), expires)
 
-        self.send_update(game, 'update_game', {})
-        broadcast_host(game)
+    def _pop_detached(self, game: Game, name: str) -> str | None:
+        """The detached client seated under name, no longer waited for"""
+        old = self.detached.get(game.game_id, {}).pop(name, None)
+        if old is not None:
+            self.cancel(('grace', game.game_id, old))
+        return old
 
     def on_user_disconnect(self, client: str):
-        if client not in self.client_to_games:
+        """The client's connection is gone, it may resume its seats within the grace period"""
+        with self.clients_lock:
+            game_ids = self.client_to_games.pop(client, set())
+
+        for game_id in game_ids:
+            with self.games.lock(game_id):
+                if self.grace > 0 and client in self.tokens.get(game_id, {}).values():
+                    self._drop(client, game_id)
+                else:
+                    self._leave_game(client, game_id)
+
+    def on_user_leave(self, client: str):
+        """The client left its games for good"""
+        with self.clients_lock:
+            game_ids = self.client_to_games.pop(client, set())
+
+        for game_id in game_ids:
+            with self.games.lock(game_id):
+                self._leave_game(client, game_id)
+
+    def _drop(self, client: str, game_id: int):
+        """Keep a disconnected client's seat, without telling anyone"""
+        game = self.games.get(game_id)
+        if game is None or not game.has_player(client):
             return
+        subscribers = self.subscribers.get(game_id, set())
+        members = self.spymaster_rooms.get(game_id, set())
+        views = self.views.latest.get(game_id) if client in subscribers else None
+        self.dropped.setdefault(game_id, {})[client] = (views, client in members)
+        subscribers.discard(client)
+        members.discard(client)
+        self.schedule(('grace', game_id, client), time.time() + self.grace)
+
+    def _release_seat(self, game_id: int, client: str):
+        """The grace period of a dropped or detached client ran out"""
+        dropped = self.dropped.get(game_id, {})
+        detached = self.detached.get(game_id, {})
+        if client in dropped:
+            del dropped[client]
+        elif client in detached.values():
+            del detached[next(n for n, c in detached.items() if c == client)]
+        else:
+            return
+        self._leave_game(client, game_id)
 
-        for game_id in self.client_to_games[client]:
-            game = self.games[game_id]
-            game.leave_game(client)
+    @check_schema({'game_id': int, 'token': str, 'version': int})
+    def on_resume(self, client: str, data):
+        """Hand a seat over to the new connection of the client holding its token
 
-            if client not in self.debug_clients:
-                leave_room(room(game_id))
+        The client says which version it last saw. If it still has the views
+        it was last sent and its role is the same, it is sent a patch from
+        those, otherwise the full view. Everyone else only sees the seat's new client id.
+        """
+        game_id = data['game_id']
+        game = self.games.get(game_id)
+        tokens = self.tokens.get(game_id, {})
+        old = tokens.get(data['token'])
+        if game is None or old is None or not game.has_player(old):
+            self.transport.emit('session_expired', {'game_id': game_id}, to=client)
+            return
 
-            self.send_update(game, 'update_game', {})
+        subscribers = self.subscribers.setdefault(game_id, set())
+        members = self.spymaster_rooms.setdefault(game_id, set())
+        dropped = self.dropped.get(game_id, {})
+        if old in dropped:
+            views, had_vision = dropped.pop(old)
+            self.cancel(('grace', game_id, old))
+        else:
+            # The old connection is yet to be noticed gone
+            views = self.views.latest.get(game_id) if old in subscribers else None
+            had_vision = old in members
+            with self.clients_lock:
+                game_ids = self.client_to_games.get(old, set())
+                game_ids.discard(game_id)
+                if len(game_ids) == 0:
+                    self.client_to_games.pop(old, None)
+            subscribers.discard(old)
+            members.discard(old)
+            self.transport.leave_room(old, room(game_id))
+            self.transport.leave_room(old, spymaster_room(game_id))
+
+        if old != client:
+            game.rebind(old, client)
+            self.log(game_id, 'rebind', old, client)
+            tokens[data['token']] = client
+
+        with self.clients_lock:
+            self.client_to_games.setdefault(client, set()).add(game_id)
+        self.transport.enter_room(client, room(game_id))
+
+        latest = self.views.latest.get(game_id)
+        # A client whose role changed meanwhile is sent the full view, patches
+        # from its old views would carry the old vision
+        vision = game.is_spymaster(client)
+        if views is not None and latest is not None and views.version == data['version'] and vision == had_vision:
+            if views is not latest:
+                self.send_missed(game, client, views, latest, vision)
+            subscribers.add(client)
+            if vision:
+                members.add(client)
+                self.transport.enter_room(client, spymaster_room(game_id))
+
+        # Sends the full view if the client was not caught up
+        self.send_update(game, 'update_game', {})
+        self.transport.emit('who_is_host', {'is_host': game.host == client}, to=client)
+
+    def send_view(self, game: Game, client: str, views: GameViews, vision: bool, event: str, payload: dict):
+        """Send a client the full views, its player id and the latest page of history"""
+        self.transport.emit(event, payload | {
+            'self': game.client_to_id[client],
+            'game': views.public,
+            'spymaster_vision': views.spymaster if vision else None,
+            'history': history_info(game.history_before(views.history_end, HISTORY_PAGE))
+        }, to=client)
+
+    def send_missed(self, game: Game, client: str, since: GameViews, latest: GameViews, vision: bool):
+        """Patch a client from the views it was sent to the latest, which the others have"""
+        ops = [[['game', *path], *value] for path, *value in diff(since.public, latest.public)]
+        if vision:
+            ops += [[['spymaster_vision', *path], *value] for path, *value in diff(since.spymaster, latest.spymaster)]
+        patch = {
+            'game_id': game.game_id,
+            'version': latest.version,
+            'base': since.version,
+            'ops': ops
+        }
+        if latest.history_end > since.history_end:
+            patch['history'] = history_info(game.history_since(since.history_end))
+        self.transport.emit('update_game', patch, to=client)
+
+    def _leave_game(self, client: str, game_id: int):
+        game = self.games.get(game_id)
+        if game is None:
+            return
+        game.leave_game(client)
+        self.log(game_id, 'leave_game', client)
 
-            if game.num_players() == 0:
-                del self.games[game_id]
-                close_room(room(game_id))
-        del self.client_to_games[client]
+        if client not in self.debug_clients:
+            self.transport.leave_room(client, room(game_id))
+            self.transport.leave_room(client, spymaster_room(game_id))
+        self.subscribers.get(game_id, set()).discard(client)
+        self.spymaster_rooms.get(game_id, set()).discard(client)
+        tokens = self.tokens.get(game_id, {})
+        for token in [t for t, c in tokens.items() if c == client]:
+            del tokens[token]
+
+        self.queue_update(game, 'update_game', {})
+
+        if game.num_players() == 0:
+            self._delete_game(game_id)
+            # Players following the link after everyone left start it again
+            if game_id != self.debug_lobby:
+                self.reserve(game_id)
+
+    def _delete_game(self, game_id: int):
+        game = self.games.pop(game_id)
+        self.log(game_id, 'delete')
+        if self.archive is not None:
+            self.archive.delete(game_id)
+        self._forget_game(game_id, list(game.client_to_name))
+
+    def _forget_game(self, game_id: int, clients: list[str]):
+        """Drop everything kept about a game gone from games"""
+        with self.clients_lock:
+            for client in clients:
+                game_ids = self.client_to_games.get(client)
+                if game_ids is not None:
+                    game_ids.discard(game_id)
+                    if len(game_ids) == 0:
+                        del self.client_to_games[client]
+        self.detached.pop(game_id, None)
+        self.tokens.pop(game_id, None)
+        for client in self.dropped.pop(game_id, {}):
+            self.cancel(('grace', game_id, client))
+        self.subscribers.pop(game_id, None)
+        self.spymaster_rooms.pop(game_id, None)
+        self.game_atlases.pop(game_id, None)
+        self.views.discard(game_id)
+        self.lobby.remove(game_id)
+        self.last_active.pop(game_id, None)
+        self.debug_game_info.pop(game_id, None)
+        self.cancel(('idle', game_id))
+        self.transport.close_room(room(game_id))
+        self.transport.close_room(spymaster_room(game_id))
+
+    def _find_game(self, client: str, game_id: int) -> Game | None:
+        """The game an event is for, None if it is not here
+
+        Clients still sending events for a game that moved are redirected.
+        """
+        game = self.games.get(game_id)
+        if game is None and game_id in self.moved:
+            self.transport.emit('redirect', {'game_id': game_id, 'url': self.moved[game_id]}, to=client)
+        return game
+
+    def migrate_game(self, game_id: int, path: str, url: str) -> bool:
+        """Move a game to the process listening on path and served at url
+
+        The game's lock is held for the duration, so events for it wait.
+        Once the target has it, players are redirected and rejoin there, and
+        events for it arriving later are answered with the redirect too. If
+        the target refuses it the game carries on here.
+        """
+        with self.games.lock(game_id):
+            return self._migrate_game(game_id, path, url)
+
+    def _migrate_game(self, game_id: int, path: str, url: str) -> bool:
+        game = self.games.pop(game_id, None)
+        if game is None:
+            return False
+
+        clients = list(game.client_to_name)
+        try:
+            send_game(path, pack_game(game, clients))
+        except MigrationError as e:
+            self.games[game_id] = game
+            print(f'Failed to migrate game {game_id}: {e}')
+            return False
+
+        self.moved[game_id] = url
+        # Links to the game lead here only as long as it could stay idle
+        self.schedule(('moved', game_id), time.time() + self.idle_ttl)
+        self.log(game_id, 'delete')
+        self.transport.emit('redirect', {'game_id': game_id, 'url': url}, to=room(game_id))
+        self._forget_game(game_id, clients)
+        return True
+
+    def import_game(self, data: dict):
+        """Take over a game migrated from another process
+
+        Its players are connected to the other process, so every seat waits
+        for its player to join again within the grace period.
+        """
+        game = load_game(data['game'], self.debug)
+        game_id = game.game_id
+        with self.games.lock(game_id):
+            if game_id in self.games:
+                raise GameSetupError(f'Game {game_id} already exists')
+
+            self.archive_history(game)
+            self.games[game_id] = game
+            self.ids.skip(game_id)
+            self.moved.pop(game_id, None)
+            self.cancel(('moved', game_id))
+            self.reservations.pop(game_id, None)
+            self.cancel(('reservation', game_id))
+            self._detach_seats(game)
+            self.log(game_id, 'load', data['game'])
+            self.lobby.update(game)
+            self.watch_idle(game_id)
 
     @check_schema({'game_id': int, 'team': str, 'as_spymaster': bool})
     def on_switch_team(self, client: str, data):
@@ -233,110 +688,335 @@ class Cafe:
         team = data['team']
         as_spymaster = data.get('as_spymaster', False)
 
-        game = self.games[game_id]
+        game = self._find_game(client, game_id)
+        if game is None:
+            return
         game.join_team(client, team, as_spymaster)
+        self.log(game_id, 'join_team', client, team, as_spymaster)
 
-        self.send_update(game, 'update_teams', {});
+        self.queue_update(game, 'update_teams', {})
 
     @check_schema({'game_id': int, 'collection': str})
     def on_switch_collection(self, client: str, data):
         game_id = data['game_id']
-        game = self.games[game_id]
+        game = self._find_game(client, game_id)
+        if game is None:
+            return
         collection = data['collection']
-        game.card_collection = collection
+        game.set_collection(collection)
+        self.log(game_id, 'set_collection', collection)
+
+        self.queue_update(game, 'update_game', {})
 
     @check_schema({'game_id': int})
     def on_start_game(self, client: str, data):
         game_id = data['game_id']
-        game = self.games[game_id]
+        game = self._find_game(client, game_id)
+        if game is None:
+            return
 
-        images = self.images[game.card_collection]
-        first_team = random_first_team()
-        cards = generate_cards(first_team, images)
+        images = self.images.get(game.card_collection)
+        if images is None:
+            self.transport.emit('error', f'Card collection {game.card_collection} is not available', to=client)
+            return
+        first_team, cards = game.deal(images)
 
         try:
             game.start_game(first_team, cards)
+            self.log(game_id, 'start_game', first_team, cards)
+            self.queue_atlas(game)
 
-            self.send_update(game, 'update_game', {})
+            self.queue_update(game, 'update_game', {})
         except GameSetupError as e:
-            emit('error', str(e))
+            self.transport.emit('error', str(e), to=client)
+
+    def queue_atlas(self, game: Game):
+        """Compose the atlas of the cards just dealt in the background
+
+        Clients are sent it with an update_atlas once ready. Until then the
+        view says it is on its way, unless it was composed before.
+        """
+        game_id = game.game_id
+        collection = game.card_collection
+        entries = self.index.entries(collection)
+        self.game_atlases.pop(game_id, None)
+        try:
+            hashes = [entries[c.asset]['hash'] for c in game.cards]
+        except KeyError:
+            # Removed since being dealt
+            return
+        paths = [str(self.index.root / collection / c.asset) for c in game.cards]
+        key, future = self.atlases.request(list(zip(hashes, paths)))
+        if key is None:
+            return
+
+        self.game_atlases[game_id] = {'key': key, 'hashes': hashes, 'info': None}
+        if future.done():
+            # Composed before, the update about to be sent includes it
+            self.record_atlas(game_id, future)
+        else:
+            future.add_done_callback(lambda f: self.atlas_ready(game_id, key, f))
+
+    def atlas_ready(self, game_id: int, key: str, future):
+        with self.games.lock(game_id):
+            game = self.games.get(game_id)
+            atlas = self.game_atlases.get(game_id)
+            # The game may have been reset or dealt again since
+            if game is None or atlas is None or atlas['key'] != key:
+                return
+            self.record_atlas(game_id, future)
+            game.touch()
+            self.queue_update(game, 'update_atlas', {})
+
+    def record_atlas(self, game_id: int, future):
+        if future.cancelled() or future.exception() is not None:
+            # Clients load each card's image instead
+            del self.game_atlases[game_id]
+        else:
+            self.game_atlases[game_id]['info'] = future.result()
 
     @check_schema({'game_id': int})
     def on_reset_game(self, client: str, data):
         game_id = data['game_id']
-        game = self.games[game_id]
+        game = self._find_game(client, game_id)
+        if game is None:
+            return
 
         game.reset()
+        self.log(game_id, 'reset')
+        self.game_atlases.pop(game_id, None)
 
-        self.send_update(game, 'update_game', {})
+        self.queue_update(game, 'update_game', {})
 
     @check_schema({'game_id': int})
     def on_randomize_teams(self, client: str, data):
         game_id = data['game_id']
-        game = self.games[game_id]
+        game = self._find_game(client, game_id)
+        if game is None:
+            return
 
-        game.randomize_teams()
+        players = game.randomize_teams()
+        self.log(game_id, 'randomize_teams', players)
 
-        self.send_update(game, 'update_teams', {})
+        self.queue_update(game, 'update_teams', {})
 
     @check_schema({'game_id': int, 'hint': str, 'count': int})
     def on_give_hint(self, client: str, data):
         game_id = data['game_id']
-        game = self.games[game_id]
+        game = self._find_game(client, game_id)
+        if game is None:
+            return
 
         try:
             game.give_hint(client, data['hint'], data['count'])
+            self.log(game_id, 'give_hint', client, data['hint'], data['count'])
 
-            self.send_update(game, 'new_turn', {})
+            self.queue_update(game, 'new_turn', {})
         except (GameSetupError, ActionError, TurnError) as e:
-            emit('error', str(e))
+            self.transport.emit('error', str(e), to=client)
 
     @check_schema({'game_id': int, 'card': int})
     def on_vote(self, client: str, data):
         game_id = data['game_id']
-        game = self.games[game_id]
+        game = self._find_game(client, game_id)
+        if game is None:
+            return
 
         try:
             game.vote(client, data['card'])
+            self.log(game_id, 'vote', client, data['card'])
 
-
-            self.send_update(game, 'update_vote', {})
+            self.queue_update(game, 'update_vote', {})
         except (GameSetupError, ActionError, TurnError) as e:
-            emit('error', str(e))
+            self.transport.emit('error', str(e), to=client)
 
     @check_schema({'game_id': int, 'card': int})
     def on_reveal_card(self, client: str, data):
         game_id = data['game_id']
-        game = self.games[game_id]
+        game = self._find_game(client, game_id)
+        if game is None:
+            return
 
         try:
             game.reveal_card(client, data['card'])
+            self.log(game_id, 'reveal_card', client, data['card'])
 
             self.send_update(game, 'update_card', {
                 'chosen_card': data['card']
             })
         except (GameSetupError, ActionError, TurnError) as e:
-            emit('error', str(e))
+            self.transport.emit('error', str(e), to=client)
 
     @check_schema({'game_id': int})
     def on_end_guessing(self, client: str, data):
         game_id = data['game_id']
-        game = self.games[game_id]
+        game = self._find_game(client, game_id)
+        if game is None:
+            return
 
         try:
             game.end_guessing(client, 0)
+            self.log(game_id, 'end_guessing', client, 0)
 
-            self.send_update(game, 'new_turn', {})
+            self.queue_update(game, 'new_turn', {})
         except (GameSetupError, ActionError, TurnError) as e:
-            emit('error', str(e))
+            self.transport.emit('error', str(e), to=client)
+
+    @check_schema({'game_id': int})
+    def on_sync(self, client: str, data):
+        """Send the full view again to a client that lost track of it"""
+        game_id = data['game_id']
+        game = self.games.get(game_id)
+        if game is None or not game.has_player(client):
+            return
+
+        views = self.views.latest.get(game_id)
+        if views is None or client not in self.subscribers.get(game_id, set()):
+            self.send_update(game, 'update_game', {})
+            return
+        # The others are already up to date with the latest views
+        vision = client in self.spymaster_rooms.get(game_id, set())
+        self.send_view(game, client, views, vision, 'update_game', {'game_id': game_id, 'version': views.version})
+
+    @check_schema({'game_id': int, 'before': int})
+    def on_fetch_history(self, client: str, data):
+        """Send a page of history entries older than the given sequence number"""
+        game_id = data['game_id']
+        game = self.games.get(game_id)
+        if game is None or not game.has_player(client):
+            return
+
+        entries = game.history_before(data['before'], HISTORY_PAGE)
+        self.transport.emit('history_page', {
+            'game_id': game_id,
+            'history_start': game.history_start,
+            'history': history_info(entries)
+        }, to=client)
+
+    def queue_update(self, game: Game, event: str, payload: dict):
+        """Have the next flush send an update of game, see send_update
+
+        Updates queued for a game meanwhile are merged, payloads combined,
+        see merged_event for the event they are sent as.
+        """
+        if self.send_tick <= 0:
+            self.send_update(game, event, payload)
+            return
+        with self.updates_ready:
+            queued = self.queued.get(game.game_id)
+            if queued is not None:
+                event = merged_event(queued[0], event)
+                payload = queued[1] | payload
+            self.queued[game.game_id] = (event, payload)
+            self.updates_ready.notify()
+
+    def run_flusher(self):
+        while True:
+            with self.updates_ready:
+                self.updates_ready.wait_for(lambda: len(self.queued) > 0)
+            # Let the updates of the tick pile up
+            time.sleep(self.send_tick)
+            try:
+                self.flush_updates()
+            except Exception as e:
+                print(f'Failed to flush updates: {e!r}')
+
+    def flush_updates(self):
+        """Send the updates queued for every game"""
+        start = time.perf_counter()
+        with self.updates_ready:
+            queued = self.queued
+            self.queued = {}
+        for game_id, (event, payload) in queued.items():
+            # One failing game must not hold up the updates of the others
+            try:
+                with self.games.lock(game_id):
+                    game = self.games.get(game_id)
+                    if game is not None:
+                        self.send_update(game, event, payload)
+            except Exception as e:
+                print(f'Failed to send update of game {game_id}: {e!r}')
+
+        elapsed = (time.perf_counter() - start) * 1000
+        stats = self.flush_stats
+        stats['flushes'] += 1
+        stats['updates_flushed'] += len(queued)
+        stats['flush_ms'] = elapsed
+        stats['flush_ms_max'] = max(stats['flush_ms_max'], elapsed)
 
     def send_update(self, game: Game, event: str, payload: dict):
-        for client in game.client_to_name:
-            response = {'game': game_info(game, client) }
-            if game.is_spymaster(client):
-                response['spymaster_vision'] = spymaster_card_info(game)
-            response = payload | response
-            emit(event, response, to=client)
+        """Send every client what changed since the last update
+
+        Each audience's view is built and diffed once. The agent patch is
+        emitted once to the game room and the spymaster patch once to the
+        spymaster room, along with any history entries appended since the last
+        update. Only clients without a view yet, who get the full view, their
+        player id and the latest page of history, and clients whose spymaster
+        role changed are sent messages of their own. The rooms are sent nothing
+        if the game has not changed.
+
+        Spymaster room membership follows the teams here, since every change
+        to the teams is followed by an update.
+        """
+        game_id = game.game_id
+        with self.updates_ready:
+            queued = self.queued.pop(game_id, None)
+        if queued is not None:
+            event = merged_event(queued[0], event)
+            payload = queued[1] | payload
+        self.last_active[game_id] = time.time()
+        self.lobby.update(game)
+        prev, curr = self.views.update(game)
+        subscribers = self.subscribers.setdefault(game_id, set())
+        members = self.spymaster_rooms.setdefault(game_id, set())
+        base = payload | {
+            'game_id': game_id,
+            'version': curr.version
+        }
+
+        # Dropped clients are sent what they missed if they resume
+        clients = game.client_to_name.keys() - self.dropped.get(game_id, {}).keys()
+        spymasters = {c for c in clients if game.is_spymaster(c)}
+        if prev is None:
+            joining = set(clients)
+        else:
+            joining = clients - subscribers
+        promoted = spymasters - members - joining
+        demoted = members - spymasters - joining
+
+        for client in joining:
+            self.send_view(game, client, curr, client in spymasters, event, base)
+
+        if prev is not None and len(joining) < len(clients):
+            public_ops = [[['game', *path], *value] for path, *value in diff(prev.public, curr.public)]
+            patch = base | {'base': prev.version}
+            if curr.history_end > prev.history_end:
+                patch['history'] = history_info(game.history_since(prev.history_end))
+
+            # Nothing changed for those already up to date
+            if prev is not curr:
+                self.transport.emit(event, patch | {'ops': public_ops}, to=room(game_id),
+                                    skip_sid=list(joining | members | promoted))
+
+            if prev is not curr and len(members - demoted - joining) > 0:
+                vision_ops = [[['spymaster_vision', *path], *value] for path, *value in diff(prev.spymaster, curr.spymaster)]
+                self.transport.emit(event, patch | {'ops': public_ops + vision_ops}, to=spymaster_room(game_id),
+                                    skip_sid=list(joining | demoted))
+
+            for client in promoted:
+                self.transport.emit(event, patch | {'ops': public_ops + [[['spymaster_vision'], curr.spymaster]]}, to=client)
+            for client in demoted:
+                self.transport.emit(event, patch | {'ops': public_ops + [[['spymaster_vision'], None]]}, to=client)
+
+        for client in spymasters - members:
+            if client not in self.debug_clients:
+                self.transport.enter_room(client, spymaster_room(game_id))
+        for client in members - spymasters:
+            if client not in self.debug_clients:
+                self.transport.leave_room(client, spymaster_room(game_id))
+        members.clear()
+        members.update(spymasters)
+        subscribers.update(clients)
 
     @check_schema({'game_id': int})
     def debug_fill_game(self, _, data):
@@ -373,7 +1053,7 @@ class Cafe:
 
     def debug_leave_all(self):
         for client, name in self.debug_clients.items():
-            self.on_user_disconnect(client)
+            self.on_user_leave(client)
         self.debug_game_info = {}
 
     @check_schema({'game_id': int, 'hint': str, 'count': int})
@@ -426,16 +1106,30 @@ class Cafe:
                 return None
 
 
+def merged_event(first: str, second: str) -> str:
+    """The event updates sent as one go out as
+
+    Updates of different kinds merge into an update_game, so no client
+    waits on an event that was merged away. Clients apply every update_*
+    message alike.
+    """
+    return first if first == second else 'update_game'
+
+
 def room(game_id: int):
     return f'game_{game_id}'
 
 
-def broadcast_host(game: Game):
+def spymaster_room(game_id: int):
+    return f'game_{game_id}_spymasters'
+
+
+def broadcast_host(transport, game: Game):
     for client in game.client_to_name.keys():
-        emit('who_is_host', {'is_host': game.host == client}, to=client)
+        transport.emit('who_is_host', {'is_host': game.host == client}, to=client)
 
 
-def validate(schema: Schema, data) -> Schema:
+def validate(schema: Schema, data, transport, client: str) -> Schema:
     parsed = {}
     errors = {}
     for key, expected_type in schema.items():
@@ -464,7 +1158,7 @@ def validate(schema: Schema, data) -> Schema:
                 raise AssertionError('Unexpected type in schema')
 
     if len(errors) != 0:
-        emit('schema_error', errors)
+        transport.emit('schema_error', errors, to=client)
         return None
     else:
         return parsed
@@ -0,0 +1,76 @@
+"""Run several backend workers on one machine
+
+Each worker is a separate process running app.py, or asgi.py with --asgi,
+on its own port, owning a shard of the game ids. Emits pass between workers
+through a local Broker, or through the message queue given with
+--message-queue.
+
+Example:
+python cluster.py --workers 4 --port 5001 --public-host 192.168.1.10
+"""
+from broker import Broker
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run several backend workers')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001, help='Port of the first worker, the rest follow')
+    parser.add_argument('--public-host', default='localhost', help='Host clients reach the workers at')
+    parser.add_argument('--message-queue', help='Message queue URL instead of a local broker')
+    parser.add_argument('--asgi', action='store_true', help='Serve with asgi.py instead of app.py')
+    parser.add_argument('--asset-port', type=int, help='Port every worker serves card images on, see assets.py')
+    args = parser.parse_args()
+
+    broker = None
+    message_queue = args.message_queue
+    if message_queue is None:
+        path = os.path.join(tempfile.gettempdir(), f'codepics-{os.getpid()}.sock')
+        broker = Broker(path).start()
+        message_queue = f'unix://{path}'
+
+    ports = [args.port + i for i in range(args.workers)]
+    urls = [f'http://{args.public_host}:{port}/' for port in ports]
+
+    script = 'asgi.py' if args.asgi else 'app.py'
+    procs = []
+    for i, port in enumerate(ports):
+        env = os.environ | {
+            'CODEPICS_WORKER': str(i),
+            'CODEPICS_WORKERS': str(args.workers),
+            'CODEPICS_WORKER_URLS': ','.join(urls),
+            'CODEPICS_MESSAGE_QUEUE': message_queue,
+            'CODEPICS_HOST': args.host,
+            'CODEPICS_PORT': str(port),
+        }
+        if args.asset_port:
+            env['CODEPICS_ASSET_PORT'] = str(args.asset_port)
+        procs.append(subprocess.Popen([sys.executable, script], env=env))
+        print(f'Worker {i} serving {urls[i]}')
+
+    def stop(*_):
+        for proc in procs:
+            proc.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for proc in procs:
+            proc.wait()
+    except KeyboardInterrupt:
+        stop()
+        for proc in procs:
+            proc.wait()
+    finally:
+        if broker is not None:
+            broker.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Settings of a backend worker, read from the environment
+
+Shared by app.py and asgi.py, the two ways of serving the backend.
+"""
+import json
+import os
+import urllib.parse
+import urllib.request
+
+# This worker's index among CODEPICS_WORKERS workers sharing games, and the
+# URLs clients reach each of them at. See cluster.py.
+worker = int(os.environ.get('CODEPICS_WORKER', 0))
+workers = int(os.environ.get('CODEPICS_WORKERS', 1))
+worker_urls = [u for u in os.environ.get('CODEPICS_WORKER_URLS', '').split(',') if u]
+
+# Message queue workers pass emits through, see backplane.py
+message_queue = os.environ.get('CODEPICS_MESSAGE_QUEUE')
+
+# Directory for the game journal, games are only kept in memory if empty
+journal_dir = os.environ.get('CODEPICS_JOURNAL_DIR', './journal')
+if journal_dir and workers > 1:
+    journal_dir = os.path.join(journal_dir, f'worker_{worker}')
+
+# Directory older history entries are spilled to, history is only kept in
+# memory if empty. Shared by workers, so games keep it when they migrate
+history_dir = os.environ.get('CODEPICS_HISTORY_DIR', './history')
+# Fewest history entries each game keeps in memory, see HistoryLog
+history_window = int(os.environ.get('CODEPICS_HISTORY_WINDOW', 200))
+
+# Seconds a reserved game id waits for its game to be created, and a game
+# waits for anything to happen before being evicted. 0 never evicts games
+reservation_ttl = float(os.environ.get('CODEPICS_RESERVATION_TTL', 900))
+idle_ttl = float(os.environ.get('CODEPICS_IDLE_TTL', 3600))
+# Seconds disconnected players keep their seat for, to resume their session
+grace = float(os.environ.get('CODEPICS_RECONNECT_GRACE', 30))
+# Seconds updates are gathered for before being sent out together, 0 sends
+# each as it happens
+send_tick = float(os.environ.get('CODEPICS_SEND_TICK', 0.05))
+
+# Unix socket other processes migrate games to, if any
+migration_socket = os.environ.get('CODEPICS_MIGRATION_SOCKET')
+
+host = os.environ.get('CODEPICS_HOST', '127.0.0.1')
+port = int(os.environ.get('CODEPICS_PORT', 5001))
+# Port card images are served on apart from the game server, see assets.py
+asset_port = int(os.environ['CODEPICS_ASSET_PORT']) if os.environ.get('CODEPICS_ASSET_PORT') else None
+
+# Only these may move games away with /migrate
+LOCALHOST = ['127.0.0.1', '::1']
+
+
+def peer_urls() -> list[str]:
+    return [u for i, u in enumerate(worker_urls) if i != worker]
+
+
+def fetch_games(url: str, query: dict) -> dict:
+    """A page of the games hosted by the worker at url, none if it cannot be reached"""
+    try:
+        with urllib.request.urlopen(url + 'games?' + urllib.parse.urlencode(query | {'local': 1}), timeout=1) as response:
+            return json.load(response)
+    except OSError:
+        return {'games': [], 'next': None}
+
+
+def reserve_game(url: str) -> int | None:
+    """Reserve a new game id on the worker at url, None if it cannot be reached"""
+    request = urllib.request.Request(url + 'create_game?local=1', method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=1) as response:
+            return json.load(response)['game_id']
+    except (OSError, ValueError, KeyError):
+        return None
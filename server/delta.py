@@ -0,0 +1,71 @@
+from typing import Any, TypeAlias
+
+# A patch operation is either [path, value] (set) or [path] (delete), where
+# path is a list of dict keys and list indices from the document root.
+Op: TypeAlias = list
+
+
+def diff(old: Any, new: Any, path: tuple = ()) -> list[Op]:
+    """Compute the operations that turn old into new
+
+    Dicts are compared key by key and lists index by index, so a single
+    changed leaf produces a single small operation. Lists that grow only
+    append new indices. Anything else that differs is replaced wholesale.
+    Dict keys go into paths as strings, as JSON turns them into strings in
+    the documents clients patch.
+
+    Example:
+    diff({'a': 1, 'b': [1]}, {'a': 2, 'b': [1, 2]})
+    # [[['a'], 2], [['b', 1], 2]]
+    """
+    if old is new:
+        return []
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old.keys() - new.keys():
+            ops.append([[*path, str(key)]])
+        for key, value in new.items():
+            if key not in old:
+                ops.append([[*path, str(key)], value])
+            else:
+                ops.extend(diff(old[key], value, (*path, str(key))))
+        return ops
+
+    if isinstance(old, list) and isinstance(new, list) and len(old) <= len(new):
+        ops = []
+        for i in range(len(old)):
+            ops.extend(diff(old[i], new[i], (*path, i)))
+        for i in range(len(old), len(new)):
+            ops.append([[*path, i], new[i]])
+        return ops
+
+    if old == new and type(old) == type(new):
+        return []
+    return [[list(path), new]]
+
+
+def apply(doc: Any, ops: list[Op]) -> Any:
+    """Apply operations produced by diff, returning the patched document
+
+    Mirrors the client side patching so the protocol can be tested from
+    Python.
+    """
+    for op in ops:
+        path = op[0]
+        if len(path) == 0:
+            doc = op[1]
+            continue
+
+        parent = doc
+        for key in path[:-1]:
+            parent = parent[key]
+
+        key = path[-1]
+        if len(op) == 1:
+            del parent[key]
+        elif isinstance(parent, list) and key == len(parent):
+            parent.append(op[1])
+        else:
+            parent[key] = op[1]
+    return doc
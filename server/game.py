@@ -1,8 +1,11 @@
-from dataclasses import dataclass
+from array import array
+from dataclasses import dataclass, field
 from enum import Enum
 from math import floor
 
 import random
+import secrets
+import sys
 
 class Team(str, Enum):
     BLUE = 'blue'
@@ -11,23 +14,68 @@ class Team(str, Enum):
     ASSASSIN = 'assassin'
 
 
-@dataclass
+def bits(mask: int) -> list[int]:
+    """Indexes of the set bits of mask, lowest first"""
+    indexes = []
+    while mask:
+        low = mask & -mask
+        indexes.append(low.bit_length() - 1)
+        mask ^= low
+    return indexes
+
+
 class AgentActions:
+    __slots__ = ['hint', 'count', 'max_guesses', 'guesses', 'ballot_masks']
+
     def __init__(self, hint: str, count: int):
         self.hint = hint
         self.count = count
         self.max_guesses = count + 1
         self.guesses: int = 0
-        self.votes: dict[int: set[str]] = {}
+        # Cards each player voted for, as a bitmask over card indexes
+        self.ballot_masks: dict[str: int] = {}
+
+    @property
+    def votes(self) -> dict[int: set[str]]:
+        """Players voting for each card, by card"""
+        votes = {}
+        for client, mask in self.ballot_masks.items():
+            for card in bits(mask):
+                votes.setdefault(card, set()).add(client)
+        return dict(sorted(votes.items()))
+
+    @property
+    def ballots(self) -> dict[str: set[int]]:
+        """Cards each player voted for, by player"""
+        return {client: set(bits(mask)) for client, mask in self.ballot_masks.items()}
+
+    def toggle_vote(self, client: str, card: int):
+        mask = self.ballot_masks.get(client, 0) ^ 1 << card
+        if mask == 0:
+            del self.ballot_masks[client]
+        else:
+            self.ballot_masks[client] = mask
+
+    def clear_votes(self, card: int):
+        bit = 1 << card
+        for client, mask in list(self.ballot_masks.items()):
+            if mask & bit:
+                if mask == bit:
+                    del self.ballot_masks[client]
+                else:
+                    self.ballot_masks[client] = mask ^ bit
 
+    def remove_voter(self, client: str):
+        self.ballot_masks.pop(client, None)
 
-@dataclass
+
+@dataclass(slots=True)
 class Matchmaking:
     def __str__(self):
         return 'matchmaking'
 
 
-@dataclass
+@dataclass(slots=True)
 class SpymasterTurn:
     team: Team
 
@@ -35,7 +83,7 @@ class SpymasterTurn:
         return f'{self.team}_spymaster'
 
 
-@dataclass
+@dataclass(slots=True)
 class AgentTurn:
     team: Team
     actions: AgentActions
@@ -44,7 +92,7 @@ class AgentTurn:
         return f'{self.team}_agents'
 
 
-@dataclass
+@dataclass(slots=True)
 class Win:
     team: Team
 
@@ -55,31 +103,269 @@ class Win:
 PlayState = Matchmaking | SpymasterTurn | AgentTurn | Win
 
 
-@dataclass
+@dataclass(slots=True)
 class TeamData:
-    def __init__(self):
-        self.members: set[str] = set() # Includes spymaster
-        self.spymaster: str = None
-        self.cards_left: int = 0
+    members: set[str] = field(default_factory=set) # Includes spymaster
+    spymaster: str = None
+    cards_left: int = 0
 
     def ready(self):
         return self.spymaster is not None and len(self.members) >= 2
 
 
-@dataclass
+# Order of teams in the 2 bit codes of a Board
+TEAM_CODES = [Team.BLUE, Team.RED, Team.INNOCENT, Team.ASSASSIN]
+
+
+def pack_teams(teams: list[Team]) -> int:
+    return sum(TEAM_CODES.index(team) << 2 * i for i, team in enumerate(teams))
+
+
+class Board:
+    """The cards of a game, packed into a few integers
+
+    Each card is an index into deck, the image names of the collection it
+    was dealt from, a 2 bit team and a bit set once revealed. Boards dealt
+    from the same collection share its deck. seed is the seed of the
+    generator the board was dealt with, None if it was built from cards.
+    """
+    __slots__ = ['deck', 'indexes', 'teams', 'revealed', 'seed']
+
+    def __init__(self, deck: tuple[str] = (), indexes: list[int] = (), teams: int = 0, revealed: int = 0, seed: int = None):
+        self.deck = deck
+        self.indexes = array('H', indexes)
+        self.teams = teams
+        self.revealed = revealed
+        self.seed = seed
+
+    @classmethod
+    def from_cards(cls, cards: list['Card'], seed: int = None) -> 'Board':
+        return cls.from_assets([c.asset for c in cards], [c.team for c in cards],
+                               [not c.hidden for c in cards], seed)
+
+    @classmethod
+    def from_assets(cls, assets: list[str], teams: list[Team], revealed: list[bool], seed: int = None) -> 'Board':
+        mask = sum(1 << i for i, shown in enumerate(revealed) if shown)
+        return cls(tuple(assets), range(len(assets)), pack_teams(teams), mask, seed)
+
+    def __len__(self) -> int:
+        return len(self.indexes)
+
+    def __getitem__(self, index: int) -> 'Card':
+        if index < 0:
+            index += len(self.indexes)
+        if index < 0 or index >= len(self.indexes):
+            raise IndexError('Card index out of range')
+        return Card.view(self, index)
+
+    def __iter__(self):
+        return (Card.view(self, i) for i in range(len(self.indexes)))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Board):
+            return NotImplemented
+        return (self.teams == other.teams and self.revealed == other.revealed and self.indexes == other.indexes
+                and (self.deck is other.deck or self.deck == other.deck))
+
+    def team(self, index: int) -> Team:
+        return TEAM_CODES[self.teams >> 2 * index & 3]
+
+    def asset(self, index: int) -> str:
+        return self.deck[self.indexes[index]]
+
+    def hidden(self, index: int) -> bool:
+        return not self.revealed >> index & 1
+
+    def set_hidden(self, index: int, hidden: bool):
+        if hidden:
+            self.revealed &= ~(1 << index)
+        else:
+            self.revealed |= 1 << index
+
+    def assets(self) -> list[str]:
+        return [self.deck[i] for i in self.indexes]
+
+    def dump(self) -> list:
+        """The board as plain data, with image names as decks can change"""
+        return [self.seed, self.teams, self.revealed, self.assets()]
+
+    @classmethod
+    def load(cls, data: list) -> 'Board':
+        seed, teams, revealed, assets = data
+        return cls(tuple(assets), range(len(assets)), teams, revealed, seed)
+
+
 class Card:
-    team: Team
-    asset: str
-    hidden: bool = True
+    """One card, a view over its Board once dealt
+
+    Cards made on their own get a board of one card.
+    """
+    __slots__ = ['board', 'index']
+
+    def __init__(self, team: Team, asset: str, hidden: bool = True):
+        self.board = Board.from_assets([asset], [team], [not hidden])
+        self.index = 0
+
+    @classmethod
+    def view(cls, board: Board, index: int) -> 'Card':
+        card = cls.__new__(cls)
+        card.board = board
+        card.index = index
+        return card
+
+    @property
+    def team(self) -> Team:
+        return self.board.team(self.index)
+
+    @property
+    def asset(self) -> str:
+        return self.board.asset(self.index)
+
+    @property
+    def hidden(self) -> bool:
+        return self.board.hidden(self.index)
+
+    @hidden.setter
+    def hidden(self, hidden: bool):
+        self.board.set_hidden(self.index, hidden)
 
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Card):
+            return NotImplemented
+        return (self.team, self.asset, self.hidden) == (other.team, other.asset, other.hidden)
 
-@dataclass
+    def __repr__(self) -> str:
+        return f'Card(team={self.team!r}, asset={self.asset!r}, hidden={self.hidden!r})'
+
+
+@dataclass(slots=True)
 class History:
     player_name: str
     player_team: Team
     description: str
     action: str
     action_team: Team
+    seq: int = 0
+
+
+# What history entries can describe, stored as their index
+DESCRIPTIONS = ['gives clue', 'picked card', 'ends guessing']
+# Teams of history entries, '' for none
+HISTORY_TEAMS = [*TEAM_CODES, '']
+
+
+def decode_history(code: int) -> (Team | str, str, Team | str):
+    """Player team, description and action team of a HistoryLog code"""
+    def get(values: list, i: int):
+        return values[i] if i < len(values) else None
+    return get(HISTORY_TEAMS, code >> 2 & 7), get(DESCRIPTIONS, code & 3), get(HISTORY_TEAMS, code >> 5)
+
+
+# Every code decoded up front, entries are made often
+HISTORY_CODES = [decode_history(code) for code in range(256)]
+
+
+def history_team(value: str) -> Team | str:
+    """Team of a history entry read back from JSON"""
+    return Team(value) if value in Team._value2member_map_ else value
+
+
+class HistoryLog:
+    """History entries of the current round of a game, stored by field
+
+    Each entry takes a byte for its description and teams, a reference to
+    its interned player name and one to its action. Picked cards are kept
+    as small ints, which Python shares, so only hints take more memory.
+    Indexing makes History entries.
+
+    Entries are numbered from start, the first of the round. With an
+    archive attached, once twice window entries are kept in memory the
+    oldest are spilled to it, leaving window, and are read back from it
+    when paging back. first is the number of the oldest entry in memory.
+    """
+    __slots__ = ['start', 'first', 'names', 'codes', 'actions', 'archive', 'window']
+
+    def __init__(self, start: int = 0, archive=None, window: int = None):
+        self.start = start
+        self.first = start
+        self.names: list[str] = []
+        # Description in the low 2 bits, then player team and action team in 3 bits each
+        self.codes = array('B')
+        self.actions: list[str | int] = []
+        self.archive = archive
+        self.window = window
+
+    @property
+    def end(self) -> int:
+        """Sequence number the next entry will get"""
+        return self.first + len(self.codes)
+
+    def attach(self, archive, window: int):
+        """Spill entries to archive from now on, a GameArchive"""
+        self.archive = archive
+        self.window = window
+        self.trim()
+
+    def next_round(self) -> 'HistoryLog':
+        """An empty log continuing the numbering, the archive is cleared"""
+        if self.archive is not None:
+            self.archive.clear()
+        return HistoryLog(self.end, self.archive, self.window)
+
+    def append(self, player_name: str, player_team: Team | str, description: str, action: str, action_team: Team | str):
+        code = DESCRIPTIONS.index(description)
+        code |= HISTORY_TEAMS.index(player_team) << 2 | HISTORY_TEAMS.index(action_team) << 5
+        self.names.append(sys.intern(player_name))
+        self.codes.append(code)
+        self.actions.append(int(action) if description == 'picked card' else action)
+        self.trim()
+
+    def trim(self):
+        if self.archive is None or len(self.codes) < 2 * self.window:
+            return
+        spilled = len(self.codes) - self.window
+        rows = []
+        for e in self[:spilled]:
+            rows.append([e.seq, e.player_name, e.player_team, e.description, e.action, e.action_team])
+        self.archive.spill(rows)
+        del self.names[:spilled]
+        del self.codes[:spilled]
+        del self.actions[:spilled]
+        self.first += spilled
+
+    def entry(self, i: int) -> History:
+        player_team, description, action_team = HISTORY_CODES[self.codes[i]]
+        return History(self.names[i], player_team, description, str(self.actions[i]), action_team, self.first + i)
+
+    def since(self, seq: int) -> list[History]:
+        """Entries from seq on, those in memory only"""
+        return self[max(seq - self.first, 0):]
+
+    def before(self, seq: int, limit: int) -> list[History]:
+        """Up to limit entries before seq, the archived ones read back"""
+        end = min(max(seq, self.start), self.end)
+        start = max(end - limit, self.start)
+        entries = []
+        if start < self.first and self.archive is not None:
+            for seq, name, player_team, description, action, action_team in self.archive.read(start, min(end, self.first)):
+                entries.append(History(name, history_team(player_team), description, action, history_team(action_team), seq))
+        return entries + self[max(start - self.first, 0):max(end - self.first, 0)]
+
+    def __len__(self) -> int:
+        """Entries kept in memory"""
+        return len(self.codes)
+
+    def __getitem__(self, index: int | slice) -> History | list[History]:
+        if isinstance(index, slice):
+            return list(map(self.entry, range(*index.indices(len(self.codes)))))
+        if index < 0:
+            index += len(self.codes)
+        if index < 0 or index >= len(self.codes):
+            raise IndexError('History index out of range')
+        return self.entry(index)
+
+    def __iter__(self):
+        return map(self.entry, range(len(self.codes)))
 
 
 class GameSetupError(Exception):
@@ -94,13 +380,27 @@ class ActionError(Exception):
     pass
 
 
-@dataclass
 class Game:
-    def __init__(self, game_id: int, collection: str = 'test'):
+    __slots__ = [
+        'game_id', 'card_collection', 'debug', 'seed',
+        'client_to_name', 'client_to_id', 'next_player_id', 'host',
+        'play_state', 'teams', 'roles', 'cards', 'history', 'version',
+    ]
+
+    def __init__(self, game_id: int, collection: str = 'test', debug: bool = False, seed: int = None):
         self.game_id = game_id
         self.card_collection = collection
+        # Recheck derived state after every change
+        self.debug = debug
+        # Deals and team shuffles come from generators seeded with seed and
+        # the version, so replaying changes repeats them. seed comes from the
+        # OS unless given. Generators take kilobytes, games don't keep one.
+        self.seed = secrets.randbits(64) if seed is None else seed
 
         self.client_to_name: dict[str: str] = {}
+        # Public identifier for each player, socket ids are kept private
+        self.client_to_id: dict[str: int] = {}
+        self.next_player_id = 0
         self.host: str = None
 
         self.play_state: PlayState = Matchmaking()
@@ -108,8 +408,54 @@ class Game:
             Team.BLUE: TeamData(),
             Team.RED: TeamData()
         }
-        self.cards: list[Card] = []
-        self.history: list[History] = []
+        # Team of each team member, kept in step with teams
+        self.roles: dict[str: Team] = {}
+        self.cards = Board()
+        # Sequence numbers keep counting up across resets
+        self.history = HistoryLog()
+
+        # Bumped on every state change so clients can be sent patches
+        self.version = 0
+
+    @property
+    def history_start(self) -> int:
+        """Sequence number of the first entry in history"""
+        return self.history.start
+
+    def random(self) -> random.Random:
+        """A generator for a deal or shuffle at the current version"""
+        return random.Random(f'{self.seed}:{self.version}')
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Game):
+            return NotImplemented
+        return dump_game(self) == dump_game(other)
+
+    def touch(self):
+        self.version += 1
+        if self.debug:
+            self.check_invariants()
+
+    def check_invariants(self):
+        """Compare incrementally maintained state against a full recomputation"""
+        roles = {}
+        for team, data in self.teams.items():
+            for client in data.members:
+                assert client not in roles, f'{client} is in both teams'
+                roles[client] = team
+            assert data.spymaster is None or data.spymaster in data.members, f'{team} spymaster not in team'
+
+            left = sum(1 for c in self.cards if c.team == team and c.hidden)
+            assert data.cards_left == left, f'{team} cards left is {data.cards_left}, expected {left}'
+
+        assert self.roles == roles, f'Roles {self.roles} do not match teams {roles}'
+        assert roles.keys() <= self.client_to_name.keys(), 'Team member not in game'
+        assert self.client_to_id.keys() == self.client_to_name.keys(), 'Player ids do not match players'
+
+        match self.play_state:
+            case AgentTurn(_, actions):
+                for client, mask in actions.ballot_masks.items():
+                    assert 0 < mask < 1 << len(self.cards), f'Ballot {mask:b} of {client} is empty or out of range'
 
     def num_players(self) -> int:
         return len(self.client_to_name)
@@ -118,66 +464,82 @@ class Game:
         return client in self.client_to_name
 
     def player_team(self, client: str) -> Team:
-        if client in self.teams[Team.BLUE].members:
-            return Team.BLUE
-        elif  client in self.teams[Team.RED].members:
-            return Team.RED
-        else:
+        team = self.roles.get(client)
+        if team is None:
             raise GameSetupError('Player not in game')
+        return team
 
     def is_spymaster(self, client: str) -> bool:
-        if client == self.teams[Team.BLUE].spymaster:
-            return True
-        elif client == self.teams[Team.RED].spymaster:
-            return True
-        else:
-            return False
+        team = self.roles.get(client)
+        return team is not None and self.teams[team].spymaster == client
 
     def teams_ready(self) -> bool:
         return self.teams[Team.BLUE].ready() and self.teams[Team.RED].ready()
 
     def cards_left(self, team: Team) -> int:
-        left = sum(1 for c in self.cards if c.team == team and c.hidden)
-        return left
+        return self.teams[team].cards_left
+
+    def history_end(self) -> int:
+        """Sequence number the next history entry will get"""
+        return self.history.end
+
+    def history_since(self, seq: int) -> list[History]:
+        return self.history.since(seq)
+
+    def history_before(self, seq: int, limit: int) -> list[History]:
+        return self.history.before(seq, limit)
+
+    def record(self, player_name: str, player_team: Team, description: str, action: str, action_team: Team):
+        self.history.append(player_name, player_team, description, action, action_team)
+        self.touch()
 
     def update_name(self, client: str, name: str):
         if client in self.client_to_name:
-            self.client_to_name[client] = name
+            self.client_to_name[client] = sys.intern(name)
+            self.touch()
 
     def join_game(self, client: str, name: str):
-        self.client_to_name[client] = name
+        # Shared with the history entries of the player
+        self.client_to_name[client] = sys.intern(name)
+        if client not in self.client_to_id:
+            self.client_to_id[client] = self.next_player_id
+            self.next_player_id += 1
         if self.host is None:
             self.host = client
+        self.touch()
 
     def leave_game(self, client: str):
         self.leave_teams(client)
 
         if client in self.client_to_name:
             del self.client_to_name[client]
+            del self.client_to_id[client]
         if client == self.host:
             if len(self.client_to_name) == 0:
                 self.host = None
             else:
                 self.host = next(iter(self.client_to_name))
+        self.touch()
 
     def join_team(self, client: str, team: str, as_spymaster: bool):
         if client not in self.client_to_name:
             return
 
         if team == 'blue':
-            join_team = self.teams[Team.BLUE]
-            leave_team = self.teams[Team.RED]
+            team = Team.BLUE
         elif team == 'red':
-            join_team = self.teams[Team.RED]
-            leave_team = self.teams[Team.BLUE]
+            team = Team.RED
         else:
             return
 
         self.leave_teams(client)
 
+        join_team = self.teams[team]
         join_team.members.add(client)
+        self.roles[client] = team
         if as_spymaster and join_team.spymaster is None:
             join_team.spymaster = client
+        self.touch()
 
     def leave_teams(self, client: str):
         def leave(team: TeamData):
@@ -187,11 +549,32 @@ class Game:
 
         leave(self.teams[Team.BLUE])
         leave(self.teams[Team.RED])
+        self.roles.pop(client, None)
+
+        match self.play_state:
+            case AgentTurn(_, actions):
+                actions.remove_voter(client)
+        self.touch()
 
     def next_state(self, state: PlayState):
         self.play_state = state
+        self.touch()
+
+    def set_collection(self, collection: str):
+        self.card_collection = collection
+        self.touch()
+
+    def deal(self, images: tuple[str]) -> (Team, Board):
+        """First team and cards for a new round, to pass to start_game
 
-    def start_game(self, first_team: Team, cards: list[Card]):
+        Each deal gets a seed of its own from the game's generator, kept on
+        the board, so deal_cards can repeat it.
+        """
+        return deal_cards(self.random().getrandbits(64), images)
+
+    def start_game(self, first_team: Team, cards: Board | list[Card]):
+        if not isinstance(cards, Board):
+            cards = Board.from_cards(cards)
         assert len(cards) == 20
         assert first_team in [Team.BLUE, Team.RED]
 
@@ -209,23 +592,37 @@ class Game:
         match self.play_state:
             case Matchmaking() | Win():
                 self.cards = cards
+                for team in [Team.BLUE, Team.RED]:
+                    self.teams[team].cards_left = sum(1 for c in cards if c.team == team and c.hidden)
                 self.next_state(SpymasterTurn(first_team))
             case _:
                 raise GameSetupError('Game in progress')
 
     def reset(self):
-        self.cards = []
-        self.history = []
+        self.cards = Board()
+        self.teams[Team.BLUE].cards_left = 0
+        self.teams[Team.RED].cards_left = 0
+        self.history = self.history.next_round()
         self.next_state(Matchmaking())
 
-    def randomize_teams(self):
+    def randomize_teams(self, players: list[str] = None) -> list[str]:
+        """Split players into teams, the first two becoming spymasters
+
+        Players are shuffled unless their order is given. Returns the order
+        used so the same teams can be rebuilt.
+        """
         self.teams[Team.BLUE].spymaster = None
         self.teams[Team.BLUE].members = set()
         self.teams[Team.RED].spymaster = None
         self.teams[Team.RED].members = set()
+        self.roles = {}
+        match self.play_state:
+            case AgentTurn(_, actions):
+                actions.ballot_masks = {}
 
-        players = [client for client in self.client_to_name]
-        random.shuffle(players)
+        if players is None:
+            players = [client for client in self.client_to_name]
+            self.random().shuffle(players)
         num = len(players)
         if num > 0:
             self.join_team(players[0], Team.BLUE, True)
@@ -237,6 +634,32 @@ class Game:
                 self.join_team(client, Team.BLUE, False)
             for client in players[split:]:
                 self.join_team(client, Team.RED, False)
+        return players
+
+    def rebind(self, old: str, new: str):
+        """Hand a player's seat, team, role and votes over to a new client"""
+        if old not in self.client_to_name or new in self.client_to_name:
+            return
+
+        # Rebuild to keep join order, which decides the next host
+        self.client_to_name = {new if c == old else c: n for c, n in self.client_to_name.items()}
+        self.client_to_id[new] = self.client_to_id.pop(old)
+        if self.host == old:
+            self.host = new
+
+        team = self.roles.pop(old, None)
+        if team is not None:
+            data = self.teams[team]
+            data.members.remove(old)
+            data.members.add(new)
+            if data.spymaster == old:
+                data.spymaster = new
+            self.roles[new] = team
+
+        match self.play_state:
+            case AgentTurn(_, actions) if old in actions.ballot_masks:
+                actions.ballot_masks[new] = actions.ballot_masks.pop(old)
+        self.touch()
 
     def give_hint(self, client: str, hint: str, count: int):
         match self.play_state:
@@ -249,7 +672,7 @@ class Game:
                 description = 'gives clue'
                 action = f'{hint} {count}'
                 action_team = ''
-                self.history.append(History(player_name, player_team, description, action, action_team))
+                self.record(player_name, player_team, description, action, action_team)
 
                 agent_actions = AgentActions(hint, count)
                 self.next_state(AgentTurn(curr_team, agent_actions))
@@ -286,12 +709,8 @@ class Game:
         Example:
         game.vote(client, card)
         """
-        if card not in actions.votes:
-            actions.votes[card] = set({client})
-        elif client not in actions.votes[card]:
-            actions.votes[card].add(client)
-        else:
-            actions.votes[card].remove(client)
+        actions.toggle_vote(client, card)
+        self.touch()
 
     @_checked_agent_action(True)
     def reveal_card(self, client: str, card_index: int, curr_team: Team, actions: AgentActions):
@@ -304,13 +723,16 @@ class Game:
 
         card = self.cards[card_index]
         card.hidden = False
+        if card.team in self.teams:
+            self.teams[card.team].cards_left -= 1
+        self.touch()
 
         player_name = self.client_to_name[client]
         player_team = curr_team
         description = 'picked card'
         action = f'{card_index}'
         action_team = card.team
-        self.history.append(History(player_name, player_team, description, action, action_team))
+        self.record(player_name, player_team, description, action, action_team)
 
         if self.cards_left(curr_team) <= 0:
             self.next_state(Win(curr_team))
@@ -327,8 +749,7 @@ class Game:
             case _ if card.team == other_team:
                 self.next_state(SpymasterTurn(other_team))
             case _:
-                if card_index in actions.votes:
-                    del actions.votes[card_index]
+                actions.clear_votes(card_index)
 
                 actions.guesses += 1
                 if actions.guesses >= actions.max_guesses:
@@ -341,7 +762,7 @@ class Game:
         description = 'ends guessing'
         action = ''
         action_team = ''
-        self.history.append(History(player_name, player_team, description, action, action_team))
+        self.record(player_name, player_team, description, action, action_team)
 
         other_team = switch_team(curr_team)
         self.next_state(SpymasterTurn(other_team));
@@ -357,7 +778,7 @@ def switch_team(team: Team) -> Team:
             raise AssertionError('Player teams can only be blue or red')
 
 
-def draw_cards(deck: list[int], first_team: Team) -> list[(Team, int)]:
+def draw_cards(deck: list[int], first_team: Team, rng: random.Random = random) -> list[(Team, int)]:
     """Shuffle and draw 20 cards from deck
     Pick 20 cards and assign:
     * 8 for first team
@@ -368,7 +789,7 @@ def draw_cards(deck: list[int], first_team: Team) -> list[(Team, int)]:
     assert len(deck) >= 20
     second_team = switch_team(first_team)
 
-    drawn_cards = random.sample(deck, 20)
+    drawn_cards = rng.sample(deck, 20)
 
     assigned_cards: list[(Team, int)] = []
     for i in range(0, 8):
@@ -382,17 +803,115 @@ def draw_cards(deck: list[int], first_team: Team) -> list[(Team, int)]:
     return assigned_cards
 
 
-def generate_cards(first_team: Team, images: list[str]) -> list[Card]:
-    deck = [i for i in range(len(images))]
-    draw = draw_cards(deck, first_team)
+def generate_cards(first_team: Team, images: tuple[str], rng: random.Random = random) -> Board:
+    deck = range(len(images))
+    draw = draw_cards(deck, first_team, rng)
     # Shuffle order for display
-    random.shuffle(draw)
+    rng.shuffle(draw)
 
-    cards = []
-    for team, i in draw:
-        cards.append(Card(team, images[i]))
-    return cards
+    deck = images if isinstance(images, tuple) else tuple(images)
+    return Board(deck, [i for _, i in draw], pack_teams([team for team, _ in draw]))
 
 
-def random_first_team() -> Team:
-    return Team.BLUE if random.randint(0, 1) == 0 else Team.RED
+def deal_cards(seed: int, images: tuple[str]) -> (Team, Board):
+    """First team and cards dealt by a generator with the given seed
+
+    The same seed and images always deal the same board.
+    """
+    rng = random.Random(seed)
+    first_team = random_first_team(rng)
+    board = generate_cards(first_team, images, rng)
+    board.seed = seed
+    return first_team, board
+
+
+def dump_game(game: Game) -> dict:
+    """Serialize a game to plain JSON-compatible data"""
+    match game.play_state:
+        case Matchmaking():
+            play_state = {'state': 'matchmaking'}
+        case SpymasterTurn(team):
+            play_state = {'state': 'spymaster', 'team': team}
+        case AgentTurn(team, actions):
+            play_state = {
+                'state': 'agents',
+                'team': team,
+                'hint': actions.hint,
+                'count': actions.count,
+                'guesses': actions.guesses,
+                'votes': [[card, sorted(voters)] for card, voters in actions.votes.items()]
+            }
+        case Win(team):
+            play_state = {'state': 'win', 'team': team}
+
+    return {
+        'game_id': game.game_id,
+        'collection': game.card_collection,
+        'seed': game.seed,
+        'players': [[c, n, game.client_to_id[c]] for c, n in game.client_to_name.items()],
+        'next_player_id': game.next_player_id,
+        'host': game.host,
+        'teams': {t.value: {'members': sorted(d.members), 'spymaster': d.spymaster} for t, d in game.teams.items()},
+        'play_state': play_state,
+        'board': game.cards.dump(),
+        'history': [[h.player_name, h.player_team, h.description, h.action, h.action_team] for h in game.history],
+        'history_start': game.history_start,
+        'history_first': game.history.first,
+        'version': game.version
+    }
+
+
+def load_game(data: dict, debug: bool = False) -> Game:
+    """Rebuild a game serialized by dump_game, including its derived state"""
+    # Dumps from before games were seeded get a new seed
+    game = Game(data['game_id'], data['collection'], debug, data.get('seed'))
+    for client, name, player_id in data['players']:
+        game.client_to_name[client] = sys.intern(name)
+        game.client_to_id[client] = player_id
+    game.next_player_id = data['next_player_id']
+    game.host = data['host']
+
+    for t, d in data['teams'].items():
+        game.teams[Team(t)].members = set(d['members'])
+        game.teams[Team(t)].spymaster = d['spymaster']
+        for client in d['members']:
+            game.roles[client] = Team(t)
+
+    if 'board' in data:
+        game.cards = Board.load(data['board'])
+    else:
+        # Dumped before boards were packed
+        game.cards = Board.from_cards([Card(Team(t), asset, hidden) for t, asset, hidden in data['cards']])
+    for t in [Team.BLUE, Team.RED]:
+        game.teams[t].cards_left = sum(1 for c in game.cards if c.team == t and c.hidden)
+
+    game.history = HistoryLog(data['history_start'])
+    # Entries before history_first were spilled to an archive
+    game.history.first = data.get('history_first', data['history_start'])
+    for name, player_team, description, action, action_team in data['history']:
+        game.history.append(name, history_team(player_team), description, action, history_team(action_team))
+
+    state = data['play_state']
+    match state['state']:
+        case 'matchmaking':
+            game.play_state = Matchmaking()
+        case 'spymaster':
+            game.play_state = SpymasterTurn(Team(state['team']))
+        case 'agents':
+            actions = AgentActions(state['hint'], state['count'])
+            actions.guesses = state['guesses']
+            for card, voters in state['votes']:
+                for client in voters:
+                    actions.toggle_vote(client, card)
+            game.play_state = AgentTurn(Team(state['team']), actions)
+        case 'win':
+            game.play_state = Win(Team(state['team']))
+
+    game.version = data['version']
+    if debug:
+        game.check_invariants()
+    return game
+
+
+def random_first_team(rng: random.Random = random) -> Team:
+    return Team.BLUE if rng.randint(0, 1) == 0 else Team.RED
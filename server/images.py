@@ -1,33 +1,219 @@
-import os
+from placeholder import encode
 from pathlib import Path
 
-def find_images(root: str) -> dict[str: list[str]]:
-    print(f'Searching for image collections in {root}')
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+try:
+    from PIL import ExifTags, Image, ImageOps
+except ImportError:
+    Image = None
+
+# Collections need enough images for a board
+MIN_IMAGES = 20
+IMAGE_SUFFIXES = ['.png', '.jpg', '.jpeg']
+# Longest side in pixels of the copy colors and placeholders are taken from
+SAMPLE_SIZE = 32
+# EXIF orientations that swap width and height
+TRANSPOSED = [5, 6, 7, 8]
+
+
+def ingest(path: Path, stat: os.stat_result) -> dict:
+    """Manifest entry of an image, with its metadata when Pillow is installed"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    entry = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'hash': hashlib.sha256(data).hexdigest()[:16],
+    }
+    if Image is not None:
+        entry['meta'] = image_meta(data)
+    return entry
+
+
+def image_meta(data: bytes) -> dict | None:
+    """Dimensions, dominant color and placeholder of an image
+
+    Dimensions are as displayed, after EXIF rotation. None if the image
+    can't be read.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            if image.getexif().get(ExifTags.Base.Orientation) in TRANSPOSED:
+                width, height = height, width
+            # JPEGs are decoded at a fraction of their size
+            image.draft('RGB', (SAMPLE_SIZE * 2, SAMPLE_SIZE * 2))
+            sample = ImageOps.exif_transpose(image).convert('RGB')
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    sample.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE))
+
+    quantized = sample.quantize(colors=8)
+    _, index = max(quantized.getcolors())
+    r, g, b = quantized.getpalette()[index * 3:index * 3 + 3]
+
+    rgb = sample.tobytes()
+    pixels = list(zip(rgb[0::3], rgb[1::3], rgb[2::3]))
+    x_components, y_components = (4, 3) if width >= height else (3, 4)
+    return {
+        'width': width,
+        'height': height,
+        'color': f'#{r:02x}{g:02x}{b:02x}',
+        'placeholder': encode(pixels, *sample.size, x_components, y_components),
+    }
+
+
+class ImageIndex:
+    """Every image collection under root, kept up to date as files change
 
-    collections = {}
-    collection_dirs = [f.name for f in os.scandir(root) if f.is_dir()]
+    Each collection is a directory of images. Its manifest in cache_dir
+    records the name, size, mtime and content hash of every image, along
+    with the directory's mtime. On startup a collection whose directory has
+    not changed since its manifest was written is taken from the manifest
+    without touching its files. Otherwise only new or changed files are
+    hashed again. With Pillow installed, entries also hold the metadata
+    clients lay out the board with, see image_meta().
 
-    for src in collection_dirs:
-        path = Path(root) / src
-        imgs = []
+    rescan() brings one collection up to date and is called by a watcher as
+    files change. images maps the name of every collection large enough to
+    play with to its image names. It and the manifests are replaced, never
+    changed, so they can be read from other threads without locking.
+    """
+    def __init__(self, root: str, cache_dir: str):
+        self.root = Path(root)
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.manifests: dict[str: dict] = {}
+        self.images: dict[str: tuple[str]] = {}
+
+    def load(self):
+        """Index every collection, reading unchanged ones from their manifests"""
+        start = time.perf_counter()
+        print(f'Searching for image collections in {self.root}')
+        hashed = 0
+        for name in self.collection_dirs():
+            hashed += self.rescan(name, trust_manifest=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f'Indexed {len(self.images)} collections, hashed {hashed} images in {elapsed:.1f} ms')
+
+    def collection_dirs(self) -> list[str]:
+        try:
+            return sorted(f.name for f in os.scandir(self.root) if f.is_dir())
+        except FileNotFoundError:
+            return []
+
+    def entries(self, collection: str) -> dict[str: dict]:
+        """Size, mtime and hash of each image of a collection, by name
+
+        Safe to call while another thread rescans, see the class docstring.
+        """
+        return self.manifests.get(collection, {}).get('images', {})
+
+    def get(self, collection: str, asset: str) -> dict | None:
+        """Metadata of an image, or None if it is unknown or unreadable"""
+        entry = self.entries(collection).get(asset)
+        return None if entry is None else entry.get('meta')
+
+    def rescan(self, collection: str, trust_manifest: bool = False) -> int:
+        """Bring one collection up to date, returning how many images were hashed
+
+        With trust_manifest a manifest written since the directory last
+        changed is used as it is.
+        """
+        with self.lock:
+            return self._rescan(collection, trust_manifest)
+
+    def _rescan(self, collection: str, trust_manifest: bool) -> int:
+        path = self.root / collection
+        manifest_path = self.cache_dir / f'{collection}.json'
+        try:
+            dir_mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._set_manifest(collection, None)
+            manifest_path.unlink(missing_ok=True)
+            self._publish()
+            return 0
+
+        manifest = self.manifests.get(collection)
+        if manifest is None:
+            try:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = {'dir_mtime_ns': None, 'images': {}}
+
+        if trust_manifest and manifest['dir_mtime_ns'] == dir_mtime:
+            self._set_manifest(collection, manifest)
+            self._publish()
+            return 0
+        hashed = self._scan(collection, path, manifest_path, dir_mtime, manifest['images'])
+        if len(self.manifests[collection]['images']) < MIN_IMAGES:
+            print(f'Not enough images in collection {collection}')
+        return hashed
+
+    def _scan(self, collection: str, path: Path, manifest_path: Path, dir_mtime: int, old: dict) -> int:
+        images = {}
+        hashed = 0
         for f in os.scandir(path):
             if not f.is_file(follow_symlinks=False):
                 continue
-            elif Path(f.name).suffix not in ['.png', '.jpg', '.jpeg']:
+            elif Path(f.name).suffix.lower() not in IMAGE_SUFFIXES:
                 continue
-            else:
-                imgs.append(f.name)
 
-        if len(imgs) >= 20:
-            collections[src] = imgs
+            stat = f.stat()
+            entry = old.get(f.name)
+            if (entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns
+                    or (Image is not None and 'meta' not in entry)):
+                try:
+                    entry = ingest(path / f.name, stat)
+                except OSError:
+                    # Removed while scanning
+                    continue
+                hashed += 1
+            images[f.name] = entry
+
+        manifest = {'dir_mtime_ns': dir_mtime, 'images': images}
+        if manifest != self.manifests.get(collection):
+            # Workers of a cluster share the cache
+            tmp = manifest_path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(manifest, f, separators=(',', ':'))
+            os.replace(tmp, manifest_path)
+        self._set_manifest(collection, manifest)
+        self._publish()
+        return hashed
+
+    def _set_manifest(self, collection: str, manifest: dict | None):
+        """Swap in manifests with that of collection replaced, or removed if None"""
+        manifests = dict(self.manifests)
+        if manifest is None:
+            manifests.pop(collection, None)
         else:
-            print(f'Not enough images in collection {src}')
+            manifests[collection] = manifest
+        self.manifests = manifests
 
-    return collections
+    def _publish(self):
+        images = {}
+        for name, manifest in self.manifests.items():
+            if len(manifest['images']) >= MIN_IMAGES:
+                names = tuple(sorted(manifest['images']))
+                # Kept while unchanged, boards dealt from it share it as their deck
+                old = self.images.get(name)
+                images[name] = old if old == names else names
+        self.images = images
 
 
 def main():
-    print(find_images('./static/cards'))
+    index = ImageIndex('./static/cards', './cache/images')
+    index.load()
+    print(index.images)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,248 @@
+from game import (
+    Board,
+    Card,
+    Game,
+    Team,
+
+    dump_game,
+    load_game,
+)
+
+from pathlib import Path
+
+import json
+import os
+import threading
+import time
+
+SNAPSHOT_FILE = 'snapshot.json'
+
+
+def log_file(index: int) -> str:
+    return f'journal.{index}.log'
+
+
+def encode_args(op: str, args: tuple) -> list:
+    match op:
+        case 'start_game':
+            first_team, board = args
+            if not isinstance(board, Board):
+                board = Board.from_cards(board)
+            return [first_team, *board.dump()]
+        case _:
+            return list(args)
+
+
+def replay(game: Game, op: str, args: list):
+    """Apply a recorded call to a game"""
+    match op:
+        case 'start_game':
+            match args:
+                case [first_team, cards]:
+                    # Logged before boards were packed
+                    board = [Card(Team(t), asset, hidden) for t, asset, hidden in cards]
+                case [first_team, *board]:
+                    board = Board.load(board)
+            game.start_game(Team(first_team), board)
+        case _:
+            getattr(game, op)(*args)
+
+
+class Journal:
+    """Write-ahead log of every state change to the games of a Cafe
+
+    Calls to Game are appended to a log as they happen. The log is written
+    out and fsynced once sync_every records pile up, or every sync_interval
+    seconds from a background thread, whichever comes first. Once
+    snapshot_every records pile up the background thread also writes all
+    games to a snapshot, which bounds how much log a restore has to replay.
+
+    Snapshots are taken while games keep changing. A snapshot starts a new
+    log and then dumps each game under its own lock, noting the sequence
+    number of the last record applied to it. Restoring replays the logs
+    from the one the snapshot started, skipping records a game's dump
+    already covers. Older logs are deleted once the snapshot is written.
+    """
+    def __init__(self, root: str, sync_every: int = 64, sync_interval: float = 0.05, snapshot_every: int = 10000):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+
+        self.seq = 0
+        self.log_index = 0
+        # Sequence number of the last record of each game
+        self.last_seq: dict[int: int] = {}
+        self.since_snapshot = 0
+        # Ids reserved for games not created yet, with when the reservation
+        # expires, None if logged without
+        self.reservations: dict[int: float | None] = {}
+        self.pending: list[str] = []
+        self.lock = threading.Lock()
+        self.log = None
+
+    def restore(self, debug: bool = False) -> (dict[int: Game], int):
+        """Load the latest snapshot and replay the logs after it
+
+        Returns the restored games and the next free game id, reservations
+        are left in reservations. Must be called before anything is recorded.
+        """
+        start = time.perf_counter()
+        games = {}
+        id_counter = 0
+        covered = {}
+
+        snapshot = self.root / SNAPSHOT_FILE
+        if snapshot.exists():
+            with open(snapshot) as f:
+                data = json.load(f)
+            self.log_index = data['log']
+            id_counter = data['id_counter']
+            for game_data in data['games']:
+                game = load_game(game_data, debug)
+                games[game.game_id] = game
+            covered = {int(i): seq for i, seq in data['seqs'].items()}
+            self.last_seq = dict(covered)
+            self.reservations = {int(i): t for i, t in data.get('reservations', {}).items()}
+
+        replayed = 0
+        logs = sorted(int(p.name.split('.')[1]) for p in self.root.glob('journal.*.log'))
+        for index in logs:
+            if index < self.log_index:
+                continue
+            self.log_index = index
+            with open(self.root / log_file(index)) as f:
+                for line in f:
+                    try:
+                        seq, game_id, op, args = json.loads(line)
+                    except ValueError:
+                        # Torn write at the end of the log
+                        break
+                    self.seq = max(self.seq, seq + 1)
+                    self.last_seq[game_id] = seq
+                    id_counter = max(id_counter, game_id + 1)
+                    # The snapshot has the reservations as of the log it started
+                    self.track(game_id, op, args)
+                    if seq <= covered.get(game_id, -1):
+                        continue
+
+                    replayed += 1
+                    match op:
+                        case 'create':
+                            # Logged without a seed before games were seeded
+                            seed = args[0] if len(args) > 0 else None
+                            games[game_id] = Game(game_id, debug=debug, seed=seed)
+                        case 'delete':
+                            games.pop(game_id, None)
+                        case 'load':
+                            games[game_id] = load_game(args[0], debug)
+                        case 'reserve' | 'release':
+                            pass
+                        case _ if game_id not in games:
+                            # Deleted while a snapshot was being taken
+                            pass
+                        case _:
+                            try:
+                                replay(games[game_id], op, args)
+                            except Exception as e:
+                                print(f'Failed to replay {op} on game {game_id}: {e!r}')
+
+        self.seq = max([self.seq, *[seq + 1 for seq in covered.values()]])
+        self.since_snapshot = replayed
+        self.log = open(self.root / log_file(self.log_index), 'a')
+
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f'Restored {len(games)} games, replayed {replayed} log records in {elapsed:.1f} ms')
+        return games, id_counter
+
+    def track(self, game_id: int, op: str, args: list):
+        """Follow reservations through a record"""
+        match op:
+            case 'reserve':
+                self.reservations[game_id] = args[0] if len(args) > 0 else None
+            case 'release' | 'create' | 'load':
+                self.reservations.pop(game_id, None)
+
+    def start(self, source=None):
+        """Start syncing in the background
+
+        source returns the games to snapshot and the next free game id. The
+        games may be yielded one at a time while holding each game's lock.
+        Without a source no snapshots are taken.
+        """
+        threading.Thread(target=self._background, args=(source,), daemon=True).start()
+
+    def record(self, game_id: int, op: str, *args):
+        """Append a call to the log"""
+        args = encode_args(op, args)
+        with self.lock:
+            line = json.dumps([self.seq, game_id, op, args])
+            if op == 'delete':
+                self.last_seq.pop(game_id, None)
+            else:
+                self.last_seq[game_id] = self.seq
+            self.track(game_id, op, args)
+            self.seq += 1
+            self.since_snapshot += 1
+            self.pending.append(line)
+            if len(self.pending) >= self.sync_every:
+                self._sync()
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    def _sync(self):
+        if len(self.pending) == 0:
+            return
+        self.log.write('\n'.join(self.pending) + '\n')
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        self.pending = []
+
+    def _background(self, source):
+        while True:
+            time.sleep(self.sync_interval)
+            self.sync()
+            if source is not None and self.since_snapshot >= self.snapshot_every:
+                self.snapshot(*source())
+
+    def snapshot(self, games, id_counter: int):
+        """Write all games to a new snapshot and start a new log"""
+        start = time.perf_counter()
+        with self.lock:
+            self._sync()
+            self.log.close()
+            self.log_index += 1
+            self.log = open(self.root / log_file(self.log_index), 'w')
+            self.since_snapshot = 0
+            reservations = dict(self.reservations)
+
+        dumps = []
+        seqs = {}
+        for game in games:
+            with self.lock:
+                seqs[game.game_id] = self.last_seq.get(game.game_id, -1)
+            dumps.append(dump_game(game))
+
+        data = {
+            'log': self.log_index,
+            'seqs': seqs,
+            'id_counter': id_counter,
+            'reservations': reservations,
+            'games': dumps
+        }
+        tmp = self.root / (SNAPSHOT_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.root / SNAPSHOT_FILE)
+
+        for path in self.root.glob('journal.*.log'):
+            if int(path.name.split('.')[1]) < self.log_index:
+                path.unlink()
+
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f'Snapshot of {len(dumps)} games written in {elapsed:.1f} ms')
@@ -0,0 +1,283 @@
+"""Load a running server with scripted games over real Socket.IO connections
+
+Each game is created through /create_game and joined by --players clients,
+connected to the worker the game went to. Clients follow redirects to other
+workers, joining the game again there.
+The host randomizes the teams, picks a card collection and starts the game.
+Spymasters give hints and agents vote and reveal random hidden cards
+until a team wins, for --rounds games in a row. Games are played
+concurrently, one action at a time within each game.
+
+Every client keeps its view of the game up to date from the patches it
+receives, the way the frontend does, and asks for a full view if it misses
+a version. Latency is measured per event type, from the emit to the
+matching update_* message arriving at the acting client. Messages and bytes
+are counted over every connection. Bytes are the JSON encoded payloads, not
+including Socket.IO framing.
+
+Needs the packages in requirements-dev.txt and a server with at least one
+card collection.
+
+Example:
+python loadgen.py --url http://127.0.0.1:5001/ --games 500 --players 6
+"""
+from delta import apply
+
+import argparse
+import asyncio
+import json
+import random
+import socketio
+import time
+import urllib.request
+
+# The message each event is answered with
+REPLIES = {
+    'join': 'update_game',
+    'randomize_teams': 'update_teams',
+    'switch_collection': 'update_game',
+    'start_game': 'update_game',
+    'give_hint': 'new_turn',
+    'vote': 'update_vote',
+    'reveal_card': 'update_card',
+    'end_guessing': 'new_turn',
+    'reset_game': 'update_game',
+}
+
+# Messages carrying a full view or a patch of one
+UPDATES = {'update_game', 'update_teams', 'new_turn', 'update_vote', 'update_card', 'update_atlas'}
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: dict[str: list[float]] = {}
+        self.received = 0
+        self.received_bytes = 0
+        self.sent = 0
+        self.errors = 0
+        self.syncs = 0
+        self.games = 0
+
+    def add(self, event: str, ms: float):
+        self.latencies.setdefault(event, []).append(ms)
+
+
+class Player:
+    """One connection playing in one game"""
+    def __init__(self, name: str, stats: Stats, timeout: float):
+        self.name = name
+        self.stats = stats
+        self.timeout = timeout
+        self.client = None
+        self.game_id = None
+        self.player_id = None
+        self.view = None
+        self.version = -1
+        # Reply awaited by the current request and its future
+        self.waiting = None
+
+    async def connect(self, url: str):
+        self.client = socketio.AsyncClient(reconnection=False)
+        self.client.on('*', self.on_message)
+        await self.client.connect(url, transports=['websocket'], wait_timeout=self.timeout)
+
+    async def request(self, event: str, data: dict):
+        """Emit an event and wait for the reply, timing the round trip
+
+        When redirected to another worker, the player connects there, joins
+        the game again and repeats the event. The time taken counts.
+        """
+        reply = REPLIES[event]
+        start = time.perf_counter()
+        while True:
+            future = asyncio.get_running_loop().create_future()
+            self.waiting = (reply, future)
+            self.stats.sent += 1
+            await self.client.emit(event, {'game_id': self.game_id} | data)
+            try:
+                answer, payload = await asyncio.wait_for(future, self.timeout)
+            finally:
+                self.waiting = None
+            if answer != 'redirect':
+                break
+            await self.move(payload['url'])
+            if event != 'join':
+                await self.request('join', {'name': self.name})
+        self.stats.add(event, (time.perf_counter() - start) * 1000)
+
+    async def move(self, url: str):
+        """Connect to the worker at url instead, starting over with no view"""
+        await self.client.disconnect()
+        self.view = None
+        self.version = -1
+        await self.connect(url)
+
+    async def on_message(self, event: str, data=None):
+        self.stats.received += 1
+        self.stats.received_bytes += len(json.dumps(data, separators=(',', ':')))
+
+        if event in UPDATES and isinstance(data, dict) and data.get('game_id') == self.game_id:
+            await self.update(data)
+
+        if self.waiting is None:
+            return
+        reply, future = self.waiting
+        if future.done():
+            return
+        # Updates merged with others of a different kind arrive as update_game
+        if event == reply or event == 'update_game':
+            future.set_result((event, data))
+        elif event == 'redirect' and isinstance(data, dict) and data.get('game_id') == self.game_id:
+            future.set_result((event, data))
+        elif event in ['error', 'schema_error']:
+            self.stats.errors += 1
+            future.set_exception(RuntimeError(f'{self.name}: {data}'))
+
+    async def update(self, data: dict):
+        if 'ops' not in data:
+            self.player_id = data['self']
+            self.view = {'game': data['game'], 'spymaster_vision': data['spymaster_vision']}
+        elif self.view is None:
+            return
+        elif data['base'] != self.version:
+            self.stats.syncs += 1
+            self.stats.sent += 1
+            await self.client.emit('sync', {'game_id': self.game_id})
+            return
+        else:
+            self.view = apply(self.view, data['ops'])
+        self.version = data['version']
+
+    @property
+    def game(self) -> dict:
+        return self.view['game']
+
+
+def play_state(game: dict) -> (str, str):
+    """The team and phase of a game view, like ('blue', 'agents')"""
+    team, _, phase = game['play_state'].rpartition('_')
+    return team.lower().removeprefix('team.'), phase
+
+
+def post(url: str) -> dict:
+    req = urllib.request.Request(url, method='POST')
+    with urllib.request.urlopen(req, timeout=10) as response:
+        return json.load(response)
+
+
+def get(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.load(response)
+
+
+async def play_game(url: str, index: int, collection: str, args, stats: Stats, connecting: asyncio.Semaphore):
+    players = [Player(f'load{index}_{i}', stats, args.timeout) for i in range(args.players)]
+    created = await asyncio.to_thread(post, url + 'create_game')
+    game_id = created['game_id']
+    # Games are spread over the workers, players go to the one owning theirs
+    async with connecting:
+        await asyncio.gather(*[p.connect(created.get('url') or url) for p in players])
+    try:
+        for player in players:
+            player.game_id = game_id
+            await player.request('join', {'name': player.name})
+
+        host = players[0]
+        by_id = {p.player_id: p for p in players}
+        await host.request('randomize_teams', {})
+        await host.request('switch_collection', {'collection': collection})
+
+        for _ in range(args.rounds):
+            await host.request('start_game', {})
+            # Only the last player to act is sure to have seen its result
+            current = host
+            while True:
+                team, phase = play_state(current.game)
+                if phase == 'win':
+                    break
+
+                members = current.game['teams'][team]
+                if phase == 'spymaster':
+                    current = by_id[members['spymaster']['id']]
+                    await current.request('give_hint', {'hint': 'load', 'count': random.randint(1, 3)})
+                    continue
+
+                hidden = [i for i, c in enumerate(current.game['cards']) if c['hidden']]
+                current = by_id[random.choice(members['agents'])['id']]
+                if random.random() < args.end_chance:
+                    await current.request('end_guessing', {})
+                    continue
+
+                card = random.choice(hidden)
+                await current.request('vote', {'card': card})
+                await current.request('reveal_card', {'card': card})
+            stats.games += 1
+            await host.request('reset_game', {})
+    finally:
+        for player in players:
+            if player.client is not None:
+                await player.client.disconnect()
+
+
+def percentile(samples: list[float], p: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def report(stats: Stats, elapsed: float, connections: int):
+    print(f'{connections} connections, {stats.games} games played in {elapsed:.1f} s')
+    print(f'{"event":<18}{"count":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+    for event in REPLIES:
+        samples = sorted(stats.latencies.get(event, []))
+        if len(samples) == 0:
+            continue
+        p50, p95, p99 = [percentile(samples, p) for p in [0.5, 0.95, 0.99]]
+        print(f'{event:<18}{len(samples):>8}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}')
+    print(f'sent {stats.sent / elapsed:.0f} msg/s, received {stats.received / elapsed:.0f} msg/s '
+          f'and {stats.received_bytes / elapsed / 1024:.0f} KiB/s')
+    print(f'{stats.errors} errors, {stats.syncs} resyncs')
+
+
+async def run(args):
+    url = args.url if args.url.endswith('/') else args.url + '/'
+    collections = (await asyncio.to_thread(get, url + 'card_collections'))['collections']
+    if len(collections) == 0:
+        raise SystemExit('The server has no card collections to play with')
+    collection = args.collection or collections[0]
+
+    stats = Stats()
+    # Limits how many games connect at once, the rest wait their turn
+    connecting = asyncio.Semaphore(args.batch)
+
+    async def game(index: int):
+        try:
+            await play_game(url, index, collection, args, stats, connecting)
+        except Exception as e:
+            stats.errors += 1
+            print(f'Game {index} failed: {e!r}')
+
+    start = time.perf_counter()
+    await asyncio.gather(*[game(i) for i in range(args.games)])
+    report(stats, time.perf_counter() - start, args.games * args.players)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play scripted games against a running server')
+    parser.add_argument('--url', default='http://127.0.0.1:5001/')
+    parser.add_argument('--games', type=int, default=50, help='Games played at once')
+    parser.add_argument('--players', type=int, default=4, help='Players per game, at least 4')
+    parser.add_argument('--rounds', type=int, default=1, help='Games played in a row by each group')
+    parser.add_argument('--batch', type=int, default=50, help='Games connecting at once')
+    parser.add_argument('--collection', help='Card collection, the first one by default')
+    parser.add_argument('--end-chance', type=float, default=0.1, help='Chance agents end their turn early')
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    if args.players < 4:
+        parser.error('--players must be at least 4')
+
+    random.seed(args.seed)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+from game import Game
+from views import lobby_info
+
+from bisect import bisect_left, bisect_right
+from heapq import merge
+
+import hashlib
+import json
+import secrets
+import threading
+
+STATES = ['waiting', 'playing']
+# Games per page of the listing, unless asked for fewer
+PAGE = 50
+MAX_PAGE = 200
+
+
+def parse_query(params) -> (str | None, int, int):
+    """State, cursor and limit of a listing from query parameters
+
+    Raises ValueError if they make no sense.
+    """
+    state = params.get('state') or None
+    if state is not None and state not in STATES:
+        raise ValueError(f'Unknown state {state}')
+    after = int(params.get('after', -1))
+    limit = int(params.get('limit', PAGE))
+    if not 0 < limit <= MAX_PAGE:
+        raise ValueError(f'Limit must be from 1 to {MAX_PAGE}')
+    return state, after, limit
+
+
+def encode(listing: dict) -> bytes:
+    return json.dumps(listing, separators=(',', ':')).encode()
+
+
+def content_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+
+
+def merge_pages(pages: list[dict], limit: int) -> dict:
+    """One page of the games listed by several workers, for the same query
+
+    A worker with more games only listed games up to its cursor, so the
+    merged page stops there too.
+    """
+    cursors = [p['next'] for p in pages if p['next'] is not None]
+    bound = min(cursors) if len(cursors) > 0 else None
+    games = sorted((g for p in pages for g in p['games'] if bound is None or g['game_id'] <= bound),
+                   key=lambda g: g['game_id'])
+    more = bound is not None or len(games) > limit
+    games = games[:limit]
+    return {'games': games, 'next': games[-1]['game_id'] if more and len(games) > 0 else None}
+
+
+class LobbyIndex:
+    """Listing of the games of a Cafe, kept up to date as they change
+
+    Game ids are kept in order per state, so a page of games after a cursor
+    costs the page rather than every game. Each state has a version bumped
+    when a game in it is added, removed or changes, and encoded pages are
+    cached along with an ETag naming the versions they were built from.
+    Pages are only rebuilt once what they list changes.
+    """
+    def __init__(self, cache_size: int = 256):
+        self.lock = threading.Lock()
+        self.entries: dict[int: dict] = {}
+        self.ids: dict[str: list[int]] = {s: [] for s in STATES}
+        self.versions: dict[str: int] = {s: 0 for s in STATES}
+        # Versions start over with the process, ETags must not
+        self.epoch = secrets.token_hex(4)
+        self.pages: dict[tuple: (str, bytes)] = {}
+        self.cache_size = cache_size
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def update(self, game: Game):
+        entry = lobby_info(game)
+        game_id = game.game_id
+        with self.lock:
+            old = self.entries.get(game_id)
+            if old == entry:
+                return
+            if old is not None:
+                self._remove(old)
+            self.entries[game_id] = entry
+            ids = self.ids[entry['state']]
+            ids.insert(bisect_left(ids, game_id), game_id)
+            self.versions[entry['state']] += 1
+
+    def remove(self, game_id: int):
+        with self.lock:
+            old = self.entries.pop(game_id, None)
+            if old is not None:
+                self._remove(old)
+
+    def _remove(self, entry: dict):
+        ids = self.ids[entry['state']]
+        del ids[bisect_left(ids, entry['game_id'])]
+        self.versions[entry['state']] += 1
+
+    def page(self, state: str | None, after: int = -1, limit: int = PAGE) -> dict:
+        """Up to limit games with ids above after, and the cursor of the next page"""
+        states = STATES if state is None else [state]
+        with self.lock:
+            # Taking one more tells whether there is a next page
+            runs = []
+            for ids in (self.ids[s] for s in states):
+                start = bisect_right(ids, after)
+                runs.append(ids[start:start + limit + 1])
+            game_ids = list(merge(*runs))[:limit + 1]
+            games = [self.entries[i] for i in game_ids[:limit]]
+        more = len(game_ids) > limit
+        return {'games': games, 'next': game_ids[limit - 1] if more else None}
+
+    def listing(self, state: str | None, after: int = -1, limit: int = PAGE) -> (str, bytes):
+        """ETag and encoded page of the listing, see page"""
+        states = STATES if state is None else [state]
+        key = (state, after, limit)
+        with self.lock:
+            etag = f'"{self.epoch}-' + '-'.join(str(self.versions[s]) for s in states) + '"'
+            cached = self.pages.get(key)
+        if cached is not None and cached[0] == etag:
+            return cached
+
+        # Changes made meanwhile bump the versions, and the page is built again
+        # on the next request
+        body = encode(self.page(state, after, limit))
+        with self.lock:
+            if len(self.pages) >= self.cache_size:
+                self.pages.clear()
+            self.pages[key] = (etag, body)
+        return etag, body
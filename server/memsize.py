@@ -0,0 +1,81 @@
+"""Report the memory each game takes
+
+Builds games like bench_game.py does, in their first agent turn with every
+blue agent voting, and reports the bytes reachable from each game at each
+of the --history lengths. Objects shared between games are left out: the
+deck of image names, teams and other enum members, classes and functions.
+Also reports how long the game's dump is, as written to snapshots. With
+--window, games spill history beyond it to a HistoryArchive in a temporary
+directory, as Cafe has them do with CODEPICS_HISTORY_DIR.
+
+Needs the packages in requirements.txt, like bench_game.py.
+
+Example:
+python memsize.py --players 8 --history 0 100 1000 10000 --window 200
+"""
+from archive import HistoryArchive
+from bench_game import IMAGES, agents, make_game, own_cards
+from game import Team, dump_game
+
+from enum import Enum
+from types import FunctionType, ModuleType
+
+import argparse
+import gc
+import json
+import sys
+import tempfile
+
+
+def deep_size(root, shared: set[int]) -> int:
+    """Bytes of root and everything it refers to, except shared objects by id"""
+    seen = set(shared)
+    pending = [root]
+    size = 0
+    while len(pending) > 0:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, (type, ModuleType, FunctionType, Enum)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        pending.extend(gc.get_referents(obj))
+    return size
+
+
+def measure(players: int, history: int, archive: HistoryArchive | None) -> (int, int):
+    """Bytes in memory and bytes of the dump of one game"""
+    game = make_game(players, history)
+    if archive is not None:
+        game.history.attach(archive.for_game(game.game_id), archive.window)
+    card = own_cards(game, Team.BLUE)[0]
+    for client in agents(game, Team.BLUE):
+        game.vote(client, card)
+    return deep_size(game, {id(IMAGES)}), len(json.dumps(dump_game(game), separators=(',', ':')))
+
+
+def report(player_counts: list[int], history_lengths: list[int], archive: HistoryArchive | None):
+    print(f'{"players":>8}{"history":>10}{"bytes":>12}{"per entry":>12}{"dump":>12}')
+    for players in player_counts:
+        empty = None
+        for history in history_lengths:
+            size, dumped = measure(players, history, archive)
+            if history == 0:
+                empty = size
+            per_entry = '-' if empty is None or history == 0 else f'{(size - empty) / history:.1f}'
+            print(f'{players:>8}{history:>10}{size:>12}{per_entry:>12}{dumped:>12}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report the memory taken per game')
+    parser.add_argument('--players', type=int, nargs='+', default=[8])
+    parser.add_argument('--history', type=int, nargs='+', default=[0, 100, 1000, 10000])
+    parser.add_argument('--window', type=int, help='History entries kept in memory, all without')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        archive = None if args.window is None else HistoryArchive(root, args.window)
+        report(args.players, args.history, archive)
+
+
+if __name__ == '__main__':
+    main()
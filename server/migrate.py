@@ -0,0 +1,115 @@
+from game import Game, dump_game
+
+import json
+import os
+import socket
+import struct
+import threading
+
+# Frames are a 4 byte big-endian length followed by that many bytes of JSON
+HEADER = struct.Struct('>I')
+
+
+class MigrationError(Exception):
+    pass
+
+
+def pack_game(game: Game, clients: list[str]) -> dict:
+    """Everything another process needs to take over a game
+
+    clients are the sockets connected to the game here. They cannot follow
+    the game, but are kept so the target knows which seats are waiting for
+    their players. Rooms are not sent, they are rebuilt from the teams as
+    players join again.
+    """
+    return {
+        'game': dump_game(game),
+        'clients': clients
+    }
+
+
+def send_frame(sock: socket.socket, data: dict):
+    body = json.dumps(data, separators=(',', ':')).encode()
+    sock.sendall(HEADER.pack(len(body)) + body)
+
+
+def recv_frame(sock: socket.socket) -> dict:
+    def recv_exactly(n: int) -> bytes:
+        buf = b''
+        while len(buf) < n:
+            chunk = sock.recv(n - len(buf))
+            if not chunk:
+                raise MigrationError('Connection closed mid-frame')
+            buf += chunk
+        return buf
+
+    size, = HEADER.unpack(recv_exactly(HEADER.size))
+    return json.loads(recv_exactly(size))
+
+
+def send_game(path: str, data: dict, timeout: float = 5.0):
+    """Hand a packed game to the process listening on path
+
+    Returns once the target has taken over the game, raises MigrationError
+    if it did not.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            send_frame(sock, data)
+            reply = recv_frame(sock)
+    except OSError as e:
+        raise MigrationError(f'Could not reach {path}: {e}')
+
+    if not reply.get('ok'):
+        raise MigrationError(reply.get('error', 'Game refused'))
+
+
+class MigrationListener:
+    """Accepts games sent by other processes on a Unix socket
+
+    on_game is called with each packed game from its own thread, and the
+    sender is only told the migration succeeded once it returns. Anything it
+    raises is reported back to the sender.
+    """
+    def __init__(self, path: str, on_game):
+        self.path = path
+        self.on_game = on_game
+
+        if os.path.exists(path):
+            os.unlink(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen()
+
+    def start(self):
+        threading.Thread(target=self.serve, daemon=True).start()
+        return self
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                # Closed
+                return
+            with conn:
+                try:
+                    data = recv_frame(conn)
+                except (OSError, MigrationError):
+                    continue
+                try:
+                    self.on_game(data)
+                    reply = {'ok': True}
+                except Exception as e:
+                    reply = {'ok': False, 'error': repr(e)}
+                try:
+                    send_frame(conn, reply)
+                except OSError:
+                    pass
+
+    def close(self):
+        self.sock.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
@@ -0,0 +1,73 @@
+"""Tiny placeholders for images, in the BlurHash format
+
+A placeholder is a short string holding the few lowest frequencies of an
+image, enough to draw a blurred version of it before it loads. The
+frontend decodes them in placeholder.ts. See https://blurha.sh for the
+format.
+"""
+import math
+
+BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def base83(value: int, length: int) -> str:
+    return ''.join(BASE83[value // 83 ** (length - i - 1) % 83] for i in range(length))
+
+
+def srgb_to_linear(value: int) -> float:
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def linear_to_srgb(value: float) -> int:
+    v = min(1.0, max(0.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def sign_pow(value: float, exp: float) -> float:
+    return math.copysign(abs(value) ** exp, value)
+
+
+def encode(pixels: list[tuple[int, int, int]], width: int, height: int, x_components: int = 4, y_components: int = 3) -> str:
+    """Placeholder of an image given as rows of RGB pixels
+
+    Images are meant to be shrunk to a few dozen pixels first, the result
+    barely changes and encoding is much faster.
+    """
+    linear = [tuple(srgb_to_linear(c) for c in p) for p in pixels]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[i][x] * cos_y[j][y]
+                    pr, pg, pb = linear[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = (1 if i == 0 and j == 0 else 2) / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if len(ac) > 0:
+        quantised_max = max(0, min(82, int(max(abs(c) for f in ac for c in f) * 166 - 0.5)))
+        maximum = (quantised_max + 1) / 166
+        result += base83(quantised_max, 1)
+    else:
+        maximum = 1
+        result += base83(0, 1)
+
+    r, g, b = dc
+    result += base83((linear_to_srgb(r) << 16) + (linear_to_srgb(g) << 8) + linear_to_srgb(b), 4)
+    for f in ac:
+        q = [max(0, min(18, int(sign_pow(c / maximum, 0.5) * 9 + 9.5))) for c in f]
+        result += base83(q[0] * 19 * 19 + q[1] * 19 + q[2], 2)
+    return result
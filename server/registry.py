@@ -0,0 +1,137 @@
+from game import Game
+
+from contextlib import contextmanager
+
+import threading
+
+
+class GameLock:
+    """Serializes events for one game
+
+    Reentrant, since handlers call each other. depth is only touched by the
+    thread holding the lock.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.depth = 0
+
+
+class Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.games: dict[int: Game] = {}
+        self.locks: dict[int: GameLock] = {}
+
+
+class GameRegistry:
+    """Games of a Cafe, split into shards by game id
+
+    Each shard guards its own dict, so looking up or adding games only
+    contends with games in the same shard. lock(game_id) serializes
+    everything done to one game while events for different games run in
+    parallel. Otherwise it works like a dict of games.
+    """
+    def __init__(self, shards: int = 16):
+        self.shards = [Shard() for _ in range(shards)]
+
+    def shard(self, game_id: int) -> Shard:
+        return self.shards[game_id % len(self.shards)]
+
+    @contextmanager
+    def lock(self, game_id: int):
+        """Hold the lock of a game, whether or not it exists yet"""
+        shard = self.shard(game_id)
+        while True:
+            with shard.lock:
+                game_lock = shard.locks.setdefault(game_id, GameLock())
+            game_lock.lock.acquire()
+            with shard.lock:
+                # Dropped while we waited, a new lock guards the game now
+                if shard.locks.get(game_id) is game_lock:
+                    break
+            game_lock.lock.release()
+
+        game_lock.depth += 1
+        try:
+            yield
+        finally:
+            game_lock.depth -= 1
+            if game_lock.depth == 0:
+                with shard.lock:
+                    if game_id not in shard.games:
+                        del shard.locks[game_id]
+            game_lock.lock.release()
+
+    def locked_values(self):
+        """Yield every game while holding its lock"""
+        for game_id in list(self):
+            with self.lock(game_id):
+                game = self.get(game_id)
+                if game is not None:
+                    yield game
+
+    def get(self, game_id: int, default: Game = None) -> Game:
+        shard = self.shard(game_id)
+        with shard.lock:
+            return shard.games.get(game_id, default)
+
+    def pop(self, game_id: int, default: Game = None) -> Game:
+        shard = self.shard(game_id)
+        with shard.lock:
+            return shard.games.pop(game_id, default)
+
+    def values(self) -> list[Game]:
+        games = []
+        for shard in self.shards:
+            with shard.lock:
+                games.extend(shard.games.values())
+        return games
+
+    def items(self) -> list[(int, Game)]:
+        return [(g.game_id, g) for g in self.values()]
+
+    def __getitem__(self, game_id: int) -> Game:
+        shard = self.shard(game_id)
+        with shard.lock:
+            return shard.games[game_id]
+
+    def __setitem__(self, game_id: int, game: Game):
+        shard = self.shard(game_id)
+        with shard.lock:
+            shard.games[game_id] = game
+
+    def __delitem__(self, game_id: int):
+        shard = self.shard(game_id)
+        with shard.lock:
+            del shard.games[game_id]
+
+    def __contains__(self, game_id: int) -> bool:
+        shard = self.shard(game_id)
+        with shard.lock:
+            return game_id in shard.games
+
+    def __iter__(self):
+        return iter([g.game_id for g in self.values()])
+
+    def __len__(self) -> int:
+        return sum(len(shard.games) for shard in self.shards)
+
+
+class IdAllocator:
+    """Hands out game ids start, start + step, start + 2 * step, ..."""
+    def __init__(self, start: int, step: int):
+        self.lock = threading.Lock()
+        self.next_id = start
+        self.step = step
+
+    def allocate(self) -> int:
+        with self.lock:
+            game_id = self.next_id
+            self.next_id += self.step
+            return game_id
+
+    def skip(self, game_id: int):
+        """Never hand out ids up to game_id"""
+        with self.lock:
+            while self.next_id <= game_id:
+                self.next_id += self.step
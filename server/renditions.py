@@ -0,0 +1,203 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import fcntl
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import time
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Longest side in pixels of each rendition, a tile for the board and a larger
+# one for the hover preview
+SIZES = {
+    'tile': 320,
+    'preview': 1024,
+}
+
+# Every rendition is written in each format, browsers without WebP get the
+# fallback. Format name, file extension and save options.
+FORMATS = [
+    ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    ('JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+]
+
+MANIFEST_FILE = 'manifest.json'
+LOCK_FILE = '.lock'
+
+
+def rendition_names(digest: str) -> dict[str: dict[str: str]]:
+    """File names of every rendition of an image with the given content hash
+
+    Names include the size, so changing SIZES produces new files rather than
+    stale ones cached under the same name.
+    """
+    return {
+        name: {ext: f'{digest}-{name}{size}.{ext}' for _, ext, _ in FORMATS}
+        for name, size in SIZES.items()
+    }
+
+
+def render(src: str, out_dir: str) -> (str, dict):
+    """Render an image into out_dir, returning its content hash and renditions
+
+    Runs in a worker process. Renditions already on disk are not rendered
+    again, as their names follow from the content.
+    """
+    with open(src, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    names = rendition_names(digest)
+    out = Path(out_dir)
+    if all((out / n).exists() for formats in names.values() for n in formats.values()):
+        return digest, names
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for name, size in SIZES.items():
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            for fmt, ext, options in FORMATS:
+                path = out / names[name][ext]
+                tmp = path.with_suffix(path.suffix + '.tmp')
+                resized.save(tmp, fmt, **options)
+                os.replace(tmp, path)
+    return digest, names
+
+
+def pool_context():
+    """Start workers by forking where possible
+
+    app.py and asgi.py set up the whole server when imported, which workers
+    started by spawning would do again.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+def start_pool(workers: int = None) -> ProcessPoolExecutor:
+    """A process pool with its workers started right away
+
+    A forked child only has the thread that forked it, so any lock another
+    thread held at the time stays locked in the child for good. Starting
+    the workers before the server starts its threads keeps forking safe.
+    Later tasks reuse the same workers.
+    """
+    pool = ProcessPoolExecutor(workers, mp_context=pool_context())
+    # Forking pools start every worker along with the first task
+    pool.submit(int).result()
+    return pool
+
+
+class Renditions:
+    """Resized copies of every card image, in modern and fallback formats
+
+    Renditions of collection c are written to out/c with content hashed
+    names, so they can be cached forever. A manifest in each directory
+    remembers the size, mtime and hash each image was rendered from, so only
+    new or changed images are rendered again. Rendering runs in a process
+    pool, the given one or one of its own per update. Workers of a cluster
+    share the renditions, a lock on each directory lets one of them render
+    while the others wait. Without Pillow there are no renditions and
+    clients load the original images.
+    """
+    def __init__(self, out: str, workers: int = None, pool: ProcessPoolExecutor = None):
+        self.out = Path(out)
+        self.workers = workers
+        self.pool = pool
+        self.collections: dict[str: dict[str: dict]] = {}
+
+    def get(self, collection: str, asset: str) -> dict | None:
+        """Renditions of an image as {rendition: {extension: file name}}"""
+        entry = self.collections.get(collection, {}).get(asset)
+        return None if entry is None else entry['renditions']
+
+    def update_all(self, root: str, collections: dict[str: list[str]]) -> int:
+        """Render the new and changed images of every collection
+
+        Returns how many images were rendered.
+        """
+        if Image is None:
+            print('Pillow is not installed, card images are served as they are')
+            return 0
+
+        start = time.perf_counter()
+        rendered = 0
+        pool = self.pool
+        if pool is None:
+            pool = ProcessPoolExecutor(self.workers, mp_context=pool_context())
+        try:
+            for collection, assets in collections.items():
+                rendered += self.update(pool, Path(root) / collection, collection, assets)
+        except RuntimeError:
+            # The interpreter is exiting, or the pool was shut down
+            return rendered
+        finally:
+            if pool is not self.pool:
+                pool.shutdown()
+        elapsed = time.perf_counter() - start
+        print(f'Rendered {rendered} card images in {elapsed:.1f} s')
+        return rendered
+
+    def update(self, pool: ProcessPoolExecutor, src_dir: Path, collection: str, assets: list[str]) -> int:
+        """Render the new and changed images of a collection, see update_all"""
+        out_dir = self.out / collection
+        out_dir.mkdir(parents=True, exist_ok=True)
+        with open(out_dir / LOCK_FILE, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            return self._update(pool, src_dir, out_dir, collection, assets)
+
+    def _update(self, pool: ProcessPoolExecutor, src_dir: Path, out_dir: Path, collection: str, assets: list[str]) -> int:
+        manifest_path = out_dir / MANIFEST_FILE
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+
+        entries = {}
+        pending = {}
+        for asset in assets:
+            try:
+                stat = os.stat(src_dir / asset)
+            except OSError:
+                continue
+            entry = manifest.get(asset)
+            if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                entries[asset] = entry
+            else:
+                entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+                pending[asset] = (entry, pool.submit(render, str(src_dir / asset), str(out_dir)))
+        # Unchanged images can be used while the rest render
+        self.collections[collection] = dict(entries)
+
+        for asset, (entry, future) in pending.items():
+            try:
+                entry['hash'], entry['renditions'] = future.result()
+                entries[asset] = entry
+            except FileNotFoundError:
+                # Removed while rendering
+                pass
+            except Exception as e:
+                print(f'Failed to render {collection}/{asset}: {e!r}')
+
+        # Drop renditions of images that were removed or changed
+        used = {n for e in entries.values() for formats in e['renditions'].values() for n in formats.values()}
+        for path in out_dir.iterdir():
+            if path.name not in [MANIFEST_FILE, LOCK_FILE] and path.name not in used:
+                path.unlink()
+
+        tmp = out_dir / (MANIFEST_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(entries, f, separators=(',', ':'))
+        os.replace(tmp, manifest_path)
+
+        self.collections[collection] = entries
+        return len(pending)
@@ -0,0 +1,92 @@
+from archive import HistoryArchive
+from game import Game, History, Team, dump_game, load_game
+
+import archive
+import tempfile
+import unittest
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.archive = HistoryArchive(self.dir.name, window=4)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def rows(self, start: int, end: int) -> list[list]:
+        return [[seq, f'player {seq}', 'blue', 'picked card', str(seq % 20), 'innocent'] for seq in range(start, end)]
+
+    def test_spill_and_read(self):
+        games = self.archive.for_game(0)
+        self.assertEqual(games.read(0, 10), [])
+        games.spill(self.rows(0, 10))
+        # Spilled again when a journal is replayed
+        games.spill(self.rows(5, 12))
+        self.assertEqual(games.read(0, 12), self.rows(0, 12))
+
+        block = archive.BLOCK
+        archive.BLOCK = 16
+        try:
+            # Rows span blocks
+            self.assertEqual(self.archive.for_game(0).read(3, 7), self.rows(3, 7))
+        finally:
+            archive.BLOCK = block
+
+        games.clear()
+        self.assertEqual(games.read(0, 12), [])
+        games.spill(self.rows(20, 22))
+        self.assertEqual(games.read(0, 30), self.rows(20, 22))
+
+    def test_game_history(self):
+        game = Game(0)
+        game.history.attach(self.archive.for_game(0), self.archive.window)
+        for i in range(11):
+            game.record('Alan', Team.BLUE, 'picked card', str(i), Team.RED)
+        # Spilled down to the window each time it doubles
+        self.assertEqual([h.seq for h in game.history], [4, 5, 6, 7, 8, 9, 10])
+        self.assertEqual(game.history_end(), 11)
+        self.assertEqual([h.seq for h in game.history_since(2)], [4, 5, 6, 7, 8, 9, 10])
+
+        entries = game.history_before(6, 5)
+        self.assertEqual([h.seq for h in entries], [1, 2, 3, 4, 5])
+        self.assertEqual(entries[0], History('Alan', Team.BLUE, 'picked card', '1', Team.RED, 1))
+        self.assertEqual(entries[-1], game.history[1])
+
+        loaded = load_game(dump_game(game))
+        loaded.history.attach(self.archive.for_game(0), self.archive.window)
+        self.assertEqual(loaded.history_before(11, 20), game.history_before(11, 20))
+
+        game.history = game.history.next_round()
+        self.assertEqual(game.history_before(11, 20), [])
+        self.assertEqual(self.archive.for_game(0).read(0, 11), [])
+
+    def test_truncate(self):
+        games = self.archive.for_game(0)
+        games.spill(self.rows(0, 10))
+        games.truncate(12)
+        self.assertEqual(games.read(0, 12), self.rows(0, 10))
+        games.truncate(6)
+        self.assertEqual(games.read(0, 12), self.rows(0, 6))
+        games.spill(self.rows(4, 8))
+        self.assertEqual(games.read(0, 12), self.rows(0, 8))
+
+    def test_restored_behind_archive(self):
+        game = Game(0)
+        for i in range(3):
+            game.record('Alan', Team.BLUE, 'picked card', str(i), Team.RED)
+        # All the journal kept before a crash
+        synced = dump_game(game)
+        game.history.attach(self.archive.for_game(0), self.archive.window)
+        for i in range(3, 11):
+            game.record('Alan', Team.BLUE, 'picked card', str(i), Team.RED)
+
+        restored = load_game(synced)
+        archive = self.archive.for_game(0)
+        archive.truncate(restored.history.end)
+        restored.history.attach(archive, self.archive.window)
+        for i in range(3, 11):
+            restored.record('Bob', Team.RED, 'picked card', str(i), Team.BLUE)
+        entries = restored.history_before(11, 20)
+        self.assertEqual([h.seq for h in entries], list(range(11)))
+        self.assertEqual([h.player_name for h in entries], ['Alan'] * 3 + ['Bob'] * 8)
@@ -0,0 +1,102 @@
+from assets import IMMUTABLE, REVALIDATE, AssetServer, parse_range
+from images import ImageIndex
+
+import http.client
+import os
+import tempfile
+import unittest
+
+
+class TestRange(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 100))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 1000))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 1000))
+        self.assertEqual(parse_range('bytes=990-2000', 1000), (990, 1000))
+        self.assertEqual(parse_range('bytes=-2000', 1000), (0, 1000))
+        # Sent in full
+        self.assertIsNone(parse_range('bytes=0-1,5-9', 1000))
+        self.assertIsNone(parse_range('pages=1-2', 1000))
+        for header in ['bytes=1000-', 'bytes=5-1', 'bytes=-0']:
+            with self.assertRaises(ValueError):
+                parse_range(header, 1000)
+
+
+class TestAssetServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.TemporaryDirectory()
+        static = os.path.join(cls.dir.name, 'static')
+        cls.write(static, 'cards', 'deck', 'card 0.jpg', data=bytes(range(256)) * 4)
+        cls.write(static, 'renditions', 'deck', 'abc-tile320.webp')
+        cls.write(static, 'renditions', 'deck', 'manifest.json')
+        cls.write(static, 'atlases', 'def.jpg')
+        cls.index = ImageIndex(os.path.join(static, 'cards'), os.path.join(cls.dir.name, 'cache'))
+        cls.index.load()
+        cls.server = AssetServer(cls.index, static).start('127.0.0.1', 0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dir.cleanup()
+
+    @staticmethod
+    def write(*path: str, data: bytes = b'image'):
+        os.makedirs(os.path.join(*path[:-1]), exist_ok=True)
+        with open(os.path.join(*path), 'wb') as f:
+            f.write(data)
+
+    def setUp(self):
+        self.connection = http.client.HTTPConnection('127.0.0.1', self.server.port, timeout=5)
+
+    def tearDown(self):
+        self.connection.close()
+
+    def get(self, path: str, headers: dict = {}, method: str = 'GET') -> (int, dict, bytes):
+        self.connection.request(method, path, headers=headers)
+        response = self.connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+
+    def test_card(self):
+        status, headers, body = self.get('/static/cards/deck/card%200.jpg')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, bytes(range(256)) * 4)
+        entry = self.index.entries('deck')['card 0.jpg']
+        self.assertEqual(headers['ETag'], f'"{entry["hash"]}"')
+        self.assertEqual(headers['Cache-Control'], REVALIDATE)
+        self.assertEqual(headers['Content-Type'], 'image/jpeg')
+
+        # The same connection is reused
+        status, headers, body = self.get('/static/cards/deck/card%200.jpg', {'If-None-Match': headers['ETag']})
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+
+    def test_range(self):
+        status, headers, body = self.get('/static/cards/deck/card%200.jpg', {'Range': 'bytes=256-511'})
+        self.assertEqual(status, 206)
+        self.assertEqual(headers['Content-Range'], 'bytes 256-511/1024')
+        self.assertEqual(body, bytes(range(256)))
+
+        status, headers, _ = self.get('/static/cards/deck/card%200.jpg', {'Range': 'bytes=2000-'})
+        self.assertEqual(status, 416)
+        self.assertEqual(headers['Content-Range'], 'bytes */1024')
+
+        # A stale If-Range gets the whole file
+        status, _, body = self.get('/static/cards/deck/card%200.jpg', {'Range': 'bytes=0-9', 'If-Range': '"old"'})
+        self.assertEqual((status, len(body)), (200, 1024))
+
+    def test_immutable(self):
+        status, headers, _ = self.get('/static/renditions/deck/abc-tile320.webp')
+        self.assertEqual((status, headers['ETag'], headers['Cache-Control']), (200, '"abc-tile320"', IMMUTABLE))
+        status, headers, body = self.get('/static/atlases/def.jpg', method='HEAD')
+        self.assertEqual((status, headers['Content-Length'], body), (200, '5', b''))
+
+    def test_not_found(self):
+        for path in ['/static/cards/deck/missing.jpg', '/static/cards/../cards/deck/card%200.jpg',
+                     '/static/cards/deck/..%2F..%2Fcache', '/static/renditions/deck/manifest.json',
+                     '/static/other/file', '/']:
+            status, _, _ = self.get(path)
+            self.assertEqual(status, 404, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
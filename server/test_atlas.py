@@ -0,0 +1,61 @@
+from atlas import COLUMNS, Atlases, Image, atlas_key
+
+import os
+import tempfile
+import unittest
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestAtlases(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.out = os.path.join(self.dir.name, 'atlases')
+        self.sources = []
+        for i in range(7):
+            path = os.path.join(self.dir.name, f'{i}.png')
+            # Alternating landscape and portrait images
+            size = (640, 480) if i % 2 == 0 else (300, 600)
+            Image.new('RGB', size, (i * 30, 0, 0)).save(path)
+            self.sources.append((f'hash{i}', path))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_compose(self):
+        atlases = Atlases(self.out, workers=1)
+        key, future = atlases.request(self.sources)
+        info = future.result(timeout=30)
+        self.assertEqual(key, atlas_key([h for h, _ in reversed(self.sources)]))
+
+        self.assertEqual(info['cells']['hash0'], [0, 0, 320, 240])
+        self.assertEqual(info['cells']['hash1'], [320, 0, 160, 320])
+        # Rows are as tall as their tallest image
+        self.assertEqual(info['cells'][f'hash{COLUMNS}'][:2], [0, 320])
+        with Image.open(os.path.join(self.out, info['files']['webp'])) as image:
+            self.assertEqual(image.size, (info['width'], info['height']))
+            # Every cell holds its image
+            x, y, w, h = info['cells']['hash2']
+            self.assertEqual(image.convert('RGB').getpixel((x + w // 2, y + h // 2))[1:], (0, 0))
+
+        # Composed atlases are reused, also after a restart
+        _, again = Atlases(self.out).request(list(reversed(self.sources)))
+        self.assertTrue(again.done())
+        self.assertEqual(again.result(), info)
+
+    def test_evict(self):
+        atlases = Atlases(self.out, capacity=2, workers=1)
+        keys = []
+        for i in range(3):
+            key, future = atlases.request(self.sources[i:i + 4])
+            future.result(timeout=30)
+            keys.append(key)
+        # The callback evicting atlases runs after the result is set
+        atlases.pool.shutdown()
+        self.assertEqual(list(atlases.lru), keys[1:])
+        self.assertFalse(os.path.exists(os.path.join(self.out, f'{keys[0]}.json')))
+        self.assertFalse(os.path.exists(os.path.join(self.out, f'{keys[0]}.webp')))
+        self.assertTrue(os.path.exists(os.path.join(self.out, f'{keys[2]}.jpg')))
+
+
+if __name__ == '__main__':
+    unittest.main()
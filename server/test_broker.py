@@ -0,0 +1,41 @@
+from broker import Broker, BrokerClient
+
+import os
+import tempfile
+import time
+import unittest
+
+class TestBroker(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'broker.sock')
+        self.broker = Broker(self.path).start()
+
+    def tearDown(self):
+        self.broker.close()
+        self.dir.cleanup()
+
+    def test_fan_out(self):
+        a = BrokerClient(self.path)
+        b = BrokerClient(self.path)
+        a.sock.settimeout(5)
+        b.sock.settimeout(5)
+        while len(self.broker.clients) < 2:
+            time.sleep(0.001)
+
+        a.publish(b'hello')
+        self.assertEqual(next(a.listen()), b'hello')
+        self.assertEqual(next(b.listen()), b'hello')
+
+        b.publish(b'x' * 100000)
+        self.assertEqual(next(a.listen()), b'x' * 100000)
+        self.assertEqual(next(b.listen()), b'x' * 100000)
+
+        a.close()
+        b.publish(b'bye')
+        self.assertEqual(next(b.listen()), b'bye')
+        b.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,318 @@
+from cafe import Cafe, room, spymaster_room
+from delta import apply
+from images import MIN_IMAGES, Image
+from migrate import MigrationListener
+from views import ViewCache
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+
+class FakeTransport:
+    """Delivers Cafe's messages to each client's inbox as they are sent"""
+    def __init__(self):
+        self.sent = []
+        self.rooms: dict[str: set[str]] = {}
+        self.inbox: dict[str: list] = {}
+
+    def emit(self, event: str, data, to: str, skip_sid: list[str] = None):
+        # Clients only ever get JSON
+        data = json.loads(json.dumps(data))
+        self.sent.append((event, data, to, skip_sid))
+        skip = set(skip_sid or [])
+        for client in self.rooms.get(to, {to}) - skip:
+            self.inbox.setdefault(client, []).append((event, data))
+
+    def enter_room(self, sid: str, room: str):
+        self.rooms.setdefault(room, set()).add(sid)
+
+    def leave_room(self, sid: str, room: str):
+        self.rooms.get(room, set()).discard(sid)
+
+    def close_room(self, room: str):
+        self.rooms.pop(room, None)
+
+    def disconnect(self, sid: str):
+        for members in self.rooms.values():
+            members.discard(sid)
+
+    def take(self) -> list:
+        sent = self.sent
+        self.sent = []
+        return sent
+
+
+class TestCafe(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.TemporaryDirectory()
+        cards = os.path.join(cls.dir.name, 'static', 'cards', 'test')
+        os.makedirs(cards)
+        for i in range(MIN_IMAGES):
+            path = os.path.join(cards, f'{i}.png')
+            if Image is not None:
+                Image.new('RGB', (4, 4), (i * 10, 0, 0)).save(path)
+            else:
+                with open(path, 'w') as f:
+                    f.write(str(i))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dir.cleanup()
+
+    def setUp(self):
+        # Cafe finds its cards and keeps its caches relative to the working directory
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+        self.transport = FakeTransport()
+        # Updates are only sent when flushed
+        self.cafe = Cafe(False, self.transport, grace=30, send_tick=1000)
+        self.game_id = self.cafe.reserve_lobby()
+        self.tokens = {}
+        self.views = {}
+
+    def tearDown(self):
+        # Images being rendered and composed need the working directory too
+        self.cafe.close()
+        os.chdir(self.cwd)
+
+    def join(self, *clients: str):
+        for client in clients:
+            self.transport.enter_room(client, client)
+            self.cafe.create_or_join_game(client, {'game_id': self.game_id, 'name': client.upper()})
+        self.deliver()
+
+    def deliver(self):
+        """Flush the queued updates and apply every client's messages to its view"""
+        self.cafe.flush_updates()
+        for client, messages in self.transport.inbox.items():
+            for event, data in messages:
+                if event == 'session':
+                    self.tokens[client] = data['token']
+                elif 'game' in data:
+                    self.views[client] = {
+                        'version': data['version'],
+                        'game': data['game'],
+                        'spymaster_vision': data['spymaster_vision']
+                    }
+                elif 'ops' in data:
+                    view = self.views[client]
+                    self.assertEqual(data['base'], view['version'], f'{client} missed an update')
+                    apply(view, data['ops'])
+                    view['version'] = data['version']
+            messages.clear()
+
+    def assertViews(self, *clients: str):
+        """Each client sees the game as it is, with the vision of its role"""
+        game = self.cafe.games[self.game_id]
+        _, views = ViewCache(self.cafe.renditions, self.cafe.index, self.cafe.game_atlases).update(game)
+        for client in clients:
+            expected = json.loads(json.dumps({
+                'version': views.version,
+                'game': views.public,
+                'spymaster_vision': views.spymaster if game.is_spymaster(client) else None
+            }))
+            self.assertEqual(self.views[client], expected, client)
+
+    def start(self):
+        """a and c spymasters of blue and red, b and d their agents"""
+        self.join('a', 'b', 'c', 'd')
+        for client, team in [('a', 'blue'), ('b', 'blue'), ('c', 'red'), ('d', 'red')]:
+            self.cafe.on_switch_team(client, {'game_id': self.game_id, 'team': team, 'as_spymaster': client in 'ac'})
+        self.cafe.on_start_game('a', {'game_id': self.game_id})
+        self.deliver()
+        self.transport.take()
+
+    def test_audiences(self):
+        self.start()
+        self.assertViews('a', 'b', 'c', 'd')
+        self.assertIsNotNone(self.views['a']['spymaster_vision'])
+        self.assertIsNone(self.views['b']['spymaster_vision'])
+
+        # c steps down and d takes over as spymaster of red
+        self.cafe.on_switch_team('c', {'game_id': self.game_id, 'team': 'red', 'as_spymaster': False})
+        self.cafe.on_switch_team('d', {'game_id': self.game_id, 'team': 'red', 'as_spymaster': True})
+        self.deliver()
+        self.assertViews('a', 'b', 'c', 'd')
+        self.assertIsNone(self.views['c']['spymaster_vision'])
+        self.assertIsNotNone(self.views['d']['spymaster_vision'])
+
+        # One patch per room, and one for each of c and d
+        targets = sorted(to for _, _, to, _ in self.transport.take())
+        self.assertEqual(targets, sorted(['c', 'd', room(self.game_id), spymaster_room(self.game_id)]))
+        self.assertEqual(self.transport.rooms[spymaster_room(self.game_id)], {'a', 'd'})
+
+    def test_updates_merge(self):
+        self.start()
+        game = self.cafe.games[self.game_id]
+        spymaster = game.teams[game.play_state.team].spymaster
+        agent = next(c for c in 'bd' if game.player_team(c) == game.play_state.team)
+        self.cafe.on_give_hint(spymaster, {'game_id': self.game_id, 'hint': 'word', 'count': 2})
+        for card in range(3):
+            self.cafe.on_vote(agent, {'game_id': self.game_id, 'card': card})
+        self.assertEqual(self.transport.sent, [])
+
+        self.deliver()
+        self.assertViews('a', 'b', 'c', 'd')
+        targets = [to for _, _, to, _ in self.transport.take()]
+        self.assertEqual(sorted(targets), sorted([room(self.game_id), spymaster_room(self.game_id)]))
+
+    def test_reveal_flushes(self):
+        self.start()
+        game = self.cafe.games[self.game_id]
+        spymaster = game.teams[game.play_state.team].spymaster
+        agent = next(c for c in 'bd' if game.player_team(c) == game.play_state.team)
+        self.cafe.on_give_hint(spymaster, {'game_id': self.game_id, 'hint': 'word', 'count': 2})
+        self.deliver()
+        self.transport.take()
+
+        self.cafe.on_vote(agent, {'game_id': self.game_id, 'card': 0})
+        self.assertEqual(self.transport.sent, [])
+        # The reveal goes out at once, with the vote queued before it
+        self.cafe.on_reveal_card(agent, {'game_id': self.game_id, 'card': 0})
+        sent = self.transport.take()
+        self.assertEqual(sorted(to for _, _, to, _ in sent), sorted([room(self.game_id), spymaster_room(self.game_id)]))
+        for event, data, _, _ in sent:
+            self.assertEqual(event, 'update_game')
+            self.assertEqual(data['chosen_card'], 0)
+        self.assertEqual(self.cafe.queued, {})
+
+        self.deliver()
+        self.assertEqual(self.transport.take(), [])
+        self.assertViews('a', 'b', 'c', 'd')
+        self.assertFalse(self.views['a']['game']['cards'][0]['hidden'])
+
+    def test_sync(self):
+        self.start()
+        self.views.pop('b')
+        self.cafe.on_sync('b', {'game_id': self.game_id})
+        self.deliver()
+        self.assertViews('b')
+        # Nobody else is sent anything
+        self.assertEqual([to for _, _, to, _ in self.transport.take()], ['b'])
+
+    def test_resume(self):
+        self.start()
+        self.transport.disconnect('b')
+        self.cafe.on_user_disconnect('b')
+        self.cafe.on_give_hint('a', {'game_id': self.game_id, 'hint': 'word', 'count': 1})
+        self.cafe.on_give_hint('c', {'game_id': self.game_id, 'hint': 'word', 'count': 1})
+        self.deliver()
+
+        self.transport.enter_room('b2', 'b2')
+        self.views['b2'] = self.views.pop('b')
+        self.cafe.on_resume('b2', {'game_id': self.game_id, 'token': self.tokens['b'], 'version': self.views['b2']['version']})
+        self.deliver()
+        game = self.cafe.games[self.game_id]
+        self.assertEqual(game.client_to_name['b2'], 'B')
+        self.assertNotIn('b', game.client_to_name)
+        self.assertViews('a', 'b2', 'c', 'd')
+        # Only sent what it missed
+        self.assertFalse(any('game' in data for _, data, to, _ in self.transport.take() if to == 'b2'))
+
+    def test_resume_demoted(self):
+        self.start()
+        self.transport.disconnect('a')
+        self.cafe.on_user_disconnect('a')
+        game = self.cafe.games[self.game_id]
+        while game.is_spymaster('a'):
+            self.cafe.on_randomize_teams('b', {'game_id': self.game_id})
+        self.deliver()
+
+        self.transport.enter_room('a2', 'a2')
+        self.views['a2'] = self.views.pop('a')
+        self.cafe.on_resume('a2', {'game_id': self.game_id, 'token': self.tokens['a'], 'version': self.views['a2']['version']})
+        sent = [data for _, data, to, _ in self.transport.take() if to == 'a2' and 'version' in data]
+        # Never patched with the vision it lost
+        self.assertEqual(len(sent), 1)
+        self.assertIsNone(sent[0]['spymaster_vision'])
+        self.deliver()
+        self.assertViews('a2', 'b', 'c', 'd')
+        self.assertNotIn('a2', self.transport.rooms[spymaster_room(self.game_id)])
+
+    def test_same_name(self):
+        self.start()
+        self.transport.disconnect('a')
+        self.cafe.on_user_disconnect('a')
+        # Someone else joining under a dropped player's name gets a seat of their own
+        self.transport.enter_room('a2', 'a2')
+        self.cafe.create_or_join_game('a2', {'game_id': self.game_id, 'name': 'A'})
+        self.deliver()
+        game = self.cafe.games[self.game_id]
+        self.assertTrue(game.is_spymaster('a'))
+        self.assertFalse(game.is_spymaster('a2'))
+        self.assertIsNone(self.views['a2']['spymaster_vision'])
+
+        # The owner still resumes with the token
+        self.transport.enter_room('a3', 'a3')
+        self.views['a3'] = self.views.pop('a')
+        self.cafe.on_resume('a3', {'game_id': self.game_id, 'token': self.tokens['a'], 'version': self.views['a3']['version']})
+        self.deliver()
+        self.assertTrue(game.is_spymaster('a3'))
+        self.assertViews('a2', 'a3', 'b', 'c', 'd')
+
+    def test_grace_expired(self):
+        self.start()
+        self.transport.disconnect('b')
+        self.cafe.on_user_disconnect('b')
+        self.assertIn('b', self.cafe.games[self.game_id].client_to_name)
+
+        self.cafe.expire(time.time() + self.cafe.grace + 2)
+        self.deliver()
+        self.assertNotIn('b', self.cafe.games[self.game_id].client_to_name)
+        self.assertViews('a', 'c', 'd')
+
+        self.transport.enter_room('b2', 'b2')
+        self.cafe.on_resume('b2', {'game_id': self.game_id, 'token': self.tokens['b'], 'version': 0})
+        self.assertEqual(self.transport.take()[-1], ('session_expired', {'game_id': self.game_id}, 'b2', None))
+
+    def test_migrate(self):
+        self.start()
+        target = Cafe(False, FakeTransport(), grace=30, send_tick=0)
+        listener = MigrationListener(os.path.join(self.dir.name, 'target.sock'), target.import_game).start()
+        redirect = {'game_id': self.game_id, 'url': 'http://target/'}
+        try:
+            self.assertTrue(self.cafe.migrate_game(self.game_id, listener.path, 'http://target/'))
+            self.assertIn(('redirect', redirect, room(self.game_id), None), self.transport.take())
+            self.assertNotIn(self.game_id, self.cafe.games)
+            self.assertEqual(target.detached[self.game_id], {'A': 'a', 'B': 'b', 'C': 'c', 'D': 'd'})
+
+            # Events still on their way are redirected too
+            self.cafe.on_vote('b', {'game_id': self.game_id, 'card': 0})
+            self.assertEqual(self.transport.take(), [('redirect', redirect, 'b', None)])
+
+            # Players joining the target take their seats back
+            target.create_or_join_game('a2', {'game_id': self.game_id, 'name': 'A'})
+            self.assertTrue(target.games[self.game_id].is_spymaster('a2'))
+            self.assertNotIn('A', target.detached[self.game_id])
+        finally:
+            listener.close()
+            target.close()
+
+    def test_create_spreads(self):
+        urls = ['http://w0/', 'http://w1/', 'http://w2/']
+        workers = [Cafe(False, FakeTransport(), worker=i, workers=3, peers=urls, send_tick=0) for i in range(3)]
+        try:
+            # Every game is created through the first worker
+            created = [workers[0].create_lobby(lambda url: workers[urls.index(url)].reserve_lobby()) for _ in range(9)]
+            for game_id, url in created:
+                owner = game_id % 3
+                self.assertTrue(workers[owner].is_reserved(game_id))
+                self.assertEqual(url, None if owner == 0 else urls[owner])
+            self.assertEqual(sorted(game_id % 3 for game_id, _ in created), [0, 0, 0, 1, 1, 1, 2, 2, 2])
+
+            # Workers out of reach leave the game here
+            for _ in range(3):
+                game_id, url = workers[0].create_lobby(lambda url: None)
+                self.assertIsNone(url)
+                self.assertTrue(workers[0].is_reserved(game_id))
+        finally:
+            for cafe in workers:
+                cafe.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+from delta import apply, diff
+
+import copy
+import json
+import unittest
+
+class TestDelta(unittest.TestCase):
+    def assertPatches(self, old, new):
+        ops = diff(old, new)
+        self.assertEqual(apply(copy.deepcopy(old), ops), new)
+        return ops
+
+    def test_unchanged(self):
+        doc = {'a': 1, 'b': [1, 2], 'c': {'d': None}}
+        self.assertEqual(diff(doc, copy.deepcopy(doc)), [])
+
+    def test_leaf_change(self):
+        old = {'cards': [{'hidden': True}, {'hidden': True}]}
+        new = {'cards': [{'hidden': True}, {'hidden': False}]}
+        ops = self.assertPatches(old, new)
+        self.assertEqual(ops, [[['cards', 1, 'hidden'], False]])
+
+    def test_dict_keys(self):
+        old = {'votes': {0: ['a'], 1: ['b']}}
+        new = {'votes': {1: ['b', 'c'], 2: ['a']}}
+        # Sent as JSON to clients holding old as JSON
+        ops = json.loads(json.dumps(diff(old, new)))
+        self.assertEqual(apply(json.loads(json.dumps(old)), ops), json.loads(json.dumps(new)))
+        self.assertIn([['votes', '0']], ops)
+        self.assertIn([['votes', '2'], ['a']], ops)
+
+    def test_list_append(self):
+        ops = self.assertPatches({'history': [1, 2]}, {'history': [1, 2, 3]})
+        self.assertEqual(ops, [[['history', 2], 3]])
+
+    def test_list_shrink(self):
+        ops = self.assertPatches({'history': [1, 2]}, {'history': []})
+        self.assertEqual(ops, [[['history'], []]])
+
+    def test_type_change(self):
+        self.assertPatches({'winner': None}, {'winner': 'blue'})
+        self.assertPatches({'cards_left': '-'}, {'cards_left': 8})
+        self.assertPatches({'x': True}, {'x': 1})
+        self.assertPatches([], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ from game import (
     AgentTurn,
     Card,
     Game,
+    History,
     PlayState,
     SpymasterTurn,
     Team,
@@ -13,10 +14,15 @@ from game import (
     GameSetupError,
     TurnError,
 
-    draw_cards
+    Board,
+    deal_cards,
+    draw_cards,
+    dump_game,
+    load_game,
 )
 
 import copy
+import random
 import unittest
 
 class TestGame(unittest.TestCase):
@@ -222,6 +228,162 @@ class TestGame(unittest.TestCase):
         self.game.reveal_card('b', 19);
         self.assertEqual(self.game.play_state, Win(Team.RED))
 
+    def test_derived_state(self):
+        self.game.debug = True
+        self.add_members()
+        self.game.join_game('e', 'Blade')
+        self.game.join_team('e', 'red', False)
+        self.assertEqual(self.game.player_team('e'), Team.RED)
+        self.assertTrue(self.game.is_spymaster('c'))
+        self.assertFalse(self.game.is_spymaster('e'))
+
+        random.seed(0)
+        for _ in range(10):
+            self.game.reset()
+            self.game.start_game(Team.BLUE, generate_test_cards(Team.BLUE))
+            self.assertEqual(self.game.cards_left(Team.BLUE), 8)
+            self.assertEqual(self.game.cards_left(Team.RED), 7)
+
+            while not isinstance(self.game.play_state, Win):
+                match self.game.play_state:
+                    case SpymasterTurn(team):
+                        self.game.give_hint(self.game.teams[team].spymaster, 'hint', random.randint(0, 3))
+                    case AgentTurn(team):
+                        agents = [c for c in self.game.teams[team].members if not self.game.is_spymaster(c)]
+                        hidden = [i for i, c in enumerate(self.game.cards) if c.hidden]
+                        client = random.choice(agents)
+                        if random.random() < 0.6:
+                            self.game.vote(client, random.choice(hidden))
+                        else:
+                            self.game.reveal_card(client, random.choice(hidden))
+
+        self.game.leave_game('e')
+        self.game.randomize_teams()
+        self.assertEqual(set(self.game.roles), {'a', 'b', 'c', 'd'})
+        self.game.check_invariants()
+
+    def test_leave_removes_votes(self):
+        self.game.debug = True
+        self.add_members()
+        self.game.join_game('e', 'Blade')
+        self.game.join_team('e', 'blue', False)
+        self.game.start_game(Team.BLUE, self.cards)
+        self.game.give_hint('a', 'hint', 1)
+
+        self.game.vote('b', 0)
+        self.game.vote('e', 0)
+        self.game.vote('e', 2)
+        self.game.leave_game('e')
+        self.assertEqual(self.game.play_state.actions.votes, {0: {'b'}})
+        self.assertEqual(self.game.play_state.actions.ballots, {'b': {0}})
+
+    def test_history_sequence(self):
+        self.add_members()
+        self.game.start_game(Team.BLUE, self.cards)
+        self.game.give_hint('a', 'hint', 1)
+        self.game.end_guessing('b', 0)
+        self.game.give_hint('c', 'hint', 1)
+        self.assertEqual([h.seq for h in self.game.history], [0, 1, 2])
+        self.assertEqual([h.seq for h in self.game.history_since(1)], [1, 2])
+        self.assertEqual([h.seq for h in self.game.history_before(3, 2)], [1, 2])
+        self.assertEqual([h.seq for h in self.game.history_before(1, 5)], [0])
+
+        self.game.reset()
+        self.assertEqual(self.game.history_start, 3)
+        self.assertEqual(self.game.history_since(0), [])
+        self.game.start_game(Team.BLUE, generate_test_cards(Team.BLUE))
+        self.game.give_hint('a', 'hint', 1)
+        self.assertEqual([h.seq for h in self.game.history_since(0)], [3])
+        self.assertEqual(self.game.history_before(3, 5), [])
+
+    def test_rebind(self):
+        self.game.debug = True
+        self.add_members()
+        self.game.start_game(Team.BLUE, self.cards)
+        self.game.give_hint('a', 'hint', 1)
+        self.game.vote('b', 0)
+
+        self.game.rebind('a', 'x')
+        self.game.rebind('b', 'y')
+        self.assertEqual(self.game.host, 'x')
+        self.assertEqual(self.game.teams[Team.BLUE].spymaster, 'x')
+        self.assertEqual(self.game.teams[Team.BLUE].members, {'x', 'y'})
+        self.assertEqual(self.game.client_to_id['y'], 1)
+        self.assertEqual(self.game.play_state.actions.votes, {0: {'y'}})
+        self.assertEqual(list(self.game.client_to_name), ['x', 'y', 'c', 'd'])
+
+    def test_check_invariants(self):
+        self.add_members()
+        self.game.start_game(Team.BLUE, self.cards)
+        self.game.check_invariants()
+
+        self.game.cards[0].hidden = False
+        with self.assertRaises(AssertionError):
+            self.game.check_invariants()
+        self.game.cards[0].hidden = True
+
+        self.game.teams[Team.RED].members.add('a')
+        with self.assertRaises(AssertionError):
+            self.game.check_invariants()
+
+    def test_history_log(self):
+        self.add_members()
+        self.game.start_game(Team.BLUE, self.cards)
+        self.game.give_hint('a', 'hint', 2)
+        self.game.end_guessing('b', None)
+
+        entries = list(self.game.history)
+        self.assertEqual(entries, [
+            History('Daniel', Team.BLUE, 'gives clue', 'hint 2', '', 0),
+            History('Kafka', Team.BLUE, 'ends guessing', '', '', 1),
+        ])
+        self.assertIs(entries[0].player_name, self.game.client_to_name['a'])
+        self.assertEqual(self.game.history[-1], entries[-1])
+        self.assertEqual(self.game.history[1:], entries[1:])
+
+    def test_ballot_masks(self):
+        actions = AgentActions('hint', 1)
+        actions.toggle_vote('a', 3)
+        actions.toggle_vote('a', 5)
+        actions.toggle_vote('b', 5)
+        self.assertEqual(actions.ballot_masks, {'a': 0b101000, 'b': 0b100000})
+        self.assertEqual(actions.votes, {3: {'a'}, 5: {'a', 'b'}})
+
+        actions.clear_votes(5)
+        self.assertEqual(actions.ballots, {'a': {3}})
+        actions.toggle_vote('a', 3)
+        self.assertEqual(actions.ballot_masks, {})
+
+    def test_deal(self):
+        images = tuple(f'{i}.jpg' for i in range(40))
+        game = Game(0, seed=1)
+        first_team, board = game.deal(images)
+        self.assertIs(board.deck, images)
+        self.assertEqual(len({c.asset for c in board}), 20)
+        self.assertEqual(sum(1 for c in board if c.team == first_team), 8)
+
+        # The seed kept on the board repeats the deal
+        self.assertEqual(deal_cards(board.seed, images), (first_team, board))
+        self.assertEqual(Game(1, seed=1).deal(images), (first_team, board))
+        # Deals at another version differ
+        game.touch()
+        self.assertNotEqual(game.deal(images)[1], board)
+
+    def test_dump_load(self):
+        self.add_members()
+        self.game.start_game(Team.BLUE, self.cards)
+        self.game.give_hint('a', 'hint', 1)
+        self.game.reveal_card('b', 3)
+        data = dump_game(self.game)
+        self.assertEqual(dump_game(load_game(data, debug=True)), data)
+
+        # Dumped before boards were packed
+        old = {k: v for k, v in data.items() if k != 'board'}
+        old['cards'] = [[c.team, c.asset, c.hidden] for c in self.game.cards]
+        game = load_game(old, debug=True)
+        self.assertEqual(game.cards, self.game.cards)
+        self.assertEqual(game.cards_left(Team.BLUE), self.game.cards_left(Team.BLUE))
+
     def add_members(self):
         self.game.join_game('a', 'Daniel')
         self.game.join_game('b', 'Kafka')
@@ -234,6 +396,32 @@ class TestGame(unittest.TestCase):
         self.game.join_team('d', 'red', False)
 
 
+class TestBoard(unittest.TestCase):
+    def setUp(self):
+        self.cards = generate_test_cards(Team.RED)
+        self.cards[4].hidden = False
+        self.board = Board.from_cards(self.cards)
+
+    def test_views(self):
+        self.assertEqual(list(self.board), self.cards)
+        self.assertEqual(self.board[-1], self.cards[-1])
+        with self.assertRaises(IndexError):
+            self.board[20]
+
+        card = self.board[2]
+        card.hidden = False
+        self.assertFalse(self.board[2].hidden)
+        card.hidden = True
+        self.assertTrue(self.board[2].hidden)
+        self.assertFalse(self.board[4].hidden)
+
+    def test_dump_load(self):
+        other = Board.load(self.board.dump())
+        self.assertEqual(other, self.board)
+        other[0].hidden = False
+        self.assertNotEqual(other, self.board)
+
+
 def generate_test_cards(first_team: Team) -> list[Card]:
     deck = [i for i in range(20)]
     draw = draw_cards(deck, first_team)
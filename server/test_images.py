@@ -0,0 +1,121 @@
+from images import MIN_IMAGES, Image, ImageIndex, image_meta
+
+import io
+import os
+import tempfile
+import unittest
+
+
+class TestImageIndex(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.dir.name, 'cards')
+        self.cache = os.path.join(self.dir.name, 'cache')
+        for i in range(MIN_IMAGES):
+            self.write_image('deck', f'{i}.jpg', str(i))
+        for i in range(MIN_IMAGES - 1):
+            self.write_image('small', f'{i}.png', str(i))
+        self.write_image('deck', 'notes.txt', 'not an image')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write_image(self, collection: str, name: str, data: str):
+        os.makedirs(os.path.join(self.root, collection), exist_ok=True)
+        with open(os.path.join(self.root, collection, name), 'w') as f:
+            f.write(data)
+
+    def test_load(self):
+        index = ImageIndex(self.root, self.cache)
+        index.load()
+        # Collections too small to play with are left out
+        self.assertEqual(list(index.images.keys()), ['deck'])
+        self.assertEqual(len(index.images['deck']), MIN_IMAGES)
+        self.assertNotIn('notes.txt', index.images['deck'])
+        self.assertEqual(len(index.entries('small')), MIN_IMAGES - 1)
+        self.assertEqual(index.entries('deck')['1.jpg']['size'], 1)
+
+    def test_manifest(self):
+        first = ImageIndex(self.root, self.cache)
+        first.load()
+
+        # Unchanged collections are read from their manifests
+        index = ImageIndex(self.root, self.cache)
+        self.assertEqual(index.rescan('deck', trust_manifest=True), 0)
+        self.assertEqual(index.entries('deck'), first.entries('deck'))
+
+        # Only new and changed images are hashed again
+        old = index.entries('deck')['0.jpg']['hash']
+        self.write_image('deck', '0.jpg', 'changed')
+        self.write_image('deck', 'new.jpg', 'new')
+        self.assertEqual(index.rescan('deck'), 2)
+        self.assertNotEqual(index.entries('deck')['0.jpg']['hash'], old)
+        self.assertIn('new.jpg', index.images['deck'])
+
+        self.write_image('small', 'new.png', 'new')
+        self.assertEqual(index.rescan('small'), 1)
+        self.assertEqual(list(index.images.keys()), ['deck', 'small'])
+
+    def test_removed(self):
+        index = ImageIndex(self.root, self.cache)
+        index.load()
+        os.remove(os.path.join(self.root, 'deck', '0.jpg'))
+        index.rescan('deck')
+        self.assertNotIn('deck', index.images)
+
+        for name in os.listdir(os.path.join(self.root, 'deck')):
+            os.remove(os.path.join(self.root, 'deck', name))
+        os.rmdir(os.path.join(self.root, 'deck'))
+        index.rescan('deck')
+        self.assertEqual(index.entries('deck'), {})
+        self.assertFalse(os.path.exists(os.path.join(self.cache, 'deck.json')))
+
+    def test_swapped(self):
+        index = ImageIndex(self.root, self.cache)
+        index.load()
+        # Readers in other threads keep what they read while rescans run
+        manifests = index.manifests
+        entries = index.entries('deck')
+        self.write_image('deck', 'new.jpg', 'new')
+        self.write_image('other', '0.jpg', '0')
+        index.rescan('deck')
+        index.rescan('other')
+        index.rescan('small')
+        self.assertEqual(sorted(manifests), ['deck', 'small'])
+        self.assertNotIn('new.jpg', entries)
+        self.assertIn('new.jpg', index.entries('deck'))
+        self.assertEqual(sorted(index.manifests), ['deck', 'other', 'small'])
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestImageMeta(unittest.TestCase):
+    def encode(self, image, fmt: str = 'PNG', **options) -> bytes:
+        data = io.BytesIO()
+        image.save(data, fmt, **options)
+        return data.getvalue()
+
+    def test_meta(self):
+        image = Image.new('RGB', (600, 400), (255, 0, 0))
+        image.paste((0, 0, 255), (0, 0, 100, 100))
+        meta = image_meta(self.encode(image))
+        self.assertEqual((meta['width'], meta['height']), (600, 400))
+        self.assertEqual(meta['color'], '#ff0000')
+        # 4x3 components for landscape images
+        self.assertEqual(len(meta['placeholder']), 6 + 2 * 11)
+        self.assertEqual(meta['placeholder'][0], 'L')
+
+    def test_rotated(self):
+        image = Image.new('RGB', (600, 400), (0, 128, 0))
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        meta = image_meta(self.encode(image, 'JPEG', exif=exif))
+        self.assertEqual((meta['width'], meta['height']), (400, 600))
+        # 3x4 for portrait ones
+        self.assertEqual(meta['placeholder'][0], 'T')
+
+    def test_unreadable(self):
+        self.assertIsNone(image_meta(b'not an image'))
+
+
+if __name__ == '__main__':
+    unittest.main()
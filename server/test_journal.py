@@ -0,0 +1,154 @@
+from game import Game, Team, dump_game
+from journal import Journal
+from test_game import generate_test_cards
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.journal = Journal(self.dir.name)
+        self.games, _ = self.journal.restore()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def play(self, op: str, *args):
+        game = self.games[0]
+        getattr(game, op)(*args)
+        self.journal.record(0, op, *args)
+
+    def setup_game(self):
+        self.games[0] = Game(0)
+        self.journal.record(0, 'create', self.games[0].seed)
+        for client in 'abcd':
+            self.play('join_game', client, client.upper())
+        self.play('randomize_teams', ['a', 'c', 'b', 'd'])
+        self.play('start_game', Team.BLUE, generate_test_cards(Team.BLUE))
+        self.play('give_hint', 'a', 'hint', 2)
+        self.play('vote', 'b', 3)
+
+    def restored(self):
+        self.journal.sync()
+        games, id_counter = Journal(self.dir.name).restore()
+        return {i: dump_game(g) for i, g in games.items()}, id_counter
+
+    def test_replay_log(self):
+        self.setup_game()
+        self.journal.record(4, 'reserve')
+
+        games, id_counter = self.restored()
+        self.assertEqual(games, {0: dump_game(self.games[0])})
+        self.assertEqual(id_counter, 5)
+
+    def test_old_start_game_record(self):
+        self.setup_game()
+        self.journal.sync()
+        # Logged before boards were packed
+        cards = [[c.team, c.asset, c.hidden] for c in self.games[0].cards]
+        with open(os.path.join(self.dir.name, 'journal.0.log')) as f:
+            lines = f.readlines()
+        with open(os.path.join(self.dir.name, 'journal.0.log'), 'w') as f:
+            for line in lines:
+                seq, game_id, op, args = json.loads(line)
+                if op == 'start_game':
+                    args = [args[0], cards]
+                f.write(json.dumps([seq, game_id, op, args]) + '\n')
+
+        games, _ = self.restored()
+        self.assertEqual(games, {0: dump_game(self.games[0])})
+
+    def test_snapshot_and_tail(self):
+        self.setup_game()
+        self.journal.snapshot(self.games.values(), 1)
+        self.play('reveal_card', 'b', 0)
+        self.play('leave_game', 'd')
+
+        games, id_counter = self.restored()
+        self.assertEqual(games, {0: dump_game(self.games[0])})
+        self.assertEqual(id_counter, 1)
+
+    def test_old_logs_ignored(self):
+        self.setup_game()
+        self.journal.sync()
+        with open(os.path.join(self.dir.name, 'journal.0.log')) as f:
+            old_log = f.read()
+
+        self.journal.snapshot(self.games.values(), 1)
+        self.play('reveal_card', 'b', 0)
+        self.assertFalse(os.path.exists(os.path.join(self.dir.name, 'journal.0.log')))
+
+        # Crash after writing the snapshot but before deleting the old log,
+        # and in the middle of writing a record
+        with open(os.path.join(self.dir.name, 'journal.0.log'), 'w') as f:
+            f.write(old_log)
+        self.journal.sync()
+        with open(os.path.join(self.dir.name, 'journal.1.log'), 'a') as f:
+            f.write('[99, 0, "vo')
+
+        games, _ = self.restored()
+        self.assertEqual(games, {0: dump_game(self.games[0])})
+
+    def test_changes_during_snapshot(self):
+        self.setup_game()
+
+        def games():
+            # Events for the game land in the new log before it is dumped
+            self.play('vote', 'b', 5)
+            self.play('reveal_card', 'b', 0)
+            yield self.games[0]
+            self.play('vote', 'b', 6)
+
+        self.journal.snapshot(games(), 1)
+        self.play('vote', 'b', 7)
+
+        games, _ = self.restored()
+        self.assertEqual(games, {0: dump_game(self.games[0])})
+
+    def test_background_snapshot(self):
+        self.journal.snapshot_every = 3
+        self.journal.sync_interval = 0.001
+        self.setup_game()
+        self.journal.start(lambda: (self.games.values(), 1))
+
+        snapshot = os.path.join(self.dir.name, 'snapshot.json')
+        for _ in range(1000):
+            if os.path.exists(snapshot):
+                break
+            time.sleep(0.005)
+        with open(snapshot) as f:
+            self.assertEqual(len(json.load(f)['games']), 1)
+
+    def test_reservations(self):
+        self.journal.record(1, 'reserve', 100.0)
+        self.journal.record(2, 'reserve', 200.0)
+        self.journal.snapshot([], 3)
+        self.journal.record(3, 'reserve', 300.0)
+        self.journal.record(1, 'release')
+        self.journal.record(2, 'create', 0)
+        # Logged before reservations expired
+        self.journal.record(4, 'reserve')
+        self.journal.sync()
+
+        journal = Journal(self.dir.name)
+        journal.restore()
+        self.assertEqual(journal.reservations, {3: 300.0, 4: None})
+
+    def test_delete(self):
+        self.setup_game()
+        for client in 'abcd':
+            self.play('leave_game', client)
+        del self.games[0]
+        self.journal.record(0, 'delete')
+
+        games, id_counter = self.restored()
+        self.assertEqual(games, {})
+        self.assertEqual(id_counter, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
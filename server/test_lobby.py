@@ -0,0 +1,94 @@
+from game import Game, SpymasterTurn, Team
+from lobby import LobbyIndex, merge_pages, parse_query
+
+import json
+import unittest
+
+
+def make_game(game_id: int, players: int = 1, playing: bool = False) -> Game:
+    game = Game(game_id)
+    for i in range(players):
+        game.join_game(f'c{i}', f'C{i}')
+    if playing:
+        game.play_state = SpymasterTurn(Team.BLUE)
+    return game
+
+
+class TestLobby(unittest.TestCase):
+    def setUp(self):
+        self.lobby = LobbyIndex()
+        self.games = {i: make_game(i, playing=i % 3 == 0) for i in range(10)}
+        for game in self.games.values():
+            self.lobby.update(game)
+
+    def ids(self, page: dict) -> list[int]:
+        return [g['game_id'] for g in page['games']]
+
+    def test_pages(self):
+        page = self.lobby.page(None, limit=4)
+        self.assertEqual(self.ids(page), [0, 1, 2, 3])
+        self.assertEqual(page['next'], 3)
+        page = self.lobby.page(None, page['next'], 4)
+        self.assertEqual(self.ids(page), [4, 5, 6, 7])
+        page = self.lobby.page(None, page['next'], 4)
+        self.assertEqual(self.ids(page), [8, 9])
+        self.assertIsNone(page['next'])
+
+        self.assertEqual(self.ids(self.lobby.page('playing')), [0, 3, 6, 9])
+        page = self.lobby.page('waiting', 2, 3)
+        self.assertEqual(self.ids(page), [4, 5, 7])
+        self.assertEqual(page['next'], 7)
+
+    def test_updates(self):
+        game = self.games[1]
+        game.play_state = SpymasterTurn(Team.RED)
+        self.lobby.update(game)
+        game = self.games[2]
+        game.join_game('d', 'D')
+        self.lobby.update(game)
+        self.lobby.remove(4)
+        self.lobby.remove(4)
+
+        self.assertEqual(self.ids(self.lobby.page('playing')), [0, 1, 3, 6, 9])
+        self.assertEqual(self.ids(self.lobby.page('waiting')), [2, 5, 7, 8])
+        self.assertEqual(self.lobby.page('waiting')['games'][0], {'game_id': 2, 'players': 2, 'state': 'waiting'})
+        self.assertEqual(len(self.lobby), 9)
+
+    def test_listing_cache(self):
+        etag, body = self.lobby.listing('waiting', limit=2)
+        self.assertEqual(json.loads(body), self.lobby.page('waiting', limit=2))
+        self.assertIs(self.lobby.listing('waiting', limit=2)[1], body)
+
+        # Unchanged games and changes to games in other states keep the ETag
+        self.lobby.update(self.games[1])
+        self.games[3].join_game('d', 'D')
+        self.lobby.update(self.games[3])
+        self.assertEqual(self.lobby.listing('waiting', limit=2)[0], etag)
+        self.assertNotEqual(self.lobby.listing(None, limit=2)[0], etag)
+
+        self.games[5].join_game('d', 'D')
+        self.lobby.update(self.games[5])
+        etag2, body2 = self.lobby.listing('waiting', limit=2)
+        self.assertNotEqual(etag2, etag)
+        self.assertEqual(json.loads(body2), self.lobby.page('waiting', limit=2))
+
+    def test_parse_query(self):
+        self.assertEqual(parse_query({}), (None, -1, 50))
+        self.assertEqual(parse_query({'state': 'playing', 'after': '4', 'limit': '10'}), ('playing', 4, 10))
+        for params in [{'state': 'lost'}, {'after': 'x'}, {'limit': '0'}, {'limit': '1000'}]:
+            with self.assertRaises(ValueError):
+                parse_query(params)
+
+    def test_merge_pages(self):
+        workers = [LobbyIndex(), LobbyIndex()]
+        for game in self.games.values():
+            workers[game.game_id % 2].update(game)
+
+        after = -1
+        merged = []
+        while after is not None:
+            page = merge_pages([w.page(None, after, 3) for w in workers], 3)
+            self.assertLessEqual(len(page['games']), 3)
+            merged += self.ids(page)
+            after = page['next']
+        self.assertEqual(merged, list(range(10)))
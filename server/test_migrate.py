@@ -0,0 +1,67 @@
+from game import Game, Team, dump_game, load_game
+from migrate import MigrationError, MigrationListener, pack_game, send_game
+from test_game import generate_test_cards
+
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+
+def run_target(path: str, ready, received):
+    """Target process, takes over one game then reports what it got"""
+    games = {}
+
+    def on_game(data):
+        game = load_game(data['game'], debug=True)
+        if game.game_id in games:
+            raise ValueError('Game already exists')
+        games[game.game_id] = game
+        received.put((dump_game(game), data['clients']))
+
+    MigrationListener(path, on_game).start()
+    ready.set()
+    # Serve until the test terminates us
+    threading.Event().wait()
+
+
+class TestMigrate(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'target.sock')
+        ready = multiprocessing.Event()
+        self.received = multiprocessing.Queue()
+        self.target = multiprocessing.Process(target=run_target, args=(self.path, ready, self.received))
+        self.target.start()
+        self.assertTrue(ready.wait(5))
+
+    def tearDown(self):
+        self.target.terminate()
+        self.target.join()
+        self.dir.cleanup()
+
+    def test_migrate_game(self):
+        game = Game(7)
+        for client in 'abcd':
+            game.join_game(client, client.upper())
+        game.randomize_teams(['a', 'b', 'c', 'd'])
+        game.start_game(Team.BLUE, generate_test_cards(Team.BLUE))
+        game.give_hint('a', 'hint', 2)
+        game.vote('c', 4)
+
+        send_game(self.path, pack_game(game, ['a', 'b', 'c', 'd']))
+        data, clients = self.received.get(timeout=5)
+        self.assertEqual(data, dump_game(game))
+        self.assertEqual(clients, ['a', 'b', 'c', 'd'])
+
+        # The target refuses a game it already has
+        with self.assertRaises(MigrationError):
+            send_game(self.path, pack_game(game, []))
+
+    def test_unreachable(self):
+        with self.assertRaises(MigrationError):
+            send_game(os.path.join(self.dir.name, 'nobody.sock'), pack_game(Game(0), []))
+
+
+if __name__ == '__main__':
+    unittest.main()
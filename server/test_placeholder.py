@@ -0,0 +1,26 @@
+from placeholder import BASE83, base83, encode
+
+import unittest
+
+
+class TestPlaceholder(unittest.TestCase):
+    def test_base83(self):
+        self.assertEqual(base83(0, 2), '00')
+        self.assertEqual(base83(82, 1), '~')
+        self.assertEqual(base83(83 * 5 + 3, 2), '53')
+        self.assertEqual(len(BASE83), 83)
+
+    def test_encode(self):
+        # Computed with the reference implementation
+        pixels = [(x * 40, y * 60, x * y * 10) for y in range(4) for x in range(6)]
+        self.assertEqual(encode(pixels, 6, 4, 4, 3), 'LXEL[o3MN@-n*iI]Wqrsd[e?fRe:')
+
+    def test_color(self):
+        pixels = [(200, 100, 50)] * (8 * 6)
+        hash = encode(pixels, 8, 6, 3, 4)
+        self.assertEqual(hash[0], base83(2 + 3 * 9, 1))
+        self.assertEqual(hash[2:6], base83((200 << 16) + (100 << 8) + 50, 4))
+        self.assertEqual(len(hash), 6 + 2 * 11)
+
+if __name__ == '__main__':
+    unittest.main()
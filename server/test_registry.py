@@ -0,0 +1,88 @@
+from game import Game
+from registry import GameRegistry, IdAllocator
+
+from concurrent.futures import ThreadPoolExecutor
+
+import threading
+import time
+import unittest
+
+class TestRegistry(unittest.TestCase):
+    def test_dict_like(self):
+        games = GameRegistry(shards=4)
+        for i in range(10):
+            games[i] = Game(i)
+        self.assertEqual(len(games), 10)
+        self.assertIn(3, games)
+        self.assertEqual(games[3].game_id, 3)
+        self.assertEqual(sorted(games), list(range(10)))
+        del games[3]
+        self.assertNotIn(3, games)
+        self.assertIsNone(games.get(3))
+        self.assertEqual(games.pop(4).game_id, 4)
+        self.assertEqual(sorted(g.game_id for g in games.locked_values()), [0, 1, 2, 5, 6, 7, 8, 9])
+
+    def test_unique_ids(self):
+        ids = IdAllocator(1, 3)
+        with ThreadPoolExecutor(8) as pool:
+            allocated = list(pool.map(lambda _: ids.allocate(), range(1000)))
+        self.assertEqual(sorted(allocated), list(range(1, 3000, 3)))
+
+        ids.skip(5000)
+        self.assertEqual(ids.allocate(), 5002)
+
+    def test_serialized_per_game(self):
+        games = GameRegistry()
+        games[0] = Game(0)
+        counter = {'value': 0}
+
+        def increment(_):
+            with games.lock(0):
+                value = counter['value']
+                time.sleep(0)
+                counter['value'] = value + 1
+
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(increment, range(500)))
+        self.assertEqual(counter['value'], 500)
+
+    def test_parallel_games(self):
+        games = GameRegistry()
+        inside = threading.Barrier(2, timeout=5)
+
+        def hold(game_id):
+            with games.lock(game_id):
+                # Deadlocks unless both games are locked at once
+                inside.wait()
+
+        with ThreadPoolExecutor(2) as pool:
+            list(pool.map(hold, [0, 1]))
+
+    def test_deleted_while_waiting(self):
+        games = GameRegistry()
+        games[0] = Game(0)
+        joined = []
+
+        def join():
+            with games.lock(0):
+                if 0 not in games:
+                    games[0] = Game(0)
+                joined.append(games[0])
+
+        with games.lock(0):
+            waiter = threading.Thread(target=join)
+            waiter.start()
+            time.sleep(0.01)
+            del games[0]
+        waiter.join()
+
+        # The waiter saw the game gone and created a new one
+        self.assertIn(0, games)
+        self.assertIs(joined[0], games[0])
+        with games.lock(0):
+            reentered = True
+        self.assertTrue(reentered)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+from renditions import Image, MANIFEST_FILE, Renditions
+
+import os
+import tempfile
+import unittest
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestRenditions(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.dir.name, 'cards')
+        self.out = os.path.join(self.dir.name, 'renditions')
+        os.makedirs(os.path.join(self.root, 'deck'))
+        self.assets = []
+        for i in range(3):
+            self.write_image(f'{i}.jpg', (i * 80, 0, 0))
+            self.assets.append(f'{i}.jpg')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write_image(self, name: str, color: tuple):
+        Image.new('RGB', (1600, 1000), color).save(os.path.join(self.root, 'deck', name))
+
+    def files(self) -> list[str]:
+        return sorted(os.listdir(os.path.join(self.out, 'deck')))
+
+    def test_render(self):
+        renditions = Renditions(self.out, workers=2)
+        self.assertEqual(renditions.update_all(self.root, {'deck': self.assets}), 3)
+        # Two renditions in two formats per image, the manifest and the lock
+        files = self.files()
+        self.assertEqual(len(files), 3 * 4 + 2)
+        self.assertIn(MANIFEST_FILE, files)
+
+        tile = renditions.get('deck', '0.jpg')['tile']
+        with Image.open(os.path.join(self.out, 'deck', tile['webp'])) as image:
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, (320, 200))
+        with Image.open(os.path.join(self.out, 'deck', tile['jpg'])) as image:
+            self.assertEqual(image.format, 'JPEG')
+        self.assertIsNone(renditions.get('deck', 'missing.jpg'))
+
+    def test_incremental(self):
+        first = Renditions(self.out, workers=1)
+        first.update_all(self.root, {'deck': self.assets})
+        old = first.get('deck', '1.jpg')
+
+        # Nothing is rendered again after a restart
+        renditions = Renditions(self.out, workers=1)
+        self.assertEqual(renditions.update_all(self.root, {'deck': self.assets}), 0)
+        self.assertEqual(renditions.get('deck', '0.jpg'), first.get('deck', '0.jpg'))
+
+        # Changed images get new names, removed ones lose their renditions
+        self.write_image('1.jpg', (0, 255, 0))
+        os.remove(os.path.join(self.root, 'deck', '2.jpg'))
+        self.assets.remove('2.jpg')
+        self.assertEqual(renditions.update_all(self.root, {'deck': self.assets}), 1)
+        self.assertNotEqual(renditions.get('deck', '1.jpg'), old)
+        files = self.files()
+        self.assertEqual(len(files), 2 * 4 + 2)
+        self.assertNotIn(old['tile']['webp'], files)
+
+
+if __name__ == '__main__':
+    unittest.main()
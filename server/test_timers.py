@@ -0,0 +1,57 @@
+from timers import TimerWheel
+
+import random
+import unittest
+
+
+class TestTimerWheel(unittest.TestCase):
+    def test_expire(self):
+        wheel = TimerWheel(tick=1.0, slots=4, levels=2)
+        wheel.schedule('a', 3)
+        wheel.schedule('b', 3.5)
+        wheel.schedule('c', 10)
+        wheel.schedule('d', 100)
+        self.assertEqual(len(wheel), 4)
+        self.assertEqual(wheel.advance(2.9), [])
+        self.assertEqual(wheel.advance(3), ['a'])
+        self.assertEqual(wheel.advance(4), ['b'])
+        self.assertEqual(wheel.advance(12), ['c'])
+        self.assertEqual(wheel.advance(99), [])
+        self.assertIn('d', wheel)
+        self.assertEqual(wheel.advance(100), ['d'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_cancel_and_reschedule(self):
+        wheel = TimerWheel(tick=1.0, slots=4, levels=2)
+        wheel.schedule('a', 5)
+        wheel.schedule('b', 5)
+        self.assertTrue(wheel.cancel('a'))
+        self.assertFalse(wheel.cancel('a'))
+        wheel.schedule('b', 20)
+        self.assertEqual(wheel.deadline('b'), 20)
+        self.assertEqual(wheel.advance(19), [])
+        # Deadlines already passed expire on the next tick
+        wheel.schedule('c', 0)
+        self.assertEqual(sorted(wheel.advance(20)), ['b', 'c'])
+
+    def test_random(self):
+        rng = random.Random(0)
+        wheel = TimerWheel(tick=0.5, slots=8, levels=3, now=1000)
+        deadlines = {}
+        now = 1000
+        while now < 3000:
+            for _ in range(rng.randrange(5)):
+                key = rng.randrange(200)
+                deadlines[key] = now + rng.uniform(0, 1000)
+                wheel.schedule(key, deadlines[key])
+            if rng.random() < 0.1 and deadlines:
+                key = rng.choice(list(deadlines))
+                del deadlines[key]
+                wheel.cancel(key)
+            now += rng.uniform(0, 20)
+            for key in wheel.advance(now):
+                self.assertLessEqual(deadlines[key], now)
+                del deadlines[key]
+            # Nothing left pending more than a tick late
+            self.assertTrue(all(deadline > now - 0.5 for deadline in deadlines.values()))
+        self.assertEqual(len(wheel), len(deadlines))
@@ -0,0 +1,94 @@
+from transport import AsyncTransport, ServerTransport
+
+import asyncio
+import threading
+import unittest
+
+
+class RecordingServer:
+    def __init__(self):
+        self.calls = []
+
+    def emit(self, event, data, to=None, skip_sid=None, namespace=None):
+        self.calls.append(('emit', event, data, to, skip_sid, namespace))
+
+    def enter_room(self, sid, room, namespace=None):
+        self.calls.append(('enter_room', sid, room, namespace))
+
+    def leave_room(self, sid, room, namespace=None):
+        self.calls.append(('leave_room', sid, room, namespace))
+
+    def close_room(self, room, namespace=None):
+        self.calls.append(('close_room', room, namespace))
+
+
+class AsyncRecordingServer(RecordingServer):
+    async def emit(self, *args, **kwargs):
+        # Yield to the loop so out of order sends would show
+        await asyncio.sleep(0)
+        super().emit(*args, **kwargs)
+
+    async def close_room(self, *args, **kwargs):
+        await asyncio.sleep(0)
+        super().close_room(*args, **kwargs)
+
+
+class TestTransport(unittest.TestCase):
+    def test_server(self):
+        server = RecordingServer()
+        transport = ServerTransport(server)
+        transport.enter_room('a', 'game_0')
+        transport.emit('update_game', {'version': 1}, to='game_0', skip_sid=['b'])
+        transport.leave_room('a', 'game_0')
+        transport.close_room('game_0')
+        self.assertEqual(server.calls, [
+            ('enter_room', 'a', 'game_0', '/'),
+            ('emit', 'update_game', {'version': 1}, 'game_0', ['b'], '/'),
+            ('leave_room', 'a', 'game_0', '/'),
+            ('close_room', 'game_0', '/'),
+        ])
+
+    def test_async_order(self):
+        server = AsyncRecordingServer()
+        transport = AsyncTransport(server)
+
+        async def run():
+            transport.start()
+            for i in range(20):
+                transport.emit('update_game', {'version': i}, to='a')
+                transport.enter_room('a', f'room_{i}')
+            transport.close_room('room_0')
+            await transport.join()
+
+        asyncio.run(run())
+        expected = []
+        for i in range(20):
+            expected.append(('emit', 'update_game', {'version': i}, 'a', None, '/'))
+            expected.append(('enter_room', 'a', f'room_{i}', '/'))
+        expected.append(('close_room', 'room_0', '/'))
+        self.assertEqual(server.calls, expected)
+
+    def test_async_from_thread(self):
+        server = AsyncRecordingServer()
+        transport = AsyncTransport(server)
+
+        async def run():
+            transport.start()
+            thread = threading.Thread(target=lambda: [
+                transport.emit('redirect', {'n': i}, to='game_0') for i in range(10)
+            ])
+            thread.start()
+            await asyncio.to_thread(thread.join)
+            await transport.join()
+
+        asyncio.run(run())
+        self.assertEqual([c[2]['n'] for c in server.calls], list(range(10)))
+
+    def test_async_not_started(self):
+        transport = AsyncTransport(AsyncRecordingServer())
+        with self.assertRaises(RuntimeError):
+            transport.emit('update_game', {}, to='a')
+
+
+if __name__ == '__main__':
+    unittest.main()
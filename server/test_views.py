@@ -0,0 +1,69 @@
+from game import Game, Team
+from test_game import generate_test_cards
+from views import ViewCache, game_info
+
+import unittest
+
+class TestViews(unittest.TestCase):
+    def setUp(self):
+        self.game = Game(0)
+        self.game.join_game('a', 'Daniel')
+        self.game.join_game('b', 'Kafka')
+        self.game.join_team('a', 'blue', True)
+        self.game.join_team('b', 'blue', False)
+
+    def test_player_ids(self):
+        teams = game_info(self.game)['teams']
+        self.assertEqual(teams['blue']['spymaster'], {'id': 0, 'name': 'Daniel'})
+        self.assertEqual(teams['blue']['agents'], [{'id': 1, 'name': 'Kafka'}])
+
+        self.game.leave_game('a')
+        self.game.join_game('a', 'Daniel')
+        self.assertEqual(self.game.client_to_id['a'], 2)
+
+    def test_cache_by_version(self):
+        cache = ViewCache()
+        prev, curr = cache.update(self.game)
+        self.assertIsNone(prev)
+
+        prev, again = cache.update(self.game)
+        self.assertIs(prev, curr)
+        self.assertIs(again, curr)
+
+        self.game.join_team('b', 'red', False)
+        prev, curr = cache.update(self.game)
+        self.assertIs(prev, again)
+        self.assertEqual(curr.version, self.game.version)
+        self.assertEqual(curr.public['teams']['red']['agents'], [{'id': 1, 'name': 'Kafka'}])
+
+    def test_spymaster_view(self):
+        self.game.join_game('c', 'Alan')
+        self.game.join_game('d', 'Mario')
+        self.game.join_team('c', 'red', True)
+        self.game.join_team('d', 'red', False)
+        self.game.start_game(Team.BLUE, generate_test_cards(Team.BLUE))
+
+        _, views = ViewCache().update(self.game)
+        self.assertTrue(all(c['team'] is None for c in views.public['cards']))
+        self.assertTrue(all(c['team'] is not None for c in views.spymaster['cards']))
+
+
+    def test_image_info(self):
+        class Index:
+            def get(self, collection: str, asset: str):
+                return {'width': 4, 'height': 3, 'color': '#000000', 'placeholder': asset} if collection == 'test' else None
+
+        self.game.join_game('c', 'Alan')
+        self.game.join_game('d', 'Mario')
+        self.game.join_team('c', 'red', True)
+        self.game.join_team('d', 'red', False)
+        self.game.start_game(Team.BLUE, generate_test_cards(Team.BLUE))
+
+        cards = game_info(self.game, images=Index())['cards']
+        self.assertEqual(cards[0]['image']['placeholder'], self.game.cards[0].asset)
+        self.game.set_collection('other')
+        self.assertNotIn('image', game_info(self.game, images=Index())['cards'][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+from watch import InotifyWatcher, PollingWatcher
+
+import os
+import queue
+import tempfile
+import unittest
+
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.root = self.dir.name
+        os.mkdir(os.path.join(self.root, 'deck'))
+        self.changed = queue.Queue()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, *path: str):
+        with open(os.path.join(self.root, *path), 'w') as f:
+            f.write('image')
+
+    def wait_for(self, name: str):
+        # Slow writes may be reported in more than one batch
+        while self.changed.get(timeout=5) != name:
+            pass
+
+    def test_polling(self):
+        watcher = PollingWatcher(self.root, self.changed.put)
+        watcher.poll()
+        self.assertTrue(self.changed.empty())
+
+        # Directory mtimes may not change within the same tick
+        os.utime(os.path.join(self.root, 'deck'), ns=(0, 0))
+        os.mkdir(os.path.join(self.root, 'new'))
+        watcher.poll()
+        self.assertEqual([self.changed.get_nowait(), self.changed.get_nowait()], ['deck', 'new'])
+
+    def test_inotify(self):
+        try:
+            watcher = InotifyWatcher(self.root, self.changed.put, settle=0.05)
+        except OSError:
+            self.skipTest('inotify is not available')
+        watcher.start()
+        try:
+            self.write('deck', '0.jpg')
+            self.write('deck', '1.jpg')
+            self.wait_for('deck')
+
+            os.mkdir(os.path.join(self.root, 'new'))
+            self.write('new', '0.jpg')
+            self.wait_for('new')
+
+            os.remove(os.path.join(self.root, 'new', '0.jpg'))
+            os.rmdir(os.path.join(self.root, 'new'))
+            self.wait_for('new')
+        finally:
+            watcher.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
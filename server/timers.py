@@ -0,0 +1,85 @@
+from math import ceil
+
+
+class TimerWheel:
+    """Timers keyed by anything hashable, in a hierarchical timing wheel
+
+    Time is counted in ticks. Level 0 has a slot per tick, each level above
+    has slots as wide as the whole level below. A timer goes in the lowest
+    level that reaches its deadline, and moves down a level each time the
+    wheel turns past its slot of the level it is in, until it expires from
+    level 0. Scheduling, cancelling and expiring take constant time however
+    many timers are pending. Deadlines beyond the top level wait in it and
+    are placed again as it turns.
+
+    Not thread safe. Timers expire at most a tick late.
+    """
+    def __init__(self, tick: float = 1.0, slots: int = 64, levels: int = 4, now: float = 0.0):
+        self.tick = tick
+        self.slots = slots
+        self.levels: list[list[set]] = [[set() for _ in range(slots)] for _ in range(levels)]
+        # Ticks since 0, everything up to it has expired
+        self.current = int(now // tick)
+        # Deadline in ticks, level and slot of each timer
+        self.timers: dict[object: (int, int, int)] = {}
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def __contains__(self, key) -> bool:
+        return key in self.timers
+
+    def schedule(self, key, deadline: float):
+        """Expire key once advanced to deadline, replacing any timer it had"""
+        self.cancel(key)
+        self.place(key, max(ceil(deadline / self.tick), self.current + 1))
+
+    def cancel(self, key) -> bool:
+        timer = self.timers.pop(key, None)
+        if timer is None:
+            return False
+        _, level, slot = timer
+        self.levels[level][slot].discard(key)
+        return True
+
+    def deadline(self, key) -> float | None:
+        timer = self.timers.get(key)
+        return None if timer is None else timer[0] * self.tick
+
+    def place(self, key, due: int):
+        delta = due - self.current
+        span = self.slots
+        level = 0
+        while delta >= span and level < len(self.levels) - 1:
+            span *= self.slots
+            level += 1
+        # Beyond the top level, wait for the last slot it reaches
+        at = min(due, self.current + span - 1)
+        slot = at // (span // self.slots) % self.slots
+        self.levels[level][slot].add(key)
+        self.timers[key] = (due, level, slot)
+
+    def advance(self, now: float) -> list:
+        """Turn the wheel to now, returning the keys of the expired timers"""
+        expired = []
+        target = int(now // self.tick)
+        while self.current < target:
+            self.current += 1
+            # Move timers down from the levels whose slot just changed
+            for level in range(len(self.levels) - 1, 0, -1):
+                width = self.slots ** level
+                if self.current % width == 0:
+                    slot = self.current // width % self.slots
+                    keys = self.levels[level][slot]
+                    self.levels[level][slot] = set()
+                    for key in keys:
+                        due, _, _ = self.timers.pop(key)
+                        self.place(key, max(due, self.current))
+
+            slot = self.current % self.slots
+            keys = self.levels[0][slot]
+            self.levels[0][slot] = set()
+            for key in keys:
+                del self.timers[key]
+                expired.append(key)
+        return expired
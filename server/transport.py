@@ -0,0 +1,93 @@
+import asyncio
+
+
+class ServerTransport:
+    """Sends Cafe's messages through a socketio.Server
+
+    Cafe always names the client or room a message is for, so the same
+    handlers run under any server that can emit and keep track of rooms.
+    """
+    def __init__(self, server, namespace: str = '/'):
+        self.server = server
+        self.namespace = namespace
+
+    def emit(self, event: str, data, to: str, skip_sid: list[str] = None):
+        self.server.emit(event, data, to=to, skip_sid=skip_sid, namespace=self.namespace)
+
+    def enter_room(self, sid: str, room: str):
+        self.server.enter_room(sid, room, namespace=self.namespace)
+
+    def leave_room(self, sid: str, room: str):
+        self.server.leave_room(sid, room, namespace=self.namespace)
+
+    def close_room(self, room: str):
+        self.server.close_room(room, namespace=self.namespace)
+
+
+class AsyncTransport:
+    """Sends Cafe's messages through a socketio.AsyncServer
+
+    Cafe's handlers are plain functions, run on the event loop or from other
+    threads such as migrations. Calls are queued and a task on the loop
+    awaits them one at a time, so messages go out in the order they were
+    sent and room changes apply before the messages following them.
+
+    Sending starts with start(), called on the loop before any handler
+    runs, since threads have no loop of their own to find it by.
+    """
+    def __init__(self, server, namespace: str = '/'):
+        self.server = server
+        self.namespace = namespace
+        self.loop = None
+        self.queue = None
+        self.task = None
+
+    def start(self):
+        if self.loop is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.task = self.loop.create_task(self._send())
+
+    async def join(self):
+        """Wait until everything queued so far has been sent"""
+        await self.queue.join()
+
+    def emit(self, event: str, data, to: str, skip_sid: list[str] = None):
+        self._put(self.server.emit, event, data, to=to, skip_sid=skip_sid, namespace=self.namespace)
+
+    def enter_room(self, sid: str, room: str):
+        self._put(self.server.enter_room, sid, room, namespace=self.namespace)
+
+    def leave_room(self, sid: str, room: str):
+        self._put(self.server.leave_room, sid, room, namespace=self.namespace)
+
+    def close_room(self, room: str):
+        self._put(self.server.close_room, room, namespace=self.namespace)
+
+    def _put(self, func, *args, **kwargs):
+        if self.loop is None:
+            raise RuntimeError('AsyncTransport used before start()')
+
+        call = (func, args, kwargs)
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+
+        if on_loop:
+            self.queue.put_nowait(call)
+        else:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, call)
+
+    async def _send(self):
+        while True:
+            func, args, kwargs = await self.queue.get()
+            try:
+                result = func(*args, **kwargs)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                print(f'Failed to send {func.__name__}{args}: {e!r}')
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,205 @@
+from game import (
+    AgentTurn,
+    Card,
+    Game,
+    History,
+    Matchmaking,
+    Team,
+    Win,
+)
+
+from dataclasses import dataclass
+
+
+def lobby_info(game: Game):
+    return {
+        'game_id': game.game_id,
+        'players': game.num_players(),
+        'state': 'waiting' if game.play_state == Matchmaking() else 'playing'
+    }
+
+
+def player_info(player: str, game: Game):
+    return {
+        'id': game.client_to_id[player],
+        'name': game.client_to_name[player]
+    }
+
+
+def team_info(team: Team, game: Game):
+    data = game.teams[team]
+    agents = [player_info(a, game) for a in data.members if a != data.spymaster]
+    spymaster = player_info(data.spymaster, game) if data.spymaster else None
+    cards_left = '-'
+    if len(game.cards) > 0:
+        cards_left = game.cards_left(team)
+
+    return {
+        'agents': agents,
+        'spymaster': spymaster,
+        'cards_left': cards_left
+    }
+
+
+def all_team_info(game: Game):
+    return {
+        'blue': team_info(Team.BLUE, game),
+        'red': team_info(Team.RED, game)
+    }
+
+
+def card_info(card: Card, hide: bool, renditions: dict = None, image: dict = None):
+    info = {
+        'team': None if hide and card.hidden else card.team,
+        'asset': card.asset,
+        'hidden': card.hidden
+    }
+    if renditions is not None:
+        info['renditions'] = renditions
+    if image is not None:
+        info['image'] = image
+    return info
+
+
+def spymaster_card_info(game: Game):
+    return {
+        'cards': [card_info(c, False) for c in game.cards]
+    }
+
+
+def vote_info(game: Game):
+    match game.play_state:
+        case AgentTurn(_, action):
+            votes = {}
+            for i, voters in action.votes.items():
+                players = [game.client_to_name[c] for c in voters]
+                players.sort()
+                votes[i] = players
+            return votes
+        case _:
+            return {}
+
+
+def hint_info(game: Game):
+    match game.play_state:
+        case AgentTurn(_, action):
+            hints = {
+                'hint': action.hint,
+                'count': action.count
+            }
+            return hints
+        case _:
+            return {}
+
+
+def win_info(game: Game):
+    match game.play_state:
+        case Win(team):
+            return team
+        case _:
+            return None
+
+
+def history_info(entries: list[History]):
+    history = []
+    for entry in entries:
+        history.append({
+            'seq': entry.seq,
+            'player_name': entry.player_name,
+            'player_team': entry.player_team,
+            'description': entry.description,
+            'action': entry.action,
+            'action_team': entry.action_team
+        })
+    return history
+
+
+def atlas_info(atlas: dict | None):
+    """Where each card is in the game's atlas, by card
+
+    None without an atlas, not ready while it is composed.
+    """
+    if atlas is None:
+        return None
+    info = atlas['info']
+    if info is None:
+        return {'ready': False}
+    return {
+        'ready': True,
+        'files': info['files'],
+        'width': info['width'],
+        'height': info['height'],
+        'cells': [info['cells'][h] for h in atlas['hashes']]
+    }
+
+
+def game_info(game: Game, renditions=None, images=None, atlas: dict = None):
+    """The public view of a game
+
+    With renditions, cards list the resized copies of their image too. With
+    an ImageIndex as images, they carry the image's dimensions, color and
+    placeholder, so clients can lay out the board before images load. atlas
+    is the state of the game's atlas kept by Cafe.
+    """
+    collection = game.card_collection
+    cards = []
+    for c in game.cards:
+        rendition = None if renditions is None else renditions.get(collection, c.asset)
+        image = None if images is None else images.get(collection, c.asset)
+        cards.append(card_info(c, True, rendition, image))
+
+    return {
+        'id': game.game_id,
+        'play_state': str(game.play_state),
+        'teams': all_team_info(game),
+        'cards': cards,
+        'collection': game.card_collection,
+        'votes': vote_info(game),
+        'atlas': atlas_info(atlas),
+        'hint': hint_info(game),
+        'winner': win_info(game),
+        'history_start': game.history_start
+    }
+
+
+@dataclass
+class GameViews:
+    """Everything a game looks like to each audience at one version
+
+    History is not part of the views, it is streamed separately from
+    history_end, the sequence number of the next entry at this version.
+    """
+    version: int
+    public: dict
+    spymaster: dict
+    history_end: int
+
+
+class ViewCache:
+    """Builds each audience's view of a game at most once per version
+
+    Views are shared between clients, so nothing client-specific may be put
+    in them. The previous views are kept as the base for patches.
+    """
+    def __init__(self, renditions=None, images=None, atlases: dict[int: dict] = None):
+        self.renditions = renditions
+        self.images = images
+        self.atlases = {} if atlases is None else atlases
+        self.latest: dict[int: GameViews] = {}
+
+    def update(self, game: Game) -> (GameViews, GameViews):
+        """Returns the views at the last update and the current views
+
+        The previous views are None the first time a game is seen. If the
+        game has not changed both are the same object.
+        """
+        prev = self.latest.get(game.game_id)
+        if prev is not None and prev.version == game.version:
+            return prev, prev
+
+        curr = GameViews(game.version, game_info(game, self.renditions, self.images, self.atlases.get(game.game_id)), spymaster_card_info(game), game.history_end())
+        self.latest[game.game_id] = curr
+        return prev, curr
+
+    def discard(self, game_id: int):
+        self.latest.pop(game_id, None)
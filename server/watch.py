@@ -0,0 +1,193 @@
+"""Watch card collections for changes
+
+A watcher calls back with the name of each collection under root whose
+images changed, once the changes settle. Collections created or removed
+under root are reported too. make_watcher() uses inotify on Linux and polls
+elsewhere, or when inotify is unavailable.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+# Collections appearing and disappearing under root
+ROOT_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+# Images being written, moved or deleted in a collection. Files are reported
+# once closed, not as they are created.
+COLLECTION_MASK = IN_CLOSE_WRITE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+EVENT = struct.Struct('iIII')
+
+
+def report(callback, name: str):
+    try:
+        callback(name)
+    except Exception as e:
+        print(f'Failed to update collection {name}: {e!r}')
+
+
+class InotifyWatcher:
+    """Watches root and each collection in it with inotify
+
+    Raises OSError when inotify is not available.
+    """
+    def __init__(self, root: str, callback, settle: float = 0.5):
+        self.root = root
+        self.callback = callback
+        self.settle = settle
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        try:
+            self.root_wd = self.add_watch(root, ROOT_MASK)
+        except OSError:
+            os.close(self.fd)
+            raise
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        self.collections: dict[int: str] = {}
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def watch_collection(self, name: str) -> bool:
+        try:
+            wd = self.add_watch(os.path.join(self.root, name), COLLECTION_MASK)
+        except OSError:
+            # Removed again already, or not a directory
+            return False
+        self.collections[wd] = name
+        return True
+
+    def start(self):
+        for f in os.scandir(self.root):
+            if f.is_dir():
+                self.watch_collection(f.name)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        os.write(self.wakeup_w, b'x')
+
+    def _run(self):
+        try:
+            self._watch()
+        finally:
+            os.close(self.fd)
+            os.close(self.wakeup_r)
+            os.close(self.wakeup_w)
+
+    def _watch(self):
+        changed = set()
+        while True:
+            # Wait for the changes to settle before reporting them
+            timeout = self.settle if len(changed) > 0 else None
+            readable, _, _ = select.select([self.fd, self.wakeup_r], [], [], timeout)
+            if self.wakeup_r in readable:
+                return
+            elif len(readable) == 0:
+                for name in sorted(changed):
+                    report(self.callback, name)
+                changed.clear()
+                continue
+            changed |= self.read_events()
+
+    def read_events(self) -> set[str]:
+        changed = set()
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(errors='surrogateescape')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, every collection may have changed
+                changed |= set(self.collections.values())
+                changed |= {f.name for f in os.scandir(self.root) if f.is_dir()}
+            elif wd == self.root_wd:
+                if not mask & IN_ISDIR:
+                    continue
+                # A new collection may be filled before it is watched, it is
+                # scanned when reported either way
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.watch_collection(name)
+                changed.add(name)
+            elif wd in self.collections:
+                changed.add(self.collections[wd])
+                if mask & IN_IGNORED:
+                    del self.collections[wd]
+        return changed
+
+
+class PollingWatcher:
+    """Compares the mtime of root and each collection every interval seconds
+
+    Directory mtimes change as images are added, removed or renamed, but
+    not when an image is overwritten in place.
+    """
+    def __init__(self, root: str, callback, interval: float = 2.0):
+        self.root = root
+        self.callback = callback
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.mtimes = self.scan()
+
+    def scan(self) -> dict[str: int]:
+        mtimes = {}
+        try:
+            for f in os.scandir(self.root):
+                if f.is_dir():
+                    mtimes[f.name] = f.stat().st_mtime_ns
+        except FileNotFoundError:
+            pass
+        return mtimes
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.poll()
+
+    def poll(self):
+        mtimes = self.scan()
+        changed = {n for n in mtimes.keys() | self.mtimes.keys() if mtimes.get(n) != self.mtimes.get(n)}
+        self.mtimes = mtimes
+        for name in sorted(changed):
+            report(self.callback, name)
+
+
+def make_watcher(root: str, callback):
+    """An inotify watcher where possible, a polling one otherwise"""
+    try:
+        return InotifyWatcher(root, callback)
+    except (OSError, AttributeError) as e:
+        print(f'Polling {root} for changes, inotify is not available: {e}')
+        return PollingWatcher(root, callback)